@@ -0,0 +1,106 @@
+from datetime import date, timedelta
+from typing import Dict, Optional, Tuple
+
+from bson.int64 import Int64
+
+# Active days are stored in user_stats as a sparse map of 64-bit words:
+#   activity_bits: {"<word index>": Int64, ...}
+# where bit (day % 64) of word (day // 64) is set when the user completed a
+# task on that day. One year is ~6 words (46 bytes of payload) and marking a
+# day is a single atomic $bit update, so no read-modify-write is needed.
+# Other storage backends keep the same words keyed by (user_id, index).
+ACTIVITY_FIELD = 'activity_bits'
+WORD_BITS = 64
+WORD_MASK = (1 << WORD_BITS) - 1
+EPOCH = date(1970, 1, 1)
+
+
+def day_number(day: date) -> int:
+    """Days since 1970-01-01 for a calendar date"""
+    return (day - EPOCH).days
+
+
+def day_from_number(number: int) -> date:
+    """Inverse of day_number"""
+    return EPOCH + timedelta(days=number)
+
+
+def day_word(day: date) -> Tuple[int, int]:
+    """Word index and signed 64-bit mask of the bit that marks a day"""
+    number = day_number(day)
+    mask = 1 << (number % WORD_BITS)
+    # Stored longs are signed, so bit 63 has to be sent as a negative value
+    if mask >= 1 << (WORD_BITS - 1):
+        mask -= 1 << WORD_BITS
+    return number // WORD_BITS, mask
+
+
+def mark_day_update(day: date) -> Dict:
+    """Build the $bit operand that marks a day as active"""
+    index, mask = day_word(day)
+    return {f'{ACTIVITY_FIELD}.{index}': {'or': Int64(mask)}}
+
+
+def load_bitset(words: Optional[Dict]) -> Tuple[int, int]:
+    """
+    Assemble stored words ({word index: value}) into one integer.
+
+    Returns (base_day, bits) where bit i of bits is day base_day + i.
+    """
+    if not words:
+        return 0, 0
+
+    indexes = {int(key): value for key, value in words.items()}
+    base_word = min(indexes)
+    bits = 0
+    for index, value in indexes.items():
+        bits |= (value & WORD_MASK) << ((index - base_word) * WORD_BITS)
+    return base_word * WORD_BITS, bits
+
+
+def _window(base_day: int, bits: int, start_day: int, days: int) -> int:
+    """Slice days [start_day, start_day + days) out of the bitset"""
+    offset = start_day - base_day
+    shifted = bits >> offset if offset >= 0 else bits << -offset
+    return shifted & ((1 << days) - 1)
+
+
+def current_streak(base_day: int, bits: int, today: date) -> int:
+    """Consecutive active days ending today, or yesterday if today is still open"""
+    position = day_number(today) - base_day
+    if position < 0 or not bits:
+        return 0
+    if not (bits >> position) & 1:
+        position -= 1
+        if position < 0 or not (bits >> position) & 1:
+            return 0
+
+    # The highest clear bit at or below position ends the run
+    gaps = ~bits & ((1 << (position + 1)) - 1)
+    return position + 1 if not gaps else position - (gaps.bit_length() - 1)
+
+
+def longest_streak(bits: int) -> int:
+    """Longest run of set bits; each pass shortens every run by one"""
+    length = 0
+    while bits:
+        bits &= bits >> 1
+        length += 1
+    return length
+
+
+def build_calendar(words: Optional[Dict], today: date, days: int = 365) -> Dict:
+    """Heatmap plus streak figures for the `days` days ending today"""
+    base_day, bits = load_bitset(words)
+    start_day = day_number(today) - days + 1
+    window = _window(base_day, bits, start_day, days)
+
+    return {
+        'start_date': day_from_number(start_day).strftime('%Y-%m-%d'),
+        'end_date': today.strftime('%Y-%m-%d'),
+        # One character per day, oldest first: '1' = at least one task completed
+        'days': format(window, f'0{days}b')[::-1],
+        'active_days': bin(window).count('1'),
+        'current_streak': current_streak(base_day, bits, today),
+        'longest_streak': longest_streak(bits)
+    }
@@ -1,97 +1,293 @@
+import httpx
 import openai
 from config import Config
 import json
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
+from metrics import metrics
+from llm_cache import LLMCache, cache_key
+from llm_client import create_llm_client
+from micro_steps import parse_steps
+from model_router import ModelRouter
+from singleflight import SingleFlight
 
 class AIService:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=Config.OPENAI_API_KEY)
+    def __init__(self, client: Optional[openai.OpenAI] = None, router: Optional[ModelRouter] = None,
+                 cache: Optional[LLMCache] = None):
+        self.client = client or create_llm_client()
+        self.router = router or ModelRouter(
+            Config.AI_MODEL_TIERS,
+            Config.AI_ROUTES,
+            window=Config.AI_ROUTING_WINDOW,
+            error_threshold=Config.AI_ROUTING_ERROR_THRESHOLD,
+            cooldown_seconds=Config.AI_ROUTING_COOLDOWN_SECONDS
+        )
+        if cache is None and Config.LLM_CACHE_ENABLED:
+            cache = LLMCache(
+                Config.LLM_CACHE_PATH,
+                max_bytes=Config.LLM_CACHE_MAX_BYTES,
+                ttl_seconds=Config.LLM_CACHE_TTL_HOURS * 3600
+            )
+        self.cache = cache
+        self._clients = {}
+        self._flights = SingleFlight()
+        metrics.register('ai_coalescing', self._flights.stats)
+        metrics.register('ai_routing', self.router.stats)
+    
+    def _client_for(self, timeout: float, retries: int, read_timeout: Optional[float] = None) -> openai.OpenAI:
+        """Copy of the client with a per-model timeout, sharing its connection pool"""
+        key = (timeout, retries, read_timeout)
+        if key not in self._clients:
+            if read_timeout is not None:
+                timeout = httpx.Timeout(timeout, read=read_timeout)
+            self._clients[key] = self.client.with_options(timeout=timeout, max_retries=retries)
+        return self._clients[key]
+    
+    def _cached(self, task: str, messages: List[Dict], max_tokens: int, temperature: float) -> Optional[str]:
+        """A fresh cached response to these messages from any of the task's models"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get([
+            cache_key(candidate['model'], messages, max_tokens, temperature)
+            for candidate in self.router.routes[task]['models']
+        ])
+        # Empty entries stored before they were refused count as misses
+        return cached or None
+    
+    def _complete(self, task: str, messages: List[Dict], max_tokens: int, temperature: float) -> str:
+        """
+        Run a chat completion on the model the router picks for this task
+        type, falling through to the next candidate on errors or timeouts.
+        A cached response from any of the task's models is used first, and
+        concurrent identical requests share one upstream call.
+        """
+        key = json.dumps([task, messages, max_tokens, temperature], sort_keys=True)
+        
+        def call():
+            cached = self._cached(task, messages, max_tokens, temperature)
+            if cached is not None:
+                return cached
+            
+            candidates = self.router.candidates(task)
+            for attempt, (model, timeout) in enumerate(candidates):
+                last = attempt == len(candidates) - 1
+                started = time.monotonic()
+                try:
+                    # Fail over to the next model instead of retrying a slow one
+                    response = self._client_for(timeout, 2 if last else 0).chat.completions.create(
+                        model=model,
+                        messages=messages,
+                        max_tokens=max_tokens,
+                        temperature=temperature
+                    )
+                except Exception as e:
+                    self.router.record(task, model, time.monotonic() - started, ok=False)
+                    if last:
+                        raise
+                    print(f"{task} completion on {model} failed, trying next model: {e}")
+                    continue
+                self.router.record(task, model, time.monotonic() - started, ok=True, fallback=attempt > 0)
+                content = response.choices[0].message.content.strip()
+                if self.cache is not None and content:
+                    self.cache.put(cache_key(model, messages, max_tokens, temperature), content)
+                return content
+        
+        return self._flights.do(key, call)
+    
+    def _stream(self, task: str, messages: List[Dict], max_tokens: int, temperature: float,
+                stall_timeout: float) -> Iterator[str]:
+        """
+        Stream a chat completion as text deltas. Fails over to the next
+        model only until a stream opens; after that, a gap between chunks
+        longer than stall_timeout raises. A cached response is sent as a
+        single delta, and only non-empty text from streams that reached
+        their finish_reason is cached.
+        """
+        cached = self._cached(task, messages, max_tokens, temperature)
+        if cached is not None:
+            yield cached
+            return
+        
+        candidates = self.router.candidates(task)
+        for attempt, (model, timeout) in enumerate(candidates):
+            started = time.monotonic()
+            try:
+                stream = self._client_for(timeout, 0, stall_timeout).chat.completions.create(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    stream=True
+                )
+            except Exception as e:
+                self.router.record(task, model, time.monotonic() - started, ok=False)
+                if attempt == len(candidates) - 1:
+                    raise
+                print(f"{task} stream on {model} failed, trying next model: {e}")
+                continue
+            
+            parts = []
+            finished = False
+            try:
+                for chunk in stream:
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+                    if chunk.choices[0].finish_reason:
+                        finished = True
+            except Exception:
+                self.router.record(task, model, time.monotonic() - started, ok=False)
+                raise
+            finally:
+                # Also releases the connection when the reader stops early
+                stream.response.close()
+            self.router.record(task, model, time.monotonic() - started, ok=True, fallback=attempt > 0)
+            text = ''.join(parts).strip()
+            # A stream that ends without a finish_reason was cut off
+            if self.cache is not None and finished and text:
+                self.cache.put(cache_key(model, messages, max_tokens, temperature), text)
+            return
     
     def generate_micro_nudge(self, user_context: Dict) -> str:
         """
         Generate a personalized micro-nudge based on user context
         """
-        prompt = self._build_nudge_prompt(user_context)
-        
         try:
-            response = self.client.chat.completions.create(
-                model=Config.AI_MODEL,
-                messages=[
-                    {
-                        "role": "system", 
-                        "content": "You are a supportive AI coach that helps people stay focused and motivated. You provide gentle, encouraging nudges to help users take small steps toward their goals. Keep responses under 100 words and make them feel personal and conversational."
-                    },
-                    {
-                        "role": "user", 
-                        "content": prompt
-                    }
-                ],
-                max_tokens=Config.MAX_TOKENS,
-                temperature=Config.TEMPERATURE
-            )
-            
-            return response.choices[0].message.content.strip()
+            return self.request_micro_nudge(user_context)
         except Exception as e:
             return f"Hey there! Ready to tackle your next micro-step? You've got this! 💪"
     
+    def request_micro_nudge(self, user_context: Dict) -> str:
+        """Like generate_micro_nudge, but raises when every model fails so callers can pick their own fallback"""
+        return self._complete(
+            'nudge',
+            self._nudge_messages(user_context),
+            max_tokens=Config.MAX_TOKENS,
+            temperature=Config.TEMPERATURE
+        )
+    
+    def stream_micro_nudge(self, user_context: Dict, stall_timeout: float) -> Iterator[str]:
+        """
+        Stream a micro-nudge as it is generated. Unlike generate_micro_nudge
+        this raises on failure or stall, since text already sent can't be
+        swapped for the template here.
+        """
+        return self._stream(
+            'nudge',
+            self._nudge_messages(user_context),
+            max_tokens=Config.MAX_TOKENS,
+            temperature=Config.TEMPERATURE,
+            stall_timeout=stall_timeout
+        )
+    
     def generate_daily_digest(self, user_data: Dict) -> str:
         """
         Generate a personalized daily digest story
         """
-        prompt = self._build_digest_prompt(user_data)
-        
         try:
-            response = self.client.chat.completions.create(
-                model=Config.AI_MODEL,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": "You are a friendly AI that creates engaging daily digest stories. Write a short, encouraging narrative about the user's day, highlighting their achievements and progress. Make it feel like a personal journal entry that celebrates their wins."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                max_tokens=300,
-                temperature=0.8
-            )
-            
-            return response.choices[0].message.content.strip()
+            return self.request_daily_digest(user_data)
         except Exception as e:
             return "Today was another step forward in your journey! Every small action counts. Keep going! 🌟"
     
+    def request_daily_digest(self, user_data: Dict) -> str:
+        """Like generate_daily_digest, but raises when every model fails"""
+        return self._complete(
+            'digest',
+            [
+                {
+                    "role": "system",
+                    "content": "You are a friendly AI that creates engaging daily digest stories. Write a short, encouraging narrative about the user's day, highlighting their achievements and progress. Make it feel like a personal journal entry that celebrates their wins."
+                },
+                {
+                    "role": "user",
+                    "content": self._build_digest_prompt(user_data)
+                }
+            ],
+            max_tokens=300,
+            temperature=0.8
+        )
+    
     def generate_celebration_message(self, achievement: str, streak_count: int) -> str:
         """
         Generate a celebration message for achievements
         """
+        try:
+            return self.request_celebration_message(achievement, streak_count)
+        except Exception as e:
+            return f"🎉 Amazing work! You're on fire with that {streak_count}-day streak! Keep it up! 🔥"
+    
+    def request_celebration_message(self, achievement: str, streak_count: int) -> str:
+        """Like generate_celebration_message, but raises when every model fails"""
         prompt = f"Generate a short, enthusiastic celebration message for someone who just achieved: {achievement}. They have a {streak_count}-day streak. Make it feel exciting and motivating!"
         
+        return self._complete(
+            'celebration',
+            [
+                {
+                    "role": "system",
+                    "content": "You are an enthusiastic AI coach that celebrates user achievements. Create short, exciting celebration messages with emojis that make users feel proud and motivated to continue."
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            max_tokens=100,
+            temperature=0.9
+        )
+    
+    def _nudge_messages(self, user_context: Dict) -> List[Dict]:
+        """Chat messages for a micro-nudge"""
+        return [
+            {
+                "role": "system", 
+                "content": "You are a supportive AI coach that helps people stay focused and motivated. You provide gentle, encouraging nudges to help users take small steps toward their goals. Keep responses under 100 words and make them feel personal and conversational."
+            },
+            {
+                "role": "user", 
+                "content": self._build_nudge_prompt(user_context)
+            }
+        ]
+    
+    def generate_micro_steps(self, title: str, description: str = '') -> List[str]:
+        """
+        Break a task into a few small, concrete steps. Returns an empty list
+        when the AI is unavailable.
+        """
+        prompt = f"""
+        Task: {title}
+        Details: {description or 'None'}
+        
+        Break this task into 3 to 5 tiny, concrete steps that each take a few minutes. Put each step on its own line, without extra commentary.
+        """
+        
         try:
-            response = self.client.chat.completions.create(
-                model=Config.AI_MODEL,
-                messages=[
+            return parse_steps(self._complete(
+                'micro_steps',
+                [
                     {
                         "role": "system",
-                        "content": "You are an enthusiastic AI coach that celebrates user achievements. Create short, exciting celebration messages with emojis that make users feel proud and motivated to continue."
+                        "content": "You are a productivity coach who breaks tasks into small, easy first steps that make starting effortless."
                     },
                     {
                         "role": "user",
                         "content": prompt
                     }
                 ],
-                max_tokens=100,
-                temperature=0.9
-            )
-            
-            return response.choices[0].message.content.strip()
+                max_tokens=150,
+                temperature=0.3
+            ))
         except Exception as e:
-            return f"🎉 Amazing work! You're on fire with that {streak_count}-day streak! Keep it up! 🔥"
+            return []
     
     def _build_nudge_prompt(self, context: Dict) -> str:
         """Build context-aware prompt for nudges"""
-        current_time = datetime.now().strftime("%H:%M")
+        # Hour resolution, so the same context makes the same prompt (and cache key) all hour
+        current_time = datetime.now().strftime("%H:00")
         day_of_week = datetime.now().strftime("%A")
         
         prompt = f"""
@@ -137,9 +333,9 @@ class AIService:
         """
         
         try:
-            response = self.client.chat.completions.create(
-                model=Config.AI_MODEL,
-                messages=[
+            mood = self._complete(
+                'mood',
+                [
                     {
                         "role": "system",
                         "content": "You are a mood analyzer. Respond with only one word: positive, negative, or neutral."
@@ -151,9 +347,7 @@ class AIService:
                 ],
                 max_tokens=10,
                 temperature=0.1
-            )
-            
-            mood = response.choices[0].message.content.strip().lower()
+            ).lower()
             return mood if mood in ['positive', 'negative', 'neutral'] else 'neutral'
         except Exception as e:
             return 'neutral'
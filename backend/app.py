@@ -1,133 +1,183 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, has_request_context
 from flask_cors import CORS
-from flask_pymongo import PyMongo
-from datetime import datetime, timedelta
+import click
+from datetime import date, datetime, timedelta
 import uuid
 import os
-import openai
+import threading
+import time
 from config import Config
+from activity_calendar import build_calendar, day_from_number, day_number
+from leaderboard import Leaderboard, BOARDS
+from metrics import metrics
+from rate_limit import AIRateLimiter
+from llm_client import create_llm_client
+from warmup import WarmupState, warm_up
+from repository import create_repository
+from json_provider import FastJSONProvider
+from compression import init_compression
+from events import EventBroker, format_event
+from background import BackgroundRunner
+from static_assets import init_static_assets
+from ai_service import AIService
+from nudge_scheduler import NudgeScheduler, EventSink
+from micro_steps import micro_steps_key
+from timezones import TimezoneCache, local_today, local_midnight_utc, resolve_timezone
+from task_schema import SchemaMigrator
+from transfer import export_user, gzip_chunks, import_user, open_lines
+from recurrence import next_occurrence, occurs_on, parse_rule
+from search_index import SearchIndex
+from digests import DigestJob, digest_inputs, fingerprint
 
-app = Flask(__name__)
+# The default /static route would shadow the frontend build's static/ files
+app = Flask(__name__, static_folder=None)
 app.config.from_object(Config)
+app.json = FastJSONProvider(app)
 
 # Initialize extensions
-CORS(app)
-mongo = PyMongo(app)
+# Cache preflight responses for clients still calling from another origin
+CORS(app, max_age=Config.CORS_MAX_AGE)
+init_compression(app, Config.COMPRESS_MIN_BYTES, Config.COMPRESS_LEVEL)
+repository = create_repository(app, Config)
 
-# Initialize OpenAI with your API key
-openai.api_key = Config.OPENAI_API_KEY
+# Shared OpenAI client with a pooled keep-alive HTTP session
+llm_client = create_llm_client()
+ai_service = AIService(llm_client)
 
 # Default user ID for single-user app
 DEFAULT_USER_ID = "default_user_123"
 
+# Days are the user's local calendar days; timezones are re-read once a minute
+timezones = TimezoneCache(Config.DEFAULT_TIMEZONE)
+
+def user_zone(user_id=DEFAULT_USER_ID):
+    return timezones.get(user_id, repository.user_timezone)
+
+def user_today(user_id=DEFAULT_USER_ID):
+    """The user's local date, computed once per request"""
+    if not has_request_context():
+        return local_today(user_zone(user_id))
+    days = g.setdefault('user_today', {})
+    if user_id not in days:
+        days[user_id] = local_today(user_zone(user_id))
+    return days[user_id]
+
+def user_day(user_id=DEFAULT_USER_ID):
+    """Day number of the user's local date, the key tasks are stored under"""
+    return day_number(user_today(user_id))
+
+# Rankings are built from user_stats at startup and refreshed periodically
+leaderboard = Leaderboard()
+
+# Task and stats changes pushed to open /api/events streams
+event_broker = EventBroker(Config.EVENTS_SOCKET_DIR, Config.EVENTS_MAX_PENDING)
+
+# Deferred AI work (e.g. dashboard nudges) runs off the request path
+background = BackgroundRunner(Config.BACKGROUND_WORKERS)
+
+# Rewrites tasks stored in the old schema, a throttled batch at a time
+schema_migrator = SchemaMigrator(
+    repository,
+    Config.TASK_SCHEMA_MIGRATION_BATCH_SIZE,
+    Config.TASK_SCHEMA_MIGRATION_PAUSE_SECONDS
+)
+
+# Word search over past tasks, indexed in memory per user
+search_index = SearchIndex(
+    repository,
+    Config.SEARCH_INDEX_MAX_USERS,
+    Config.SEARCH_INDEX_REFRESH_SECONDS,
+    Config.TRANSFER_BATCH_SIZE
+)
+
+warmup_state = WarmupState()
+_worker_lock = threading.Lock()
+_worker_initialized = False
+
+def init_worker():
+    """
+    Per-process startup: prime the Mongo pool and LLM sessions, then start
+    background jobs. Called from gunicorn's post_fork hook so a worker only
+    takes traffic once warm; other servers run it on the first request.
+    """
+    global _worker_initialized
+    with _worker_lock:
+        if _worker_initialized:
+            return
+        _worker_initialized = True
+    
+    warm_up(warmup_state, repository, llm_client, Config)
+    leaderboard.start_refresh(repository.all_stats, Config.LEADERBOARD_REFRESH_SECONDS)
+    event_broker.start_relay()
+    if Config.NUDGE_SCHEDULER_ENABLED:
+        nudge_scheduler.start()
+    if Config.TASK_SCHEMA_MIGRATION_ENABLED:
+        schema_migrator.start()
+
+@app.before_request
+def ensure_worker_initialized():
+    if not _worker_initialized:
+        init_worker()
+
+# Throttle the routes that trigger paid LLM calls
+ai_limiter = AIRateLimiter(
+    Config.AI_USER_RATE_PER_MINUTE,
+    Config.AI_USER_BURST,
+    Config.AI_GLOBAL_RATE_PER_MINUTE,
+    Config.AI_GLOBAL_BURST,
+    global_path=Config.AI_GLOBAL_BUCKET_PATH,
+    background_rate_per_minute=Config.AI_BACKGROUND_RATE_PER_MINUTE,
+    background_burst=Config.AI_BACKGROUND_BURST,
+    background_reserve=Config.AI_BACKGROUND_GLOBAL_RESERVE
+)
+metrics.register('ai_rate_limit', ai_limiter.stats)
+
+def fallback_nudge():
+    """Template nudge used when the AI is unavailable or throttled"""
+    fallback_messages = [
+        "Hey there! Ready to tackle your next micro-step? You've got this! 💪",
+        "Time for a quick win! What's one small thing you can do right now? ⚡",
+        "Your future self will thank you for taking action today! Let's go! 🚀",
+        "Every expert was once a beginner. Every pro was once an amateur. Keep going! 🌟",
+        "Success is the sum of small efforts repeated day in and day out. You're doing great! 💯"
+    ]
+    import random
+    return random.choice(fallback_messages)
+
+def fallback_digest(user_data):
+    """Template digest used when the AI is unavailable or throttled"""
+    completed_count = len(user_data.get('completed_tasks', []))
+    points = user_data.get('points_earned', 0)
+    streak = user_data.get('streak', 0)
+    return f"Today was another step forward in your journey! You completed {completed_count} tasks and earned {points} points. Your {streak}-day streak is building momentum. Keep going! 🌟"
+
 def generate_ai_nudge(user_context):
-    """Generate AI-powered nudge using ChatGPT with fallback"""
+    """Generate AI-powered nudge with fallback; identical concurrent nudges share one AI call"""
     try:
-        prompt = f"""
-        You are a supportive AI coach that helps people stay focused and motivated. 
-        Generate a gentle, encouraging nudge to help them take the next small step.
-        
-        Context:
-        - Current task: {user_context.get('current_task', 'No specific task')}
-        - User mood: {user_context.get('mood', 'neutral')}
-        - Streak: {user_context.get('streak', 0)} days
-        - Last activity: {user_context.get('last_activity', 'None')}
-        
-        Keep the response under 100 words, make it personal and encouraging.
-        """
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a supportive AI coach that helps people stay focused and motivated. You provide gentle, encouraging nudges to help users take small steps toward their goals. Keep responses under 100 words and make them feel personal and conversational."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=150,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content.strip()
+        return ai_service.request_micro_nudge(user_context)
     except Exception as e:
         print(f"AI Error: {e}")
-        # Fallback motivational messages
-        fallback_messages = [
-            "Hey there! Ready to tackle your next micro-step? You've got this! 💪",
-            "Time for a quick win! What's one small thing you can do right now? ⚡",
-            "Your future self will thank you for taking action today! Let's go! 🚀",
-            "Every expert was once a beginner. Every pro was once an amateur. Keep going! 🌟",
-            "Success is the sum of small efforts repeated day in and day out. You're doing great! 💯"
-        ]
-        import random
-        return random.choice(fallback_messages)
+        return fallback_nudge()
 
 def generate_ai_celebration(achievement, streak_count):
     """Generate AI-powered celebration message with fallback"""
     try:
-        prompt = f"Generate a short, enthusiastic celebration message for someone who just achieved: {achievement}. They have a {streak_count}-day streak. Make it feel exciting and motivating!"
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an enthusiastic AI coach that celebrates user achievements. Create short, exciting celebration messages with emojis that make users feel proud and motivated to continue."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=100,
-            temperature=0.9
-        )
-        
-        return response.choices[0].message.content.strip()
+        return ai_service.request_celebration_message(achievement, streak_count)
     except Exception as e:
         print(f"AI Error: {e}")
         return f"🎉 Amazing work! You completed '{achievement}' and you're on fire with that {streak_count}-day streak! Keep it up! 🔥"
 
-def generate_ai_digest(user_data):
-    """Generate AI-powered daily digest with fallback"""
-    try:
-        prompt = f"""
-        Create a daily digest story for a user with:
-        - Completed tasks: {', '.join(user_data.get('completed_tasks', [])) if user_data.get('completed_tasks') else 'None'}
-        - Current streak: {user_data.get('streak', 0)} days
-        - Points earned today: {user_data.get('points_earned', 0)}
-        - Mood trend: {user_data.get('mood_trend', 'stable')}
-        
-        Write an encouraging, story-like summary of their day that celebrates their progress and motivates them for tomorrow.
-        """
-        
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a friendly AI that creates engaging daily digest stories. Write a short, encouraging narrative about the user's day, highlighting their achievements and progress. Make it feel like a personal journal entry that celebrates their wins."},
-                {"role": "user", "content": prompt}
-            ],
-            max_tokens=300,
-            temperature=0.8
-        )
-        
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"AI Error: {e}")
-        completed_count = len(user_data.get('completed_tasks', []))
-        points = user_data.get('points_earned', 0)
-        streak = user_data.get('streak', 0)
-        return f"Today was another step forward in your journey! You completed {completed_count} tasks and earned {points} points. Your {streak}-day streak is building momentum. Keep going! 🌟"
-
 # Routes
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    tasks = list(mongo.db.tasks.find({
-        'user_id': DEFAULT_USER_ID,
-        'date': datetime.now().strftime('%Y-%m-%d')
-    }))
-    
-    # Convert ObjectId to string for JSON serialization
-    for task in tasks:
-        task['_id'] = str(task['_id'])
+    tasks = tasks_for_day(DEFAULT_USER_ID, user_day())
     
     return jsonify(tasks)
 
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
     data = request.get_json()
+    today = user_today()
     
     task = {
         'task_id': str(uuid.uuid4()),
@@ -138,65 +188,237 @@ def create_task():
         'estimated_duration': data.get('estimated_duration', 30),  # minutes
         'status': 'pending',
         'created_at': datetime.utcnow(),
-        'date': datetime.now().strftime('%Y-%m-%d'),
+        'day': day_number(today),
+        'date': today.isoformat(),
         'micro_steps': data.get('micro_steps', []),
         'points_value': data.get('points_value', 10)
     }
     
-    mongo.db.tasks.insert_one(task)
-    task['_id'] = str(task['_id'])
+    repository.insert_task(task)
+    search_index.add(task)
+    event_broker.publish(DEFAULT_USER_ID, 'task_created', task)
+    
+    if Config.AI_MICRO_STEPS and not task['micro_steps']:
+        background.submit('micro_steps', decompose_task, task['task_id'], task['title'], task['description'])
+    
+    if Config.SPECULATIVE_CELEBRATIONS:
+        background.submit('speculate_celebration', speculate_celebration, task['task_id'], task['title'])
+    
+    if Config.NUDGE_SCHEDULER_ENABLED:
+        # Nudge if the task is still pending once its estimated time has passed
+        nudge_scheduler.schedule(
+            f"task_overdue:{task['task_id']}",
+            DEFAULT_USER_ID,
+            'task_overdue',
+            task['created_at'] + timedelta(minutes=task['estimated_duration']),
+            {'task_id': task['task_id']}
+        )
+        schedule_inactivity_nudge(DEFAULT_USER_ID)
     
     return jsonify(task), 201
 
+@app.route('/api/tasks/search', methods=['GET'])
+def search_tasks():
+    """Tasks from any day whose title or description contain every word of `q`, best matches first"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'message': 'Missing search query!'}), 400
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    
+    started = time.perf_counter()
+    results = search_index.search(DEFAULT_USER_ID, query, limit)
+    
+    return jsonify({
+        'query': query,
+        'results': results,
+        'took_ms': round((time.perf_counter() - started) * 1000, 2)
+    })
+
+@app.route('/api/tasks/search/rebuild', methods=['POST'])
+def rebuild_search_index():
+    """Re-read the user's tasks into this worker's search index"""
+    index = search_index.rebuild(DEFAULT_USER_ID)
+    
+    return jsonify({'message': 'Search index rebuilt!', 'tasks': len(index)})
+
+# Recurring instances get task_ids derived from template and day, so every worker agrees on them
+RECURRING_NAMESPACE = uuid.UUID('5b2f8a3e-7c41-4d8e-9f06-2a1c3e4b5d67')
+TEMPLATE_FIELDS = ('title', 'description', 'priority', 'estimated_duration', 'points_value')
+
+def recurring_instance(template, day, zone):
+    """A template's task on a day, exactly as it is stored once materialized"""
+    task_id = str(uuid.uuid5(RECURRING_NAMESPACE, f"{template['template_id']}:{day}"))
+    local_date = day_from_number(day)
+    task = {'_id': task_id, 'task_id': task_id, 'user_id': template['user_id']}
+    task.update((field, template[field]) for field in TEMPLATE_FIELDS)
+    task.update({
+        'status': 'pending',
+        'created_at': local_midnight_utc(local_date, zone),
+        'day': day,
+        'date': local_date.isoformat(),
+        'micro_steps': list(template['micro_steps']),
+        'template_id': template['template_id']
+    })
+    return task
+
+def tasks_for_day(user_id, day, status=None):
+    """
+    A day's tasks, including its recurring ones. Instances nobody has acted
+    on yet are built from their templates rather than stored, so recurring
+    tasks cost no writes for the days they are only looked at.
+    """
+    tasks = repository.find_tasks(user_id, day)
+    stored = {task.get('template_id') for task in tasks}
+    zone = user_zone(user_id)
+    for template in repository.find_templates(user_id):
+        if template['template_id'] not in stored and occurs_on(parse_rule(template['rule']), template['start_day'], day):
+            tasks.append(recurring_instance(template, day, zone))
+    if status:
+        tasks = [task for task in tasks if task['status'] == status]
+    return tasks
+
+def materialize_recurring(user_id, task_id):
+    """Store today's instance of a recurring task the first time it is acted on"""
+    day = user_day(user_id)
+    for template in repository.find_templates(user_id):
+        task = recurring_instance(template, day, user_zone(user_id))
+        if task['task_id'] == task_id and occurs_on(parse_rule(template['rule']), template['start_day'], day):
+            # Another worker may store it first; either way it exists afterwards
+            if repository.insert_tasks([task]):
+                search_index.add(task)
+                metrics.inc('recurring.materialized')
+            return repository.find_task(user_id, task_id)
+    return None
+
+def decompose_task(task_id, title, description):
+    """
+    Fill in a new task's micro_steps. Steps are shared through a cache keyed
+    by the normalized title and description, so common tasks are only sent
+    to the AI once.
+    """
+    key = micro_steps_key(title, description)
+    steps = repository.find_micro_steps(key)
+    if steps is not None:
+        metrics.inc('micro_steps.cache_hits')
+    elif ai_limiter.allow(DEFAULT_USER_ID, background=True):
+        metrics.inc('micro_steps.cache_misses')
+        steps = ai_service.generate_micro_steps(title, description)
+        if not steps:
+            return
+        repository.save_micro_steps(key, steps)
+    else:
+        metrics.inc('micro_steps.skipped')
+        return
+    
+    repository.update_task(task_id, {'micro_steps': steps})
+    event_broker.publish(DEFAULT_USER_ID, 'task_updated', {'task_id': task_id, 'micro_steps': steps})
+
+def predict_streak():
+    """The streak update_streak will set when the next task is completed"""
+    if repository.count_tasks(DEFAULT_USER_ID, day=user_day() - 1, status='completed') > 0:
+        return repository.ensure_stats(DEFAULT_USER_ID).get('streak', 0) + 1
+    return 1
+
+# Expired speculations mostly sit on tasks nobody completed, so each worker
+# clears them in bulk now and then rather than waiting for a completion
+SPECULATION_SWEEP_SECONDS = 3600
+_speculations_swept_at = None
+
+def sweep_expired_speculations():
+    global _speculations_swept_at
+    now = time.monotonic()
+    if _speculations_swept_at is not None and now - _speculations_swept_at < SPECULATION_SWEEP_SECONDS:
+        return
+    _speculations_swept_at = now
+    metrics.inc('celebration_speculation.cleared', repository.clear_expired_speculations(datetime.utcnow()))
+
+def speculate_celebration(task_id, title):
+    """
+    Pre-generate the celebration for a new task, for the streak it will
+    most likely be completed at, and store it on the task
+    """
+    sweep_expired_speculations()
+    if not ai_limiter.allow(DEFAULT_USER_ID, background=True):
+        # Completion generates it instead
+        metrics.inc('celebration_speculation.skipped')
+        return
+    
+    streak = predict_streak()
+    celebration = ai_service.request_celebration_message(title, streak)
+    repository.update_task(task_id, {'speculative_celebration': {
+        'celebration': celebration,
+        'streak': streak,
+        'expires_at': datetime.utcnow() + timedelta(hours=Config.CELEBRATION_SPECULATION_HOURS)
+    }})
+    metrics.inc('celebration_speculation.generated')
+
+def speculated_celebration(task, streak):
+    """The task's pre-generated celebration if it was made for this streak and is unexpired"""
+    speculation = task.get('speculative_celebration')
+    if not speculation:
+        return None
+    if speculation['expires_at'].replace(tzinfo=None) < datetime.utcnow():
+        metrics.inc('celebration_speculation.expired')
+        return None
+    if speculation['streak'] != streak:
+        metrics.inc('celebration_speculation.stale')
+        return None
+    metrics.inc('celebration_speculation.used')
+    return speculation['celebration']
+
 @app.route('/api/tasks/<task_id>/complete', methods=['POST'])
 def complete_task(task_id):
-    task = mongo.db.tasks.find_one({
-        'task_id': task_id,
-        'user_id': DEFAULT_USER_ID
-    })
+    task = repository.find_task(DEFAULT_USER_ID, task_id) or materialize_recurring(DEFAULT_USER_ID, task_id)
     
     if not task:
         return jsonify({'message': 'Task not found!'}), 404
     
     # Update task status
-    mongo.db.tasks.update_one(
-        {'task_id': task_id},
-        {'$set': {'status': 'completed', 'completed_at': datetime.utcnow()}}
-    )
+    completed_at = datetime.utcnow()
+    completion = {'status': 'completed', 'completed_at': completed_at}
+    if task.get('speculative_celebration'):
+        completion['speculative_celebration'] = None
+    repository.update_task(task_id, completion)
+    
+    if Config.NUDGE_SCHEDULER_ENABLED:
+        nudge_scheduler.cancel(f'task_overdue:{task_id}')
+        schedule_inactivity_nudge(DEFAULT_USER_ID)
     
     # Update user stats
     points_earned = task.get('points_value', 10)
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-    if not user_stats:
-        user_stats = {
-            'user_id': DEFAULT_USER_ID,
-            'total_points': 0,
-            'streak': 0,
-            'total_tasks': 0,
-            'completed_tasks': 0
-        }
-        mongo.db.user_stats.insert_one(user_stats)
-    
-    # Update stats
-    mongo.db.user_stats.update_one(
-        {'user_id': DEFAULT_USER_ID},
-        {'$inc': {
-            'total_points': points_earned,
-            'completed_tasks': 1
-        }}
-    )
+    previous_stats = repository.ensure_stats(DEFAULT_USER_ID)
+    
+    # Update stats and mark today in the activity calendar
+    repository.record_completion(DEFAULT_USER_ID, points_earned, user_today(), task['day'])
     
     # Check for streak update
     update_streak()
     
     # Get updated stats for celebration
-    updated_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
+    updated_stats = repository.find_stats(DEFAULT_USER_ID)
+    leaderboard.update(updated_stats)
     
-    # Generate AI celebration message
-    celebration = generate_ai_celebration(
-        task['title'], 
-        updated_stats.get('streak', 0)
-    )
+    event_broker.publish(DEFAULT_USER_ID, 'task_completed', {
+        'task_id': task_id,
+        'points_earned': points_earned,
+        'completed_at': completed_at
+    })
+    event_broker.publish(DEFAULT_USER_ID, 'stats_updated', {
+        'streak': updated_stats.get('streak', 0),
+        'total_points': updated_stats.get('total_points', 0),
+        'completed_tasks': updated_stats.get('completed_tasks', 0)
+    })
+    if updated_stats.get('streak', 0) != previous_stats.get('streak', 0):
+        event_broker.publish(DEFAULT_USER_ID, 'streak_changed', {'streak': updated_stats.get('streak', 0)})
+    
+    # Use the speculated celebration, or generate one if the streak moved
+    celebration = speculated_celebration(task, updated_stats.get('streak', 0))
+    if celebration is None:
+        celebration = generate_ai_celebration(
+            task['title'], 
+            updated_stats.get('streak', 0)
+        )
+    event_broker.publish(DEFAULT_USER_ID, 'celebration', {'task_id': task_id, 'celebration': celebration})
     
     return jsonify({
         'message': 'Task completed!',
@@ -204,36 +426,107 @@ def complete_task(task_id):
         'celebration': celebration
     })
 
+def template_response(template):
+    rule = parse_rule(template['rule'])
+    next_day = next_occurrence(rule, template['start_day'], user_day() - 1)
+    return dict(template, next_date=day_from_number(next_day).isoformat() if next_day is not None else None)
+
+@app.route('/api/recurring-tasks', methods=['GET'])
+def get_recurring_tasks():
+    templates = repository.find_templates(DEFAULT_USER_ID)
+    
+    return jsonify([template_response(template) for template in templates])
+
+@app.route('/api/recurring-tasks', methods=['POST'])
+def create_recurring_task():
+    """A task template repeated on the days its RRULE-style `rule` selects, from `start_date` (default today)"""
+    data = request.get_json()
+    
+    try:
+        parse_rule(data.get('rule', ''))
+        start = date.fromisoformat(data['start_date']) if data.get('start_date') else user_today()
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    template = {
+        'template_id': str(uuid.uuid4()),
+        'user_id': DEFAULT_USER_ID,
+        'title': data['title'],
+        'description': data.get('description', ''),
+        'priority': data.get('priority', 'medium'),
+        'estimated_duration': data.get('estimated_duration', 30),  # minutes
+        'micro_steps': data.get('micro_steps', []),
+        'points_value': data.get('points_value', 10),
+        'rule': data['rule'].strip().upper(),
+        'start_day': day_number(start),
+        'created_at': datetime.utcnow()
+    }
+    repository.insert_template(template)
+    
+    today = user_day()
+    if occurs_on(parse_rule(template['rule']), template['start_day'], today):
+        event_broker.publish(DEFAULT_USER_ID, 'task_created', recurring_instance(template, today, user_zone()))
+    
+    return jsonify(template_response(template)), 201
+
+@app.route('/api/recurring-tasks/<template_id>', methods=['DELETE'])
+def delete_recurring_task(template_id):
+    """Stop a recurring task; instances already completed or started are kept"""
+    if not repository.delete_template(DEFAULT_USER_ID, template_id):
+        return jsonify({'message': 'Recurring task not found!'}), 404
+    
+    return jsonify({'message': 'Recurring task deleted!'})
+
 @app.route('/api/nudge', methods=['POST'])
 def get_nudge():
     # Get user context for personalized nudges
-    today_tasks = list(mongo.db.tasks.find({
-        'user_id': DEFAULT_USER_ID,
-        'date': datetime.now().strftime('%Y-%m-%d'),
-        'status': 'pending'
-    }))
+    today_tasks = tasks_for_day(DEFAULT_USER_ID, user_day(), status='pending')
     
-    last_activity = mongo.db.activities.find_one(
-        {'user_id': DEFAULT_USER_ID},
-        sort=[('timestamp', -1)]
-    )
+    last_activity = repository.latest_activity(DEFAULT_USER_ID)
     
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
+    user_stats = repository.find_stats(DEFAULT_USER_ID)
+    
+    mood = request.json.get('mood', 'neutral') if request.is_json else 'neutral'
+    context = build_nudge_context(today_tasks, last_activity, user_stats, mood)
+    
+    nudge, throttled = produce_nudge(context, last_activity)
+    if throttled:
+        return jsonify({'nudge': nudge, 'throttled': True})
+    
+    return jsonify({'nudge': nudge})
+
+def build_nudge_context(pending_tasks, last_activity, user_stats, mood='neutral'):
+    """Prompt context for a nudge from already-loaded task, activity and stats data"""
     if not user_stats:
         user_stats = {'streak': 0, 'total_points': 0}
     
-    context = {
-        'current_task': today_tasks[0]['title'] if today_tasks else 'No tasks',
-        'mood': request.json.get('mood', 'neutral') if request.is_json else 'neutral',
+    return {
+        'current_task': pending_tasks[0]['title'] if pending_tasks else 'No tasks',
+        'mood': mood,
         'streak': user_stats.get('streak', 0),
         'last_activity': last_activity['activity'] if last_activity else 'None',
         'productivity_level': 'medium'  # Could be calculated from recent activity
     }
+
+def produce_nudge(context, last_activity):
+    """Generate and log a nudge within the AI rate limit; returns (nudge, throttled)"""
+    if not ai_limiter.allow(DEFAULT_USER_ID):
+        return throttled_nudge(last_activity), True
     
     # Generate AI nudge
     nudge = generate_ai_nudge(context)
+    log_nudge(nudge)
     
-    # Log the nudge activity
+    return nudge, False
+
+def throttled_nudge(last_activity):
+    """Over the limit: repeat the last generated nudge or use a template"""
+    if last_activity and last_activity['activity'] == 'nudge_generated':
+        return last_activity['data']['nudge']
+    return fallback_nudge()
+
+def log_nudge(nudge):
+    """Log the nudge activity"""
     activity = {
         'activity_id': str(uuid.uuid4()),
         'user_id': DEFAULT_USER_ID,
@@ -241,125 +534,372 @@ def get_nudge():
         'timestamp': datetime.utcnow(),
         'data': {'nudge': nudge}
     }
-    mongo.db.activities.insert_one(activity)
+    repository.insert_activity(activity)
     
-    return jsonify({'nudge': nudge})
+    if Config.NUDGE_SCHEDULER_ENABLED:
+        schedule_inactivity_nudge(DEFAULT_USER_ID)
+
+def schedule_inactivity_nudge(user_id):
+    """(Re)start the user's inactivity timer from now"""
+    nudge_scheduler.schedule(
+        f'inactivity:{user_id}',
+        user_id,
+        'inactivity',
+        datetime.utcnow() + timedelta(minutes=Config.NUDGE_INACTIVITY_MINUTES)
+    )
+
+def generate_scheduled_nudge(timer):
+    """Nudge text for a due scheduler timer, or None to skip it"""
+    user_id = timer['user_id']
+    if not event_broker.has_subscribers(user_id):
+        # Events only reach open streams, so nobody would see it
+        metrics.inc('scheduled_nudges.no_listener')
+        return None
+    if timer['kind'] == 'task_overdue':
+        task = repository.find_task(user_id, timer['data']['task_id'])
+        if not task or task['status'] != 'pending':
+            return None
+        pending_tasks = [task]
+    else:
+        pending_tasks = tasks_for_day(user_id, user_day(user_id), status='pending')
+    
+    if not ai_limiter.allow(user_id, background=True):
+        return fallback_nudge()
+    
+    last_activity = repository.latest_activity(user_id)
+    user_stats = repository.find_stats(user_id)
+    return generate_ai_nudge(build_nudge_context(pending_tasks, last_activity, user_stats))
+
+# Server-initiated nudges, pushed to open event streams
+nudge_scheduler = NudgeScheduler(
+    repository,
+    generate_scheduled_nudge,
+    EventSink(event_broker),
+    batch_size=Config.NUDGE_SCHEDULER_BATCH_SIZE,
+    concurrency=Config.NUDGE_SCHEDULER_CONCURRENCY,
+    resync_seconds=Config.NUDGE_SCHEDULER_RESYNC_SECONDS
+)
+
+@app.route('/api/nudge/stream', methods=['POST'])
+def stream_nudge():
+    """
+    Streaming variant of /api/nudge as Server-Sent Events: `delta` events
+    carry text as the model produces it, then `done` carries the whole
+    nudge. If the model fails or goes quiet for NUDGE_STREAM_STALL_SECONDS,
+    `done` carries a template nudge with `fallback: true` that replaces
+    any partial text.
+    """
+    today_tasks = tasks_for_day(DEFAULT_USER_ID, user_day(), status='pending')
+    last_activity = repository.latest_activity(DEFAULT_USER_ID)
+    user_stats = repository.find_stats(DEFAULT_USER_ID)
+    
+    mood = request.json.get('mood', 'neutral') if request.is_json else 'neutral'
+    context = build_nudge_context(today_tasks, last_activity, user_stats, mood)
+    throttled = not ai_limiter.allow(DEFAULT_USER_ID)
+    
+    def stream():
+        if throttled:
+            yield format_event('done', {'nudge': throttled_nudge(last_activity), 'throttled': True})
+            return
+        
+        parts = []
+        try:
+            for delta in ai_service.stream_micro_nudge(context, Config.NUDGE_STREAM_STALL_SECONDS):
+                parts.append(delta)
+                yield format_event('delta', {'text': delta})
+            nudge = ''.join(parts).strip()
+        except Exception as e:
+            print(f"AI Error: {e}")
+            nudge = ''
+        
+        fallback = not nudge
+        if fallback:
+            nudge = fallback_nudge()
+        
+        log_nudge(nudge)
+        yield format_event('done', {'nudge': nudge, 'fallback': fallback})
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
 
 @app.route('/api/daily-digest', methods=['GET'])
 def get_daily_digest():
-    today = datetime.now().strftime('%Y-%m-%d')
+    """
+    Today's digest as stored by the digest job or an earlier request, or a
+    newly generated one if today's completed tasks or streak have changed
+    """
+    day = user_day()
     
     # Get today's data
-    completed_tasks = list(mongo.db.tasks.find({
-        'user_id': DEFAULT_USER_ID,
-        'date': today,
-        'status': 'completed'
-    }))
+    completed_tasks = repository.find_tasks(DEFAULT_USER_ID, day, status='completed')
+    user_data = digest_inputs(completed_tasks, repository.find_stats(DEFAULT_USER_ID))
+    version = fingerprint(user_data)
     
-    today_activities = list(mongo.db.activities.find({
-        'user_id': DEFAULT_USER_ID,
-        'timestamp': {'$gte': datetime.now().replace(hour=0, minute=0, second=0)}
-    }))
+    stored = repository.find_digest(DEFAULT_USER_ID)
+    if stored and stored['day'] == day and stored['fingerprint'] == version:
+        metrics.inc('digest.stored')
+        return jsonify({'digest': stored['digest']})
     
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-    if not user_stats:
-        user_stats = {'streak': 0, 'total_points': 0}
+    if not ai_limiter.allow(DEFAULT_USER_ID):
+        return jsonify({'digest': fallback_digest(user_data), 'throttled': True})
     
-    user_data = {
-        'completed_tasks': [task['title'] for task in completed_tasks],
-        'streak': user_stats.get('streak', 0),
-        'points_earned': sum(task.get('points_value', 10) for task in completed_tasks),
-        'mood_trend': 'positive'  # Could be calculated from activities
-    }
+    # Generate AI digest; fallbacks aren't stored, so the next request tries the AI again
+    try:
+        digest = ai_service.request_daily_digest(user_data)
+    except Exception as e:
+        print(f"AI Error: {e}")
+        return jsonify({'digest': fallback_digest(user_data)})
     
-    # Generate AI digest
-    digest = generate_ai_digest(user_data)
+    metrics.inc('digest.generated')
+    repository.save_digests([{
+        'user_id': DEFAULT_USER_ID,
+        'day': day,
+        'fingerprint': version,
+        'digest': digest,
+        'generated_at': datetime.utcnow()
+    }])
     
     return jsonify({'digest': digest})
 
 @app.route('/api/user/stats', methods=['GET'])
 def get_user_stats():
     # Get user statistics
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-    if not user_stats:
-        user_stats = {
-            'user_id': DEFAULT_USER_ID,
-            'total_points': 0,
-            'streak': 0,
-            'total_tasks': 0,
-            'completed_tasks': 0
-        }
-        mongo.db.user_stats.insert_one(user_stats)
-    
-    total_tasks = mongo.db.tasks.count_documents({'user_id': DEFAULT_USER_ID})
-    completed_tasks = mongo.db.tasks.count_documents({
-        'user_id': DEFAULT_USER_ID,
-        'status': 'completed'
-    })
+    user_stats = repository.ensure_stats(DEFAULT_USER_ID)
     
-    # Get weekly progress
-    week_ago = datetime.now() - timedelta(days=7)
-    weekly_tasks = mongo.db.tasks.count_documents({
-        'user_id': DEFAULT_USER_ID,
-        'created_at': {'$gte': week_ago}
-    })
+    return jsonify(build_user_stats(user_stats))
+
+def build_user_stats(user_stats):
+    """Stats payload from an already-loaded user_stats document plus task counts"""
+    total_tasks = repository.count_tasks(DEFAULT_USER_ID)
+    completed_tasks = repository.count_tasks(DEFAULT_USER_ID, status='completed')
+    
+    # Get weekly progress (today and the six days before)
+    weekly_tasks = repository.count_tasks(DEFAULT_USER_ID, since_day=user_day() - 6)
     
     completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
     
-    return jsonify({
+    return {
         'streak': user_stats.get('streak', 0),
         'total_points': user_stats.get('total_points', 0),
         'total_tasks': total_tasks,
         'completed_tasks': completed_tasks,
         'completion_rate': completion_rate,
         'weekly_tasks': weekly_tasks
+    }
+
+DASHBOARD_SECTIONS = ('tasks', 'stats', 'nudge')
+
+@app.route('/api/dashboard', methods=['GET'])
+def get_dashboard():
+    """
+    Tasks, stats and a nudge in one round trip. `sections` picks what to
+    include; today's tasks, user_stats and the latest activity are each
+    loaded once and shared between sections. A nudge that is not cached
+    is generated in the background and pushed as a `nudge` event unless
+    `defer_ai=false`.
+    """
+    sections = request.args.get('sections', ','.join(DASHBOARD_SECTIONS)).split(',')
+    unknown = [section for section in sections if section not in DASHBOARD_SECTIONS]
+    if unknown:
+        return jsonify({'message': f"Unknown dashboard sections: {', '.join(unknown)}"}), 400
+    
+    today_tasks = []
+    if 'tasks' in sections or 'nudge' in sections:
+        today_tasks = tasks_for_day(DEFAULT_USER_ID, user_day())
+    user_stats = repository.ensure_stats(DEFAULT_USER_ID)
+    
+    dashboard = {}
+    if 'tasks' in sections:
+        dashboard['tasks'] = today_tasks
+    if 'stats' in sections:
+        dashboard['stats'] = build_user_stats(user_stats)
+    if 'nudge' in sections:
+        dashboard['nudge'] = dashboard_nudge(today_tasks, user_stats)
+    
+    return jsonify(dashboard)
+
+def dashboard_nudge(today_tasks, user_stats):
+    last_activity = repository.latest_activity(DEFAULT_USER_ID)
+    
+    # Reuse a recent nudge instead of paying for a new generation
+    if last_activity and last_activity['activity'] == 'nudge_generated':
+        age = datetime.utcnow() - last_activity['timestamp'].replace(tzinfo=None)
+        if age < timedelta(minutes=Config.NUDGE_CACHE_MINUTES):
+            return {'nudge': last_activity['data']['nudge'], 'cached': True}
+    
+    pending_tasks = [task for task in today_tasks if task['status'] == 'pending']
+    context = build_nudge_context(pending_tasks, last_activity, user_stats)
+    
+    if request.args.get('defer_ai', 'true').lower() == 'false':
+        nudge, throttled = produce_nudge(context, last_activity)
+        return {'nudge': nudge, 'throttled': throttled}
+    
+    def generate_and_push():
+        nudge, throttled = produce_nudge(context, last_activity)
+        event_broker.publish(DEFAULT_USER_ID, 'nudge', {'nudge': nudge, 'throttled': throttled})
+    
+    background.submit('dashboard_nudge', generate_and_push)
+    return {'nudge': None, 'pending': True}
+
+@app.route('/api/user/activity', methods=['GET'])
+def get_user_activity():
+    """Completion heatmap and streak history from the activity bitset"""
+    days = min(max(request.args.get('days', 365, type=int), 1), 730)
+    
+    words = repository.activity_words(DEFAULT_USER_ID)
+    
+    return jsonify(build_calendar(words, user_today(), days))
+
+@app.route('/api/user/timezone', methods=['GET'])
+def get_user_timezone():
+    return jsonify({'timezone': user_zone().key, 'today': user_today().isoformat()})
+
+@app.route('/api/user/timezone', methods=['PUT'])
+def set_user_timezone():
+    """Set the IANA timezone (e.g. 'America/New_York') that the user's days follow"""
+    data = request.get_json(silent=True) or {}
+    try:
+        zone = resolve_timezone(data.get('timezone') or '')
+    except ValueError as e:
+        return jsonify({'message': str(e)}), 400
+    
+    repository.set_timezone(DEFAULT_USER_ID, zone.key)
+    timezones.forget(DEFAULT_USER_ID)
+    g.pop('user_today', None)
+    
+    return jsonify({'timezone': zone.key, 'today': user_today().isoformat()})
+
+@app.route('/api/events', methods=['GET'])
+def stream_events():
+    """Server-Sent Events stream of task, stats and celebration changes"""
+    subscription = event_broker.subscribe(DEFAULT_USER_ID)
+    
+    def stream():
+        try:
+            yield b'retry: 3000\n\n'
+            while True:
+                if subscription.overflowed:
+                    # Events were dropped; the client should re-fetch its state
+                    subscription.overflowed = False
+                    yield format_event('resync', {})
+                event = subscription.get(Config.EVENTS_HEARTBEAT_SECONDS)
+                yield event if event is not None else b': keep-alive\n\n'
+        finally:
+            event_broker.unsubscribe(subscription)
+    
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/leaderboard', methods=['GET'])
+def get_leaderboard():
+    board = request.args.get('board', 'points')
+    if board not in BOARDS:
+        return jsonify({'message': f'Unknown leaderboard: {board}'}), 400
+    
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 100)
+    
+    return jsonify({
+        'board': board,
+        'entries': leaderboard.top(board, limit),
+        'total_users': leaderboard.size(board)
     })
 
+@app.route('/api/leaderboard/rank', methods=['GET'])
+def get_leaderboard_rank():
+    board = request.args.get('board', 'points')
+    if board not in BOARDS:
+        return jsonify({'message': f'Unknown leaderboard: {board}'}), 400
+    
+    user_id = request.args.get('user_id', DEFAULT_USER_ID)
+    entry = leaderboard.rank(board, user_id)
+    if not entry:
+        return jsonify({'message': 'User not ranked yet!'}), 404
+    
+    entry['board'] = board
+    entry['total_users'] = leaderboard.size(board)
+    return jsonify(entry)
+
 def update_streak():
     """Update user streak based on daily activity"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    today = user_day()
     
     # Check if user completed tasks today
-    today_completed = mongo.db.tasks.count_documents({
-        'user_id': DEFAULT_USER_ID,
-        'date': today,
-        'status': 'completed'
-    })
+    today_completed = repository.count_tasks(DEFAULT_USER_ID, day=today, status='completed')
     
     if today_completed > 0:
         # Check if user had activity yesterday
-        yesterday_completed = mongo.db.tasks.count_documents({
-            'user_id': DEFAULT_USER_ID,
-            'date': yesterday,
-            'status': 'completed'
-        })
+        yesterday_completed = repository.count_tasks(DEFAULT_USER_ID, day=today - 1, status='completed')
         
-        user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-        if not user_stats:
-            user_stats = {'user_id': DEFAULT_USER_ID, 'streak': 0}
-            mongo.db.user_stats.insert_one(user_stats)
+        repository.ensure_stats(DEFAULT_USER_ID)
         
         if yesterday_completed > 0:
             # Increment streak
-            mongo.db.user_stats.update_one(
-                {'user_id': DEFAULT_USER_ID},
-                {'$inc': {'streak': 1}}
-            )
+            repository.increment_streak(DEFAULT_USER_ID)
         else:
             # Reset streak to 1
-            mongo.db.user_stats.update_one(
-                {'user_id': DEFAULT_USER_ID},
-                {'$set': {'streak': 1}}
-            )
+            repository.set_streak(DEFAULT_USER_ID, 1)
+
+@app.route('/api/export', methods=['GET'])
+def export_data():
+    """The user's stats, tasks and activities as streamed NDJSON, gzipped with ?gzip=true"""
+    chunks = export_user(repository, DEFAULT_USER_ID, Config.TRANSFER_BATCH_SIZE)
+    filename = f'{DEFAULT_USER_ID}.ndjson'
+    mimetype = 'application/x-ndjson'
+    if request.args.get('gzip', 'false').lower() == 'true':
+        chunks = gzip_chunks(chunks)
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
+@app.route('/api/import', methods=['POST'])
+def import_data():
+    """
+    Load an export into this user. The body is NDJSON, gzipped if sent with
+    Content-Encoding or Content-Type gzip, and is read as it arrives.
+    """
+    compressed = (request.headers.get('Content-Encoding', '').lower() == 'gzip'
+                  or request.mimetype == 'application/gzip')
+    try:
+        counts = import_user(repository, open_lines(request.stream, compressed),
+                             Config.TRANSFER_BATCH_SIZE, user_id=DEFAULT_USER_ID)
+    except (ValueError, KeyError, OSError) as e:
+        return jsonify({'message': f'Invalid import: {e}'}), 400
+    
+    search_index.forget(DEFAULT_USER_ID)
+    user_stats = repository.find_stats(DEFAULT_USER_ID)
+    if user_stats:
+        leaderboard.update(user_stats)
+    # Open clients re-fetch everything
+    event_broker.publish(DEFAULT_USER_ID, 'resync', {})
+    
+    return jsonify(counts)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'healthy', 'message': 'AI Micro-Motivation Assistant is running with ChatGPT integration!'})
 
+@app.route('/api/ready', methods=['GET'])
+def readiness_check():
+    """Readiness probe: 200 only after this worker finished warming up"""
+    return jsonify(warmup_state.to_dict()), 200 if warmup_state.ready else 503
+
 @app.route('/api/test-ai', methods=['GET'])
 def test_ai():
     """Test endpoint to verify AI integration"""
+    if not ai_limiter.allow(DEFAULT_USER_ID):
+        return jsonify({
+            'status': 'throttled',
+            'message': 'AI rate limit reached, serving a template nudge',
+            'test_nudge': fallback_nudge()
+        })
+    
     try:
         test_nudge = generate_ai_nudge({
             'current_task': 'Test task',
@@ -378,6 +918,69 @@ def test_ai():
             'message': f'AI integration failed: {str(e)}'
         }), 500
 
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return jsonify(metrics.snapshot())
+
+@app.cli.command('migrate-day-keys')
+def migrate_day_keys():
+    """Backfill integer day keys on tasks stored before they existed"""
+    migrated = repository.migrate_day_keys()
+    print(f"Added day keys to {migrated} tasks")
+
+@app.cli.command('migrate-task-schema')
+def migrate_task_schema():
+    """Rewrite every task in the compact v2 schema, in throttled batches"""
+    processed = schema_migrator.run()
+    print(f"Processed {processed} tasks; all tasks are now schema v2")
+
+@app.cli.command('export-user')
+@click.argument('output', type=click.Path(dir_okay=False))
+@click.option('--user', 'user_id', default=DEFAULT_USER_ID, help='User to export')
+@click.option('--gzip', 'compress', is_flag=True, help='Gzip the output')
+def export_user_command(output, user_id, compress):
+    """Write a user's data to OUTPUT as NDJSON ('-' for stdout)"""
+    chunks = export_user(repository, user_id, Config.TRANSFER_BATCH_SIZE)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    with click.open_file(output, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+
+@app.cli.command('import-user')
+@click.argument('source', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--user', 'user_id', default=None, help='Import as this user instead of the exported one')
+def import_user_command(source, user_id):
+    """Load an NDJSON export (gzipped or not) from SOURCE ('-' for stdin)"""
+    with click.open_file(source, 'rb') as f:
+        counts = import_user(repository, open_lines(f), Config.TRANSFER_BATCH_SIZE, user_id=user_id)
+    print(f"Imported {counts['templates']} templates, {counts['tasks']} tasks and {counts['activities']} activities "
+          f"({counts['skipped']} already present), stats: {counts['stats']}")
+
+@app.cli.command('generate-digests')
+@click.option('--concurrency', type=int, default=None, help='AI calls in flight at once')
+def generate_digests_command(concurrency):
+    """Generate and store today's digest for every user with tasks today"""
+    job = DigestJob(
+        repository,
+        ai_service.request_daily_digest,
+        Config.DEFAULT_TIMEZONE,
+        Config.DIGEST_JOB_BATCH_SIZE,
+        concurrency or Config.DIGEST_JOB_CONCURRENCY,
+        # Background budget: the global bucket is shared with the web workers
+        allow=lambda user_id: ai_limiter.allow(user_id, background=True)
+    )
+    report = job.run()
+    latency = report['latency_ms']
+    print(f"Scanned {report['users']} users: {report['generated']} digests generated, "
+          f"{report['unchanged']} unchanged, {report['failed']} failed, "
+          f"{report['throttled']} left for the next run by the AI budget, in {report['seconds']}s "
+          f"({report['users_per_second']} active users/s; per-user latency p50 {latency['p50']} ms, "
+          f"p95 {latency['p95']} ms, max {latency['max']} ms)")
+
+if Config.SERVE_FRONTEND:
+    init_static_assets(app, Config.FRONTEND_BUILD_DIR)
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     app.run(debug=False, host='0.0.0.0', port=port)
\ No newline at end of file
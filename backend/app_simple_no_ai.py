@@ -1,28 +1,33 @@
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from flask_pymongo import PyMongo
-from datetime import datetime, timedelta
+from datetime import datetime
 import uuid
 import os
 from config import Config
+from repository import create_repository
+from activity_calendar import day_number
+from timezones import TimezoneCache, local_today
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Initialize extensions
 CORS(app)
-mongo = PyMongo(app)
+repository = create_repository(app, Config)
 
 # Default user ID for single-user app
 DEFAULT_USER_ID = "default_user_123"
 
+timezones = TimezoneCache(Config.DEFAULT_TIMEZONE)
+
+def user_today():
+    """The user's local date"""
+    return local_today(timezones.get(DEFAULT_USER_ID, repository.user_timezone))
+
 # Routes
 @app.route('/api/tasks', methods=['GET'])
 def get_tasks():
-    tasks = list(mongo.db.tasks.find({
-        'user_id': DEFAULT_USER_ID,
-        'date': datetime.now().strftime('%Y-%m-%d')
-    }))
+    tasks = repository.find_tasks(DEFAULT_USER_ID, day_number(user_today()))
     
     # Convert ObjectId to string for JSON serialization
     for task in tasks:
@@ -33,6 +38,7 @@ def get_tasks():
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
     data = request.get_json()
+    today = user_today()
     
     task = {
         'task_id': str(uuid.uuid4()),
@@ -43,53 +49,33 @@ def create_task():
         'estimated_duration': data.get('estimated_duration', 30),  # minutes
         'status': 'pending',
         'created_at': datetime.utcnow(),
-        'date': datetime.now().strftime('%Y-%m-%d'),
+        'day': day_number(today),
+        'date': today.isoformat(),
         'micro_steps': data.get('micro_steps', []),
         'points_value': data.get('points_value', 10)
     }
     
-    mongo.db.tasks.insert_one(task)
+    repository.insert_task(task)
     task['_id'] = str(task['_id'])
     
     return jsonify(task), 201
 
 @app.route('/api/tasks/<task_id>/complete', methods=['POST'])
 def complete_task(task_id):
-    task = mongo.db.tasks.find_one({
-        'task_id': task_id,
-        'user_id': DEFAULT_USER_ID
-    })
+    task = repository.find_task(DEFAULT_USER_ID, task_id)
     
     if not task:
         return jsonify({'message': 'Task not found!'}), 404
     
     # Update task status
-    mongo.db.tasks.update_one(
-        {'task_id': task_id},
-        {'$set': {'status': 'completed', 'completed_at': datetime.utcnow()}}
-    )
+    repository.update_task(task_id, {'status': 'completed', 'completed_at': datetime.utcnow()})
     
     # Update user stats
     points_earned = task.get('points_value', 10)
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-    if not user_stats:
-        user_stats = {
-            'user_id': DEFAULT_USER_ID,
-            'total_points': 0,
-            'streak': 0,
-            'total_tasks': 0,
-            'completed_tasks': 0
-        }
-        mongo.db.user_stats.insert_one(user_stats)
+    repository.ensure_stats(DEFAULT_USER_ID)
     
     # Update stats
-    mongo.db.user_stats.update_one(
-        {'user_id': DEFAULT_USER_ID},
-        {'$inc': {
-            'total_points': points_earned,
-            'completed_tasks': 1
-        }}
-    )
+    repository.record_completion(DEFAULT_USER_ID, points_earned, user_today())
     
     # Check for streak update
     update_streak()
@@ -125,22 +111,16 @@ def get_nudge():
         'timestamp': datetime.utcnow(),
         'data': {'nudge': nudge}
     }
-    mongo.db.activities.insert_one(activity)
+    repository.insert_activity(activity)
     
     return jsonify({'nudge': nudge})
 
 @app.route('/api/daily-digest', methods=['GET'])
 def get_daily_digest():
-    today = datetime.now().strftime('%Y-%m-%d')
-    
     # Get today's data
-    completed_tasks = list(mongo.db.tasks.find({
-        'user_id': DEFAULT_USER_ID,
-        'date': today,
-        'status': 'completed'
-    }))
+    completed_tasks = repository.find_tasks(DEFAULT_USER_ID, day_number(user_today()), status='completed')
     
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
+    user_stats = repository.find_stats(DEFAULT_USER_ID)
     if not user_stats:
         user_stats = {'streak': 0, 'total_points': 0}
     
@@ -153,29 +133,13 @@ def get_daily_digest():
 @app.route('/api/user/stats', methods=['GET'])
 def get_user_stats():
     # Get user statistics
-    user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-    if not user_stats:
-        user_stats = {
-            'user_id': DEFAULT_USER_ID,
-            'total_points': 0,
-            'streak': 0,
-            'total_tasks': 0,
-            'completed_tasks': 0
-        }
-        mongo.db.user_stats.insert_one(user_stats)
-    
-    total_tasks = mongo.db.tasks.count_documents({'user_id': DEFAULT_USER_ID})
-    completed_tasks = mongo.db.tasks.count_documents({
-        'user_id': DEFAULT_USER_ID,
-        'status': 'completed'
-    })
+    user_stats = repository.ensure_stats(DEFAULT_USER_ID)
     
-    # Get weekly progress
-    week_ago = datetime.now() - timedelta(days=7)
-    weekly_tasks = mongo.db.tasks.count_documents({
-        'user_id': DEFAULT_USER_ID,
-        'created_at': {'$gte': week_ago}
-    })
+    total_tasks = repository.count_tasks(DEFAULT_USER_ID)
+    completed_tasks = repository.count_tasks(DEFAULT_USER_ID, status='completed')
+    
+    # Get weekly progress (today and the six days before)
+    weekly_tasks = repository.count_tasks(DEFAULT_USER_ID, since_day=day_number(user_today()) - 6)
     
     completion_rate = (completed_tasks / total_tasks * 100) if total_tasks > 0 else 0
     
@@ -190,41 +154,23 @@ def get_user_stats():
 
 def update_streak():
     """Update user streak based on daily activity"""
-    today = datetime.now().strftime('%Y-%m-%d')
-    yesterday = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+    today = day_number(user_today())
     
     # Check if user completed tasks today
-    today_completed = mongo.db.tasks.count_documents({
-        'user_id': DEFAULT_USER_ID,
-        'date': today,
-        'status': 'completed'
-    })
+    today_completed = repository.count_tasks(DEFAULT_USER_ID, day=today, status='completed')
     
     if today_completed > 0:
         # Check if user had activity yesterday
-        yesterday_completed = mongo.db.tasks.count_documents({
-            'user_id': DEFAULT_USER_ID,
-            'date': yesterday,
-            'status': 'completed'
-        })
+        yesterday_completed = repository.count_tasks(DEFAULT_USER_ID, day=today - 1, status='completed')
         
-        user_stats = mongo.db.user_stats.find_one({'user_id': DEFAULT_USER_ID})
-        if not user_stats:
-            user_stats = {'user_id': DEFAULT_USER_ID, 'streak': 0}
-            mongo.db.user_stats.insert_one(user_stats)
+        repository.ensure_stats(DEFAULT_USER_ID)
         
         if yesterday_completed > 0:
             # Increment streak
-            mongo.db.user_stats.update_one(
-                {'user_id': DEFAULT_USER_ID},
-                {'$inc': {'streak': 1}}
-            )
+            repository.increment_streak(DEFAULT_USER_ID)
         else:
             # Reset streak to 1
-            mongo.db.user_stats.update_one(
-                {'user_id': DEFAULT_USER_ID},
-                {'$set': {'streak': 1}}
-            )
+            repository.set_streak(DEFAULT_USER_ID, 1)
 
 @app.route('/api/health', methods=['GET'])
 def health_check():
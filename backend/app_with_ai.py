@@ -4,8 +4,8 @@ from flask_pymongo import PyMongo
 from datetime import datetime, timedelta
 import uuid
 import os
-import openai
 from config import Config
+from llm_client import create_llm_client
 
 app = Flask(__name__)
 app.config.from_object(Config)
@@ -14,8 +14,8 @@ app.config.from_object(Config)
 CORS(app)
 mongo = PyMongo(app)
 
-# Initialize OpenAI with your API key
-openai.api_key = Config.OPENAI_API_KEY
+# Shared OpenAI client with a pooled keep-alive HTTP session
+llm_client = create_llm_client()
 
 # Default user ID for single-user app
 DEFAULT_USER_ID = "default_user_123"
@@ -36,7 +36,7 @@ def generate_ai_nudge(user_context):
         Keep the response under 100 words, make it personal and encouraging.
         """
         
-        response = openai.ChatCompletion.create(
+        response = llm_client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a supportive AI coach that helps people stay focused and motivated. You provide gentle, encouraging nudges to help users take small steps toward their goals. Keep responses under 100 words and make them feel personal and conversational."},
@@ -56,7 +56,7 @@ def generate_ai_celebration(achievement, streak_count):
     try:
         prompt = f"Generate a short, enthusiastic celebration message for someone who just achieved: {achievement}. They have a {streak_count}-day streak. Make it feel exciting and motivating!"
         
-        response = openai.ChatCompletion.create(
+        response = llm_client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are an enthusiastic AI coach that celebrates user achievements. Create short, exciting celebration messages with emojis that make users feel proud and motivated to continue."},
@@ -84,7 +84,7 @@ def generate_ai_digest(user_data):
         Write an encouraging, story-like summary of their day that celebrates their progress and motivates them for tomorrow.
         """
         
-        response = openai.ChatCompletion.create(
+        response = llm_client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a friendly AI that creates engaging daily digest stories. Write a short, encouraging narrative about the user's day, highlighting their achievements and progress. Make it feel like a personal journal entry that celebrates their wins."},
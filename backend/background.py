@@ -0,0 +1,27 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from metrics import metrics
+
+
+class BackgroundRunner:
+    """
+    Small thread pool for work that should not hold up the response, such
+    as AI generations whose result is pushed or stored later. Failures are
+    logged and counted instead of being lost with the future.
+    """
+
+    def __init__(self, max_workers: int):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='background')
+
+    def submit(self, name: str, fn, *args, **kwargs) -> Future:
+        def run():
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                metrics.inc(f'background.{name}.failed')
+                print(f"Background job {name} failed: {e}")
+            finally:
+                metrics.inc(f'background.{name}.finished')
+
+        metrics.inc(f'background.{name}.submitted')
+        return self._executor.submit(run)
@@ -0,0 +1,103 @@
+"""
+Deterministic AIService benchmark on recorded LLM traffic.
+
+Record the workload once against the live API:
+
+    python bench_ai.py --record --cassette ai_workload.ndjson
+
+then replay it as often as needed with no network, at the recorded
+latency or scaled (--scale 0.1 runs ten times faster):
+
+    python bench_ai.py --cassette ai_workload.ndjson
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from statistics import median
+
+from ai_service import AIService
+from cassette import Cassette, CassetteClient
+from config import Config
+from llm_cache import LLMCache
+from llm_client import create_llm_client
+
+MOODS = ('positive', 'neutral', 'negative')
+TITLES = ('Write report', 'Go for a run', 'Reply to emails', 'Read 10 pages', 'Plan tomorrow')
+
+
+def workload(users):
+    """The AI calls a burst of users makes; many share a prompt, like real traffic"""
+    calls = []
+    for i in range(users):
+        title = TITLES[i % len(TITLES)]
+        streak = i % 4
+        calls.append(('generate_micro_nudge', ({
+            'current_task': title,
+            'mood': MOODS[i % len(MOODS)],
+            'streak': streak,
+            'last_activity': 'nudge_generated'
+        },)))
+        calls.append(('generate_celebration_message', (title, streak)))
+        calls.append(('analyze_mood_from_text', (f"Feeling {MOODS[i % len(MOODS)]} about {title.lower()}",)))
+        calls.append(('generate_micro_steps', (title,)))
+    return calls
+
+
+def run(service, calls, concurrency):
+    latencies = []
+
+    def timed(call):
+        method, args = call
+        started = time.perf_counter()
+        getattr(service, method)(*args)
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(timed, calls))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'calls': len(calls),
+        'seconds': elapsed,
+        'throughput': len(calls) / elapsed,
+        'p50_ms': median(latencies) * 1000,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000
+    }
+
+
+def bench(cassette_path, users, concurrency, scale, record):
+    calls = workload(users)
+    Config.LLM_CACHE_ENABLED = False
+
+    if record:
+        client = CassetteClient(create_llm_client(), Cassette(cassette_path, 'record'))
+        result = run(AIService(client), calls, concurrency)
+        print(f"Recorded {result['calls']} calls to {cassette_path} in {result['seconds']:.1f}s")
+        return
+
+    print(f"Replaying {len(calls)} calls from {cassette_path}, latency x{scale}, {concurrency} threads")
+    with tempfile.TemporaryDirectory() as tmp:
+        variants = [
+            ('coalescing only', None),
+            ('with disk cache', LLMCache(os.path.join(tmp, 'llm_cache.db')))
+        ]
+        for label, cache in variants:
+            client = CassetteClient(None, Cassette(cassette_path, 'replay', scale))
+            result = run(AIService(client, cache=cache), calls, concurrency)
+            print(f"  {label:16} {result['throughput']:8.1f} calls/s  "
+                  f"p50 {result['p50_ms']:7.1f} ms  p95 {result['p95_ms']:7.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cassette', default=Config.LLM_CASSETTE_PATH)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply recorded latency')
+    parser.add_argument('--record', action='store_true', help='call the live API and record')
+    args = parser.parse_args()
+    bench(args.cassette, args.users, args.concurrency, args.scale, args.record)
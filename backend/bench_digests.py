@@ -0,0 +1,99 @@
+"""
+Throughput of the nightly digest job.
+
+Fills a scratch SQLite database with --users users, --active of them with
+tasks today, and runs the job with a stand-in for the AI call that sleeps
+--latency-ms, at each --concurrency. Every run starts from an empty digest
+table; a final run shows the cost of a pass where nothing changed:
+
+    python bench_digests.py --users 100000 --active 20000 --latency-ms 800 --concurrency 1 8 32
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+from activity_calendar import day_number
+from digests import DigestJob
+from repository import SQLiteRepository
+from timezones import resolve_timezone
+
+ZONES = ('UTC', 'America/New_York', 'Europe/Berlin', 'Asia/Tokyo', 'Pacific/Kiritimati', 'Pacific/Pago_Pago')
+
+
+def fill(repository, users, active, tasks_per_user):
+    now = datetime.now(timezone.utc)
+    stride = max(users // active, 1)
+    tasks = []
+    for i in range(users):
+        user_id = f'user_{i}'
+        zone = ZONES[i % len(ZONES)]
+        repository.set_timezone(user_id, zone)
+        repository.set_streak(user_id, i % 30)
+        if i % stride or i // stride >= active:
+            continue
+        day = day_number(now.astimezone(resolve_timezone(zone)).date())
+        for j in range(tasks_per_user):
+            tasks.append({
+                'task_id': str(uuid.uuid4()),
+                'user_id': user_id,
+                'title': f'Task {j}',
+                'description': '',
+                'priority': 'medium',
+                'estimated_duration': 30,
+                'status': 'completed' if j % 2 else 'pending',
+                'created_at': datetime.utcnow(),
+                'day': day,
+                'micro_steps': [],
+                'points_value': 10
+            })
+        if len(tasks) >= 5000:
+            repository.insert_tasks(tasks)
+            tasks = []
+    if tasks:
+        repository.insert_tasks(tasks)
+
+
+def fake_ai(latency_ms):
+    def generate(user_data):
+        # AI response times vary; +-50% around the mean
+        time.sleep(latency_ms / 1000 * random.uniform(0.5, 1.5))
+        return f"You completed {len(user_data['completed_tasks'])} tasks today."
+    return generate
+
+
+def report(label, result):
+    latency = result['latency_ms']
+    print(f"{label:16} {result['active']:7d} active  {result['generated']:7d} generated  "
+          f"{result['seconds']:8.2f}s  {result['users_per_second']:9.1f} users/s  "
+          f"latency p50 {latency['p50']:7.1f} ms  p95 {latency['p95']:7.1f} ms")
+
+
+def bench(args, workdir):
+    repository = SQLiteRepository(os.path.join(workdir, 'digests.db'))
+    started = time.perf_counter()
+    fill(repository, args.users, args.active, args.tasks)
+    print(f"Filled {args.users} users in {time.perf_counter() - started:.1f}s")
+
+    for concurrency in args.concurrency:
+        repository._conn().execute('DELETE FROM daily_digests')
+        job = DigestJob(repository, fake_ai(args.latency_ms), batch_size=args.batch_size, concurrency=concurrency)
+        report(f"concurrency {concurrency}", job.run())
+    report('unchanged', job.run())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--active', type=int, default=2000)
+    parser.add_argument('--tasks', type=int, default=4, help='tasks today per active user')
+    parser.add_argument('--latency-ms', type=float, default=200)
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bench(args, workdir)
@@ -0,0 +1,85 @@
+"""
+Task search latency on one user with many tasks.
+
+Fills a scratch SQLite database with --tasks tasks (100k by default),
+builds the user's search index from it and times a mix of queries:
+
+    python bench_search.py --tasks 100000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+from statistics import median
+
+from activity_calendar import day_number
+from repository import SQLiteRepository
+from search_index import SearchIndex
+
+USER_ID = 'bench_user'
+VERBS = ('write', 'review', 'call', 'email', 'plan', 'read', 'clean', 'fix', 'prepare', 'organize',
+         'draft', 'update', 'schedule', 'research', 'practice', 'finish', 'start', 'book', 'pay', 'buy')
+OBJECTS = ('report', 'slides', 'budget', 'kitchen', 'garage', 'invoice', 'proposal', 'chapter',
+           'newsletter', 'dentist', 'flights', 'groceries', 'resume', 'taxes', 'presentation',
+           'database', 'garden', 'workout', 'guitar', 'spanish', 'meeting', 'blog', 'roadmap')
+QUERIES = ('report', 'review budget', 'pres', 'email invoice', 'write blog', 'gui', 'spanish practice',
+           'roadmap q3', 'fix data', 'schedule dentist')
+
+
+def fill(repository, tasks, batch_size=1000):
+    rng = random.Random(42)
+    start = datetime.utcnow() - timedelta(days=tasks // 20 + 1)
+    batch = []
+    for i in range(tasks):
+        created_at = start + timedelta(minutes=i * 72)
+        batch.append({
+            'task_id': str(uuid.uuid4()),
+            'user_id': USER_ID,
+            'title': f"{rng.choice(VERBS).title()} {rng.choice(OBJECTS)} {rng.choice(('', 'q3', 'draft', 'v2', 'today'))}",
+            'description': ' '.join(rng.choice(VERBS + OBJECTS) for _ in range(rng.randint(0, 8))),
+            'priority': 'medium',
+            'estimated_duration': 30,
+            'status': 'completed',
+            'created_at': created_at,
+            'day': day_number(created_at.date()),
+            'micro_steps': [],
+            'points_value': 10
+        })
+        if len(batch) >= batch_size:
+            repository.insert_tasks(batch)
+            batch = []
+    if batch:
+        repository.insert_tasks(batch)
+
+
+def bench(tasks, rounds, workdir):
+    repository = SQLiteRepository(os.path.join(workdir, 'search.db'))
+    fill(repository, tasks)
+    index = SearchIndex(repository, refresh_seconds=3600)
+
+    started = time.perf_counter()
+    index.search(USER_ID, 'warm up')
+    print(f"Built index of {tasks} tasks in {time.perf_counter() - started:.2f}s")
+
+    for query in QUERIES:
+        latencies = []
+        for _ in range(rounds):
+            started = time.perf_counter()
+            results = index.search(USER_ID, query)
+            latencies.append((time.perf_counter() - started) * 1000)
+        latencies.sort()
+        print(f"  {query!r:22} {len(results):3d} results  p50 {median(latencies):6.2f} ms  "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1]:6.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=100_000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        bench(args.tasks, args.rounds, workdir)
@@ -0,0 +1,55 @@
+import timeit
+import uuid
+from datetime import datetime
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from json_provider import FastJSONProvider
+
+
+def make_tasks(count):
+    """Task documents shaped like what the tasks collection returns"""
+    return [{
+        '_id': ObjectId(),
+        'task_id': str(uuid.uuid4()),
+        'user_id': 'default_user_123',
+        'title': f'Micro-step number {i}',
+        'description': 'Break the work into something you can finish in ten minutes',
+        'priority': 'medium',
+        'estimated_duration': 30,
+        'status': 'pending' if i % 3 else 'completed',
+        'created_at': datetime.utcnow(),
+        'completed_at': datetime.utcnow(),
+        'date': datetime.now().strftime('%Y-%m-%d'),
+        'micro_steps': ['open the doc', 'write one line', 'take a breath'],
+        'points_value': 10
+    } for i in range(count)]
+
+
+def bench(count=500, repeat=200):
+    app = Flask(__name__)
+    default_provider = DefaultJSONProvider(app)
+    fast_provider = FastJSONProvider(app)
+    tasks = make_tasks(count)
+
+    def with_default():
+        # What routes had to do before: stringify _id on every document first
+        for task in tasks:
+            task['_id'] = str(task['_id'])
+        default_provider.dumps(tasks)
+
+    def with_fast():
+        fast_provider.dumps(tasks)
+
+    print(f"Serializing {count} tasks, best of 5 x {repeat} runs")
+    with app.app_context():
+        fast = min(timeit.repeat(with_fast, number=repeat, repeat=5)) / repeat
+        default = min(timeit.repeat(with_default, number=repeat, repeat=5)) / repeat
+    print(f"  default provider: {default * 1e6:9.1f} us")
+    print(f"  orjson provider:  {fast * 1e6:9.1f} us  ({default / fast:.1f}x faster)")
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,113 @@
+"""
+Throughput of the streaming NDJSON export/import on one large user.
+
+Fills a scratch SQLite database with --docs tasks and activities (10M by
+default), exports them to a file, imports that file into a second
+database, and reports documents per second and peak memory, which should
+stay flat however many documents there are:
+
+    python bench_transfer.py --docs 10000000 --gzip
+"""
+import argparse
+import os
+import resource
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from activity_calendar import day_number
+from repository import SQLiteRepository
+from transfer import export_user, gzip_chunks, import_user, open_lines
+
+USER_ID = 'bench_user'
+
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def fill(repository, docs, batch_size):
+    """docs documents for USER_ID, four tasks to every activity"""
+    start = datetime.utcnow() - timedelta(days=docs // 40 + 1)
+    tasks, activities = [], []
+    for i in range(docs):
+        created_at = start + timedelta(seconds=i * 2)
+        if i % 5 == 4:
+            activities.append({
+                'activity_id': str(uuid.uuid4()),
+                'user_id': USER_ID,
+                'activity': 'nudge_generated',
+                'timestamp': created_at,
+                'data': {'nudge': 'Two minutes on the first step is all it takes.'}
+            })
+        else:
+            tasks.append({
+                'task_id': str(uuid.uuid4()),
+                'user_id': USER_ID,
+                'title': f'Task {i}',
+                'description': 'Benchmark task' if i % 3 else '',
+                'priority': ('low', 'medium', 'high')[i % 3],
+                'estimated_duration': 30,
+                'status': 'completed' if i % 2 else 'pending',
+                'created_at': created_at,
+                'day': day_number(created_at.date()),
+                'micro_steps': ['Open the file', 'Write one line'] if i % 4 == 0 else [],
+                'points_value': 10
+            })
+        if len(tasks) >= batch_size:
+            repository.insert_tasks(tasks)
+            tasks = []
+        if len(activities) >= batch_size:
+            repository.insert_activities(activities)
+            activities = []
+    if tasks:
+        repository.insert_tasks(tasks)
+    if activities:
+        repository.insert_activities(activities)
+    repository.ensure_stats(USER_ID)
+
+
+def bench(docs, batch_size, compress, workdir):
+    source = SQLiteRepository(os.path.join(workdir, 'source.db'))
+    target = SQLiteRepository(os.path.join(workdir, 'target.db'))
+    path = os.path.join(workdir, 'export.ndjson' + ('.gz' if compress else ''))
+
+    started = time.perf_counter()
+    fill(source, docs, batch_size)
+    print(f"Filled {docs} documents in {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    chunks = export_user(source, USER_ID, batch_size)
+    if compress:
+        chunks = gzip_chunks(chunks)
+    with open(path, 'wb') as f:
+        for chunk in chunks:
+            f.write(chunk)
+    elapsed = time.perf_counter() - started
+    size_mb = os.path.getsize(path) / 1024 / 1024
+    print(f"Export  {docs / elapsed:10.0f} docs/s  {size_mb / elapsed:7.1f} MB/s  "
+          f"{size_mb:8.1f} MB  peak RSS {peak_rss_mb():.0f} MB")
+
+    started = time.perf_counter()
+    with open(path, 'rb') as f:
+        counts = import_user(target, open_lines(f), batch_size)
+    elapsed = time.perf_counter() - started
+    imported = counts['tasks'] + counts['activities']
+    print(f"Import  {imported / elapsed:10.0f} docs/s  {size_mb / elapsed:7.1f} MB/s  "
+          f"{imported:8d} docs  peak RSS {peak_rss_mb():.0f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=10_000_000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--gzip', action='store_true', help='gzip the export file')
+    parser.add_argument('--dir', default=None, help='scratch directory (default: a temporary one)')
+    args = parser.parse_args()
+
+    if args.dir:
+        bench(args.docs, args.batch_size, args.gzip, args.dir)
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            bench(args.docs, args.batch_size, args.gzip, workdir)
@@ -0,0 +1,216 @@
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+# Replay falls back to matching on these when the exact prompt differs, e.g.
+# nudge prompts that embed the current time
+LOOSE_FIELDS = ('model', 'max_tokens', 'stream')
+
+
+class CassetteMiss(Exception):
+    """Replay found no recorded response for a request"""
+
+
+def _request_key(request: Dict) -> str:
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _loose_key(request: Dict) -> str:
+    system = next((m['content'] for m in request.get('messages', []) if m.get('role') == 'system'), '')
+    return _request_key(dict({field: request.get(field) for field in LOOSE_FIELDS}, system=system))
+
+
+class Cassette:
+    """
+    NDJSON file of recorded chat completion requests and responses.
+
+    Each line holds the request, the response text (or the text chunks of a
+    streamed response with their arrival offsets) and the time it took.
+    In replay, identical requests are served in the order they were
+    recorded. A request with no exact match gets the next recording with
+    the same model, max_tokens and system prompt. Recorded latency is
+    reproduced, multiplied by latency_scale (0 replays instantly).
+    """
+
+    def __init__(self, path: str, mode: str, latency_scale: float = 1.0):
+        if mode not in ('record', 'replay'):
+            raise ValueError(f"Unknown cassette mode: {mode}")
+        self.path = path
+        self.mode = mode
+        self.latency_scale = latency_scale
+        self._lock = threading.Lock()
+        self._exact = defaultdict(list)
+        self._loose = defaultdict(list)
+        self._positions = defaultdict(int)
+        self._file = None
+        if mode == 'replay':
+            self._load()
+        else:
+            self._file = open(path, 'a', encoding='utf-8')
+
+    def _load(self) -> None:
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._exact[_request_key(entry['request'])].append(entry)
+                    self._loose[_loose_key(entry['request'])].append(entry)
+
+    def record(self, request: Dict, entry: Dict) -> None:
+        line = json.dumps(dict(entry, request=request), ensure_ascii=False)
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+    def _next(self, index: Dict[str, List[Dict]], key: str) -> Optional[Dict]:
+        entries = index.get(key)
+        if not entries:
+            return None
+        position = self._positions[id(index), key]
+        self._positions[id(index), key] = position + 1
+        # Past the end, keep cycling through what was recorded
+        return entries[position % len(entries)]
+
+    def lookup(self, request: Dict) -> Dict:
+        with self._lock:
+            entry = self._next(self._exact, _request_key(request))
+            if entry is None:
+                entry = self._next(self._loose, _loose_key(request))
+        if entry is None:
+            raise CassetteMiss(f"No recording for {request.get('model')} request")
+        return entry
+
+    def sleep(self, seconds: float) -> None:
+        if seconds > 0 and self.latency_scale > 0:
+            time.sleep(seconds * self.latency_scale)
+
+
+class _Message:
+    def __init__(self, content):
+        self.content = content
+        self.role = 'assistant'
+
+
+class _Choice:
+    def __init__(self, content, streamed: bool):
+        if streamed:
+            self.delta = _Message(content)
+        else:
+            self.message = _Message(content)
+        self.index = 0
+        self.finish_reason = None if streamed else 'stop'
+
+
+class _Response:
+    def __init__(self, content, model, streamed=False):
+        self.choices = [_Choice(content, streamed)]
+        self.model = model
+
+
+class _NoConnection:
+    """Stands in for the HTTP response and model list when replaying"""
+
+    def close(self):
+        pass
+
+    def list(self):
+        return []
+
+
+class _ReplayStream:
+    """Iterates recorded chunks with their original spacing"""
+
+    def __init__(self, cassette: Cassette, entry: Dict):
+        self._cassette = cassette
+        self._entry = entry
+        self.response = _NoConnection()
+
+    def __iter__(self):
+        elapsed = 0.0
+        for offset, content in self._entry['chunks']:
+            self._cassette.sleep(offset - elapsed)
+            elapsed = offset
+            yield _Response(content, self._entry['request']['model'], streamed=True)
+
+
+class _RecordingStream:
+    """Passes a live stream through while noting each chunk's arrival"""
+
+    def __init__(self, cassette: Cassette, request: Dict, stream, started: float):
+        self._cassette = cassette
+        self._request = request
+        self._stream = stream
+        self._started = started
+        self.response = stream.response
+
+    def __iter__(self):
+        chunks = []
+        for chunk in self._stream:
+            content = chunk.choices[0].delta.content if chunk.choices else None
+            if content:
+                chunks.append((round(time.monotonic() - self._started, 4), content))
+            yield chunk
+        self._cassette.record(self._request, {
+            'chunks': chunks,
+            'latency': round(time.monotonic() - self._started, 4)
+        })
+
+
+class _Completions:
+    def __init__(self, client, cassette: Cassette):
+        self._client = client
+        self._cassette = cassette
+
+    def create(self, **kwargs):
+        request = {key: kwargs[key] for key in ('model', 'messages', 'max_tokens', 'temperature') if key in kwargs}
+        request['stream'] = bool(kwargs.get('stream'))
+
+        if self._cassette.mode == 'replay':
+            entry = self._cassette.lookup(request)
+            if request['stream']:
+                return _ReplayStream(self._cassette, entry)
+            self._cassette.sleep(entry['latency'])
+            return _Response(entry['content'], request['model'])
+
+        started = time.monotonic()
+        response = self._client.chat.completions.create(**kwargs)
+        if request['stream']:
+            return _RecordingStream(self._cassette, request, response, started)
+        self._cassette.record(request, {
+            'content': response.choices[0].message.content,
+            'latency': round(time.monotonic() - started, 4)
+        })
+        return response
+
+
+class _Chat:
+    def __init__(self, completions: _Completions):
+        self.completions = completions
+
+
+class CassetteClient:
+    """
+    Stand-in for openai.OpenAI that records chat completions to a cassette,
+    or replays them from one without touching the network
+    """
+
+    def __init__(self, client, cassette: Cassette):
+        self._client = client
+        self.cassette = cassette
+        self.chat = _Chat(_Completions(client, cassette))
+
+    @property
+    def models(self):
+        # Warm-up lists models; a replay needs no connection to warm
+        if self.cassette.mode == 'replay':
+            return _NoConnection()
+        return self._client.models
+
+    def with_options(self, **kwargs) -> 'CassetteClient':
+        if self.cassette.mode == 'replay':
+            return self
+        return CassetteClient(self._client.with_options(**kwargs), self.cassette)
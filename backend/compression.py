@@ -0,0 +1,57 @@
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _accepted(accept_encoding: str, encoding: str) -> bool:
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if name.strip().lower() == encoding:
+            return params.replace(' ', '') != 'q=0'
+    return False
+
+
+def choose_encoding(accept_encoding: str):
+    """Best encoding the client accepts: brotli when available, then gzip"""
+    if brotli is not None and _accepted(accept_encoding, 'br'):
+        return 'br'
+    if _accepted(accept_encoding, 'gzip'):
+        return 'gzip'
+    return None
+
+
+def compress(data: bytes, encoding: str, level: int) -> bytes:
+    if encoding == 'br':
+        # Brotli quality runs 0-11; map the gzip-style level onto it
+        return brotli.compress(data, quality=min(11, level + 2))
+    return gzip.compress(data, compresslevel=level)
+
+
+def init_compression(app, min_bytes: int, level: int) -> None:
+    """Compress large JSON responses (task lists, digests) after each request"""
+
+    @app.after_request
+    def compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or response.mimetype != 'application/json'):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        data = response.get_data()
+        if len(data) < min_bytes:
+            return response
+
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+
+        response.set_data(compress(data, encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        return response
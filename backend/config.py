@@ -1,4 +1,6 @@
+import json
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -10,6 +12,23 @@ class Config:
     # MongoDB Configuration
     MONGODB_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/micro_motivation_db')
     MONGO_URI = os.getenv('MONGODB_URI', 'mongodb://localhost:27017/micro_motivation_db')
+    MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', 5))
+    MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', 50))
+    
+    # Storage Configuration ('mongo' or 'sqlite')
+    STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'mongo')
+    SQLITE_PATH = os.getenv('SQLITE_PATH', 'micro_motivation.db')
+    
+    # user_stats Cache Configuration (shared invalidation file for all workers on a host)
+    STATS_CACHE_ENABLED = os.getenv('STATS_CACHE_ENABLED', 'true').lower() == 'true'
+    STATS_CACHE_CHANNEL_PATH = os.getenv('STATS_CACHE_CHANNEL_PATH', os.path.join(tempfile.gettempdir(), 'micro_motivation_stats.versions'))
+    STATS_CACHE_MAX_ENTRIES = int(os.getenv('STATS_CACHE_MAX_ENTRIES', 10000))
+    
+    # Hot Stats Segment (shared-memory user_stats and daily counters for all workers on a host; replaces the stats cache)
+    HOT_STATS_ENABLED = os.getenv('HOT_STATS_ENABLED', 'false').lower() == 'true'
+    HOT_STATS_PATH = os.getenv('HOT_STATS_PATH', os.path.join(tempfile.gettempdir(), 'micro_motivation_hot_stats'))
+    HOT_STATS_SLOTS = int(os.getenv('HOT_STATS_SLOTS', 65536))
+    HOT_STATS_MAX_AGE_SECONDS = float(os.getenv('HOT_STATS_MAX_AGE_SECONDS', 60))
     
     # Flask Configuration
     SECRET_KEY = os.getenv('FLASK_SECRET_KEY', 'dev-secret-key-change-in-production')
@@ -22,3 +41,113 @@ class Config:
     AI_MODEL = 'gpt-3.5-turbo'
     MAX_TOKENS = 150
     TEMPERATURE = 0.7
+    
+    # LLM HTTP Session Configuration
+    LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 20))
+    LLM_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_KEEPALIVE_CONNECTIONS', 10))
+    LLM_KEEPALIVE_EXPIRY = float(os.getenv('LLM_KEEPALIVE_EXPIRY', 120))
+    LLM_TIMEOUT = float(os.getenv('LLM_TIMEOUT', 30))
+    
+    # Worker Warm-up Configuration
+    WARMUP_LLM_CONNECTIONS = int(os.getenv('WARMUP_LLM_CONNECTIONS', 2))
+    WARMUP_TIMEOUT_SECONDS = float(os.getenv('WARMUP_TIMEOUT_SECONDS', 10))
+    
+    # Leaderboard Configuration
+    LEADERBOARD_REFRESH_SECONDS = int(os.getenv('LEADERBOARD_REFRESH_SECONDS', 300))
+    
+    # AI Rate Limiting (token buckets; user buckets are per worker process,
+    # the global bucket is shared by every worker on the host through this file)
+    AI_USER_RATE_PER_MINUTE = float(os.getenv('AI_USER_RATE_PER_MINUTE', 6))
+    AI_USER_BURST = int(os.getenv('AI_USER_BURST', 3))
+    AI_GLOBAL_RATE_PER_MINUTE = float(os.getenv('AI_GLOBAL_RATE_PER_MINUTE', 120))
+    AI_GLOBAL_BURST = int(os.getenv('AI_GLOBAL_BURST', 20))
+    AI_GLOBAL_BUCKET_PATH = os.getenv('AI_GLOBAL_BUCKET_PATH', os.path.join(tempfile.gettempdir(), 'micro_motivation_ai_global.bucket'))
+    # Background AI work (micro-step generation, speculation) has its own
+    # per-user buckets and only spends global tokens above the reserve
+    AI_BACKGROUND_RATE_PER_MINUTE = float(os.getenv('AI_BACKGROUND_RATE_PER_MINUTE', 6))
+    AI_BACKGROUND_BURST = int(os.getenv('AI_BACKGROUND_BURST', 3))
+    AI_BACKGROUND_GLOBAL_RESERVE = float(os.getenv('AI_BACKGROUND_GLOBAL_RESERVE', 10))
+    
+    # Response Compression (gzip, or brotli when installed)
+    COMPRESS_MIN_BYTES = int(os.getenv('COMPRESS_MIN_BYTES', 1024))
+    COMPRESS_LEVEL = int(os.getenv('COMPRESS_LEVEL', 6))
+    
+    # Server-Sent Events Configuration
+    EVENTS_SOCKET_DIR = os.getenv('EVENTS_SOCKET_DIR', os.path.join(tempfile.gettempdir(), 'micro_motivation_events'))
+    EVENTS_HEARTBEAT_SECONDS = float(os.getenv('EVENTS_HEARTBEAT_SECONDS', 15))
+    EVENTS_MAX_PENDING = int(os.getenv('EVENTS_MAX_PENDING', 100))
+    
+    # Background Jobs Configuration
+    BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', 4))
+    
+    # Dashboard Configuration (reuse a generated nudge for this long)
+    NUDGE_CACHE_MINUTES = int(os.getenv('NUDGE_CACHE_MINUTES', 30))
+    
+    # Frontend Serving (serve the React build from this app, same origin as the API)
+    SERVE_FRONTEND = os.getenv('SERVE_FRONTEND', 'false').lower() == 'true'
+    FRONTEND_BUILD_DIR = os.getenv('FRONTEND_BUILD_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'frontend', 'build'))
+    CORS_MAX_AGE = int(os.getenv('CORS_MAX_AGE', 86400))
+    
+    # AI Model Routing (per task type: candidate models with timeouts, tried fastest healthy first)
+    AI_MODEL_TIERS = json.loads(os.getenv('AI_MODEL_TIERS', 'null')) or {
+        'gpt-3.5-turbo': 1,
+        'gpt-4o-mini': 2,
+        'gpt-4o': 3
+    }
+    AI_ROUTES = json.loads(os.getenv('AI_ROUTES', 'null')) or {
+        'mood': {'min_tier': 1, 'models': [{'model': AI_MODEL, 'timeout': 5}, {'model': 'gpt-4o-mini', 'timeout': 5}]},
+        'nudge': {'min_tier': 1, 'models': [{'model': AI_MODEL, 'timeout': 10}, {'model': 'gpt-4o-mini', 'timeout': 10}]},
+        'celebration': {'min_tier': 1, 'models': [{'model': AI_MODEL, 'timeout': 10}, {'model': 'gpt-4o-mini', 'timeout': 10}]},
+        'micro_steps': {'min_tier': 1, 'models': [{'model': AI_MODEL, 'timeout': 10}, {'model': 'gpt-4o-mini', 'timeout': 10}]},
+        'digest': {'min_tier': 2, 'models': [{'model': 'gpt-4o-mini', 'timeout': 20}, {'model': 'gpt-4o', 'timeout': 30}, {'model': AI_MODEL, 'timeout': 20}]}
+    }
+    AI_ROUTING_WINDOW = int(os.getenv('AI_ROUTING_WINDOW', 50))
+    AI_ROUTING_ERROR_THRESHOLD = float(os.getenv('AI_ROUTING_ERROR_THRESHOLD', 0.5))
+    AI_ROUTING_COOLDOWN_SECONDS = float(os.getenv('AI_ROUTING_COOLDOWN_SECONDS', 30))
+    
+    # Streaming Nudges (fall back to a template after this long without new text)
+    NUDGE_STREAM_STALL_SECONDS = float(os.getenv('NUDGE_STREAM_STALL_SECONDS', 4))
+    
+    # Speculative Celebrations (pre-generate at task creation, reuse at completion if the streak matches)
+    SPECULATIVE_CELEBRATIONS = os.getenv('SPECULATIVE_CELEBRATIONS', 'false').lower() == 'true'
+    CELEBRATION_SPECULATION_HOURS = float(os.getenv('CELEBRATION_SPECULATION_HOURS', 24))
+    
+    # Nudge Scheduler (server-initiated nudges for overdue tasks and inactivity)
+    NUDGE_SCHEDULER_ENABLED = os.getenv('NUDGE_SCHEDULER_ENABLED', 'false').lower() == 'true'
+    NUDGE_INACTIVITY_MINUTES = int(os.getenv('NUDGE_INACTIVITY_MINUTES', 120))
+    NUDGE_SCHEDULER_BATCH_SIZE = int(os.getenv('NUDGE_SCHEDULER_BATCH_SIZE', 100))
+    NUDGE_SCHEDULER_CONCURRENCY = int(os.getenv('NUDGE_SCHEDULER_CONCURRENCY', 4))
+    NUDGE_SCHEDULER_RESYNC_SECONDS = float(os.getenv('NUDGE_SCHEDULER_RESYNC_SECONDS', 300))
+    
+    # Micro-step Decomposition (generate micro_steps for new tasks, cached by normalized title/description)
+    AI_MICRO_STEPS = os.getenv('AI_MICRO_STEPS', 'true').lower() == 'true'
+    
+    # Persistent LLM Response Cache (SQLite file shared by all workers on the host)
+    LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'true').lower() == 'true'
+    LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'llm_cache.db')
+    LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    LLM_CACHE_TTL_HOURS = float(os.getenv('LLM_CACHE_TTL_HOURS', 24))
+    
+    # LLM Record/Replay ('off', 'record' or 'replay'; replay makes no network calls)
+    LLM_CASSETTE_MODE = os.getenv('LLM_CASSETTE_MODE', 'off')
+    LLM_CASSETTE_PATH = os.getenv('LLM_CASSETTE_PATH', 'llm_cassette.ndjson')
+    LLM_CASSETTE_LATENCY_SCALE = float(os.getenv('LLM_CASSETTE_LATENCY_SCALE', 1.0))
+    
+    # Timezone Configuration (IANA name used for users who haven't set one)
+    DEFAULT_TIMEZONE = os.getenv('DEFAULT_TIMEZONE', 'UTC')
+    
+    # Task Schema Migration Configuration (v1 tasks are rewritten as compact v2 in the background)
+    TASK_SCHEMA_MIGRATION_ENABLED = os.getenv('TASK_SCHEMA_MIGRATION_ENABLED', 'true').lower() == 'true'
+    TASK_SCHEMA_MIGRATION_BATCH_SIZE = int(os.getenv('TASK_SCHEMA_MIGRATION_BATCH_SIZE', 500))
+    TASK_SCHEMA_MIGRATION_PAUSE_SECONDS = float(os.getenv('TASK_SCHEMA_MIGRATION_PAUSE_SECONDS', 0.5))
+    
+    # Bulk Import/Export Configuration (documents per cursor batch and per insert)
+    TRANSFER_BATCH_SIZE = int(os.getenv('TRANSFER_BATCH_SIZE', 1000))
+    
+    # Task Search Configuration (per-worker in-memory indexes)
+    SEARCH_INDEX_MAX_USERS = int(os.getenv('SEARCH_INDEX_MAX_USERS', 1000))
+    SEARCH_INDEX_REFRESH_SECONDS = float(os.getenv('SEARCH_INDEX_REFRESH_SECONDS', 5))
+    
+    # Digest Job Configuration
+    DIGEST_JOB_BATCH_SIZE = int(os.getenv('DIGEST_JOB_BATCH_SIZE', 500))
+    DIGEST_JOB_CONCURRENCY = int(os.getenv('DIGEST_JOB_CONCURRENCY', 8))
\ No newline at end of file
@@ -0,0 +1,192 @@
+import hashlib
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+from activity_calendar import day_number
+from timezones import resolve_timezone
+
+# How often a generation waiting on the AI budget asks again
+BUDGET_POLL_SECONDS = 0.5
+
+
+def digest_inputs(completed_tasks: List[Dict], user_stats: Optional[Dict]) -> Dict:
+    """What a user's daily digest is written from"""
+    return {
+        'completed_tasks': [task['title'] for task in completed_tasks],
+        'streak': (user_stats or {}).get('streak', 0),
+        'points_earned': sum(task.get('points_value', 10) for task in completed_tasks),
+        'mood_trend': 'positive'  # Could be calculated from activities
+    }
+
+
+def fingerprint(user_data: Dict) -> str:
+    """Hash of digest inputs; tasks are sorted since backends return them in different orders"""
+    data = dict(user_data, completed_tasks=sorted(user_data['completed_tasks']))
+    return hashlib.sha1(orjson.dumps(data, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class DigestJob:
+    """
+    Precomputes every active user's daily digest, e.g. nightly.
+
+    Users are read from user_stats (which every user who has completed a
+    task has) a page at a time. One query per page
+    fetches their tasks on the days that are "today" somewhere on Earth,
+    narrowed to each user's local today; users without tasks today are
+    skipped, as are those whose stored digest was written from the same
+    inputs. The rest are generated on a bounded thread pool (the work is
+    waiting on the AI API, not the CPU) and stored in batched writes.
+
+    With allow (e.g. the rate limiter's background budget), each generation
+    first waits up to budget_wait seconds for the user's token; users still
+    refused are left for the next run.
+    """
+
+    def __init__(self, repository, generate: Callable[[Dict], str], default_timezone: str = 'UTC',
+                 batch_size: int = 500, concurrency: int = 8,
+                 allow: Optional[Callable[[str], bool]] = None, budget_wait: float = 60):
+        self.repository = repository
+        self.generate = generate
+        self.default_timezone = resolve_timezone(default_timezone)
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.allow = allow
+        self.budget_wait = budget_wait
+
+    def _zone(self, name: Optional[str], zones: Dict):
+        if name not in zones:
+            try:
+                zones[name] = resolve_timezone(name) if name else self.default_timezone
+            except ValueError:
+                zones[name] = self.default_timezone
+        return zones[name]
+
+    def _budget(self, user_id: str) -> bool:
+        """Whether the user's AI call may go ahead, waiting for a token if needed"""
+        if self.allow is None:
+            return True
+        deadline = time.monotonic() + self.budget_wait
+        while not self.allow(user_id):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(BUDGET_POLL_SECONDS)
+        return True
+
+    def _generate(self, user_id: str, user_data: Dict):
+        """(digest or None, seconds taken), or None if the AI budget refused"""
+        if not self._budget(user_id):
+            return None
+        started = time.perf_counter()
+        try:
+            digest = self.generate(user_data)
+        except Exception as e:
+            print(f"Digest generation failed: {e}")
+            digest = None
+        return digest, time.perf_counter() - started
+
+    def _pages(self) -> Iterator[List[Dict]]:
+        page = []
+        for user_stats in self.repository.iter_user_stats(self.batch_size):
+            page.append(user_stats)
+            if len(page) >= self.batch_size:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def _changed(self, page: List[Dict], now: datetime, zones: Dict, report: Dict) -> Iterator[Tuple]:
+        """(user_id, day, fingerprint, inputs) for the page's active users whose digest is out of date"""
+        days = {}
+        for user_stats in page:
+            zone = self._zone(user_stats.get('timezone'), zones)
+            days[user_stats['user_id']] = day_number(now.astimezone(zone).date())
+
+        tasks_today = {}
+        for task in self.repository.find_tasks_for_users(list(days), sorted(set(days.values()))):
+            if task['day'] == days[task['user_id']]:
+                tasks_today.setdefault(task['user_id'], []).append(task)
+        if not tasks_today:
+            return
+        stored = self.repository.find_digests(list(tasks_today))
+
+        for user_stats in page:
+            user_id = user_stats['user_id']
+            if user_id not in tasks_today:
+                continue
+            report['active'] += 1
+            completed = [task for task in tasks_today[user_id] if task['status'] == 'completed']
+            user_data = digest_inputs(completed, user_stats)
+            version = fingerprint(user_data)
+            previous = stored.get(user_id)
+            if previous and previous['day'] == days[user_id] and previous['fingerprint'] == version:
+                report['unchanged'] += 1
+                continue
+            yield user_id, days[user_id], version, user_data
+
+    def _collect(self, pending: Deque, keep: int, report: Dict, latencies: List[float]) -> None:
+        """Store the oldest generations' results until at most keep are pending"""
+        digests = []
+        while len(pending) > keep:
+            user_id, day, version, future = pending.popleft()
+            result = future.result()
+            if result is None:
+                report['throttled'] += 1
+                continue
+            digest, seconds = result
+            latencies.append(seconds)
+            if digest is None:
+                report['failed'] += 1
+                continue
+            digests.append({
+                'user_id': user_id,
+                'day': day,
+                'fingerprint': version,
+                'digest': digest,
+                'generated_at': datetime.utcnow()
+            })
+        if digests:
+            self.repository.save_digests(digests)
+            report['generated'] += len(digests)
+
+    def run(self) -> Dict:
+        """Generate and store digests for every active user; returns throughput and latency figures"""
+        now = datetime.now(timezone.utc)
+        report = {'users': 0, 'active': 0, 'generated': 0, 'unchanged': 0, 'failed': 0, 'throttled': 0}
+        latencies: List[float] = []
+        zones: Dict = {}
+        pending: Deque = deque()
+        started = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix='digest-job') as pool:
+            for page in self._pages():
+                report['users'] += len(page)
+                for user_id, day, version, user_data in self._changed(page, now, zones, report):
+                    pending.append((user_id, day, version, pool.submit(self._generate, user_id, user_data)))
+                # Up to a page of generations stays in flight, so the pool
+                # keeps working while the next page is read
+                self._collect(pending, self.batch_size, report, latencies)
+            self._collect(pending, 0, report, latencies)
+
+        seconds = time.perf_counter() - started
+        report.update({
+            'seconds': round(seconds, 3),
+            'users_per_second': round(report['active'] / seconds, 1) if seconds else 0.0,
+            'latency_ms': {
+                'p50': round(percentile(latencies, 0.50) * 1000, 1),
+                'p95': round(percentile(latencies, 0.95) * 1000, 1),
+                'max': round(max(latencies, default=0.0) * 1000, 1)
+            }
+        })
+        return report
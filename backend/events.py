@@ -0,0 +1,224 @@
+import fcntl
+import mmap
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+import orjson
+
+from gevent_compat import lock_exclusive
+from json_provider import dumps_bytes
+from metrics import metrics
+
+_COUNT = struct.Struct('<q')
+
+# Largest relayed message; the relay reads datagrams into a buffer this size
+MAX_DATAGRAM = 65536
+
+# How long the list of other workers' sockets is reused before re-listing
+# the directory, so workers started since are picked up
+PEERS_TTL_SECONDS = 5
+
+
+class Subscription:
+    """One open event stream; events queue up until the client reads them"""
+
+    def __init__(self, user_id: str, max_pending: int):
+        self.user_id = user_id
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.overflowed = False
+        # Presence counter the stream was counted in, if any
+        self.presence = None
+
+    def get(self, timeout: float) -> Optional[bytes]:
+        """Next encoded event, or None when nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Presence:
+    """
+    Open event streams per user on the host, so any worker can tell whether
+    an event for a user would reach anyone. A memory-mapped file holds one
+    counter per hash slot, changed under a byte-range lock. Collisions, and
+    streams of a worker that died without closing them, only overcount, so
+    a zero is always right.
+    """
+
+    def __init__(self, path: str, slots: int = 65536):
+        self.slots = slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * _COUNT.size
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def _offset(self, user_id: str) -> int:
+        return (zlib.crc32(user_id.encode()) % self.slots) * _COUNT.size
+
+    def add(self, user_id: str, delta: int) -> None:
+        offset = self._offset(user_id)
+        lock_exclusive(self._fd, _COUNT.size, offset)
+        try:
+            count = _COUNT.unpack_from(self._map, offset)[0] + delta
+            _COUNT.pack_into(self._map, offset, max(count, 0))
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _COUNT.size, offset)
+
+    def count(self, user_id: str) -> int:
+        return _COUNT.unpack_from(self._map, self._offset(user_id))[0]
+
+
+def format_event(event_type: str, data) -> bytes:
+    return b'event: ' + event_type.encode() + b'\ndata: ' + dumps_bytes(data) + b'\n\n'
+
+
+class EventBroker:
+    """
+    Per-user fan-out of small change events to Server-Sent Event streams.
+
+    Subscribers are plain queues, so an idle connection costs a queue and a
+    parked greenlet (under the gevent worker) rather than a thread. Events
+    published in one gunicorn worker reach subscribers in the others
+    through a unix datagram socket per worker in a shared directory, read
+    by a single relay thread.
+    """
+
+    def __init__(self, socket_dir: Optional[str] = None, max_pending: int = 100):
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._subscribers = {}
+        self._socket_dir = socket_dir
+        self._socket = None
+        self._socket_path = None
+        self._presence = None
+        self._peers = []
+        self._peers_listed = 0.0
+        self._published = 0
+        self._delivered = 0
+        self._dropped = 0
+        metrics.register('events', self.stats)
+
+    def start_relay(self) -> None:
+        """Bind this worker's socket and start relaying events from the others"""
+        if not self._socket_dir or self._socket is not None:
+            return
+        os.makedirs(self._socket_dir, exist_ok=True)
+        self._presence = Presence(os.path.join(self._socket_dir, 'presence'))
+        self._socket_path = os.path.join(self._socket_dir, f'{os.getpid()}.sock')
+        if os.path.exists(self._socket_path):
+            os.unlink(self._socket_path)
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._socket.bind(self._socket_path)
+        threading.Thread(target=self._relay_loop, name='event-relay', daemon=True).start()
+
+    def _relay_loop(self) -> None:
+        while True:
+            try:
+                message = orjson.loads(self._socket.recv(MAX_DATAGRAM))
+                self._deliver(message['user_id'], message['event'].encode())
+            except Exception as e:
+                print(f"Event relay error: {e}")
+
+    def _peer_paths(self, refresh: bool = False):
+        """Other workers' sockets, re-listed at most every PEERS_TTL_SECONDS unless refresh"""
+        now = time.monotonic()
+        if refresh or now - self._peers_listed > PEERS_TTL_SECONDS:
+            self._peers = [
+                os.path.join(self._socket_dir, name) for name in os.listdir(self._socket_dir)
+                if name.endswith('.sock') and os.path.join(self._socket_dir, name) != self._socket_path
+            ]
+            self._peers_listed = now
+        return self._peers
+
+    def _broadcast(self, user_id: str, event: bytes) -> None:
+        message = orjson.dumps({'user_id': user_id, 'event': event.decode()})
+        if len(message) > MAX_DATAGRAM:
+            # Subscribers in this worker already have it
+            metrics.inc('events.relay_too_large')
+            print(f"Event for {user_id} not relayed to other workers: {len(message)} bytes "
+                  f"exceeds {MAX_DATAGRAM}")
+            return
+        failed = False
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for path in self._peer_paths():
+                try:
+                    sender.sendto(message, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Worker is gone; clean up its socket file
+                    failed = True
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    failed = True
+                    metrics.inc('events.relay_failed')
+                    print(f"Event relay send to {path} failed: {e}")
+        finally:
+            sender.close()
+        if failed:
+            self._peer_paths(refresh=True)
+
+    def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id, self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(user_id, set()).add(subscription)
+            if self._presence is not None:
+                self._presence.add(user_id, 1)
+                subscription.presence = self._presence
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.user_id)
+            if subscribers and subscription in subscribers:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[subscription.user_id]
+                if subscription.presence is not None:
+                    subscription.presence.add(subscription.user_id, -1)
+
+    def has_subscribers(self, user_id: str) -> bool:
+        """Whether the user has an open event stream in any worker on the host"""
+        with self._lock:
+            if user_id in self._subscribers:
+                return True
+        return self._presence is not None and self._presence.count(user_id) > 0
+
+    def _deliver(self, user_id: str, event: bytes) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+                self._delivered += 1
+            except queue.Full:
+                # Slow client: tell it to re-fetch instead of buffering forever
+                subscription.overflowed = True
+                self._dropped += 1
+
+    def publish(self, user_id: str, event_type: str, data: Dict) -> None:
+        event = format_event(event_type, data)
+        self._published += 1
+        self._deliver(user_id, event)
+        if self._socket is not None:
+            self._broadcast(user_id, event)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'connections': sum(len(subscribers) for subscribers in self._subscribers.values()),
+                'users': len(self._subscribers),
+                'published': self._published,
+                'delivered': self._delivered,
+                'dropped': self._dropped
+            }
@@ -0,0 +1,51 @@
+"""
+Helpers for code that must behave the same under gunicorn's gevent worker.
+
+monkey.patch_all() makes threading.local greenlet-local and turns the
+blocking calls gevent knows about into cooperative ones. A per-thread
+SQLite connection would then be opened per greenlet (per request), and a
+blocking fcntl.lockf, which gevent does not patch, would stall every
+greenlet in the worker while another process holds the lock.
+"""
+import errno
+import fcntl
+import sys
+import threading
+import time
+
+
+def _gevent_patched() -> bool:
+    if 'gevent' not in sys.modules:
+        return False
+    from gevent import monkey
+    return monkey.is_module_patched('threading')
+
+
+def thread_local():
+    """
+    A threading.local that stays per OS thread when gevent has patched
+    threading. Greenlets of a worker run on one OS thread and only switch
+    on I/O gevent knows about, never inside a sqlite3 call, so they can
+    share what is stored in it between such calls.
+    """
+    if _gevent_patched():
+        from gevent import monkey
+        return monkey.get_original('_thread', '_local')()
+    return threading.local()
+
+
+def lock_exclusive(fd: int, length: int = 0, start: int = 0) -> None:
+    """fcntl.lockf(fd, LOCK_EX, ...) that yields to other greenlets while waiting under gevent"""
+    if not _gevent_patched():
+        fcntl.lockf(fd, fcntl.LOCK_EX, length, start)
+        return
+    while True:
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB, length, start)
+            return
+        except OSError as e:
+            if e.errno not in (errno.EACCES, errno.EAGAIN):
+                raise
+        # Patched: sleeps this greenlet only. Holders keep the lock for a
+        # few memory reads and writes, so the wait is short.
+        time.sleep(0.0005)
@@ -0,0 +1,22 @@
+import os
+
+# gevent workers park idle /api/events streams on greenlets instead of
+# tying up a thread per open connection
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 5000))
+
+if worker_class == 'gevent':
+    # Patch before the preloaded app imports threading, sockets and queues.
+    # SQLite connections and file locks go through gevent_compat, so they
+    # stay per worker thread and do not block the hub.
+    from gevent import monkey
+    monkey.patch_all()
+
+# Import the app once in the master so workers fork with code already loaded.
+# Connections and background threads are created per worker in post_fork.
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
@@ -0,0 +1,312 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from gevent_compat import lock_exclusive
+from metrics import metrics
+
+# seq, user key, loaded_at, total_points, completed_tasks, total_tasks,
+# streak, day, completed_today, completed_yesterday, created_today, padding.
+# day is the user's local day the daily counters belong to, 0 until loaded
+_RECORD = struct.Struct('<Q16sdqqqiiiiii')
+_SEQ = struct.Struct('<Q')
+
+# Seqlock read attempts before giving up and reading the database
+READ_ATTEMPTS = 100
+
+
+class HotRecord:
+    __slots__ = ('total_points', 'completed_tasks', 'total_tasks', 'streak',
+                 'day', 'completed_today', 'completed_yesterday', 'created_today')
+
+    def __init__(self, total_points, completed_tasks, total_tasks, streak,
+                 day, completed_today, completed_yesterday, created_today):
+        self.total_points = total_points
+        self.completed_tasks = completed_tasks
+        self.total_tasks = total_tasks
+        self.streak = streak
+        self.day = day
+        self.completed_today = completed_today
+        self.completed_yesterday = completed_yesterday
+        self.created_today = created_today
+
+
+class HotStatsSegment:
+    """
+    Fixed-size per-user stats records in a memory-mapped file shared by
+    every worker on the host.
+
+    Records are direct-mapped by a hash of the user id. A colliding user
+    simply takes the slot over, since the database remains the source of
+    truth. Writers are serialized per slot with a byte-range lock. Each
+    write bumps the record's sequence number to odd, rewrites the record
+    and bumps it back to even. Readers take no lock: they retry while the
+    sequence is odd or changed under them (a seqlock), so a read is a
+    couple of memory copies with no system call.
+    """
+
+    def __init__(self, path: str, slots: int = 65536):
+        self.slots = slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * _RECORD.size
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        self._retries = 0
+
+    @staticmethod
+    def key(user_id: str) -> bytes:
+        return hashlib.blake2b(user_id.encode(), digest_size=16).digest()
+
+    def _offset(self, key: bytes) -> int:
+        return self._slot(key) * _RECORD.size
+
+    def _slot(self, key: bytes) -> int:
+        return int.from_bytes(key[:8], 'little') % self.slots
+
+    def slot(self, user_id: str) -> int:
+        """Index of the user's slot; users sharing a slot share its lock"""
+        return self._slot(self.key(user_id))
+
+    @contextmanager
+    def locked(self, user_id: str):
+        """Exclusive, cross-process lock on a user's slot"""
+        offset = self._offset(self.key(user_id))
+        lock_exclusive(self._fd, _RECORD.size, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _RECORD.size, offset)
+
+    def read(self, user_id: str, max_age: float) -> Optional[HotRecord]:
+        """The user's record, or None if absent, taken over or older than max_age"""
+        key = self.key(user_id)
+        offset = self._offset(key)
+        for _ in range(READ_ATTEMPTS):
+            seq = _SEQ.unpack_from(self._map, offset)[0]
+            if seq & 1:
+                self._retries += 1
+                continue
+            fields = _RECORD.unpack_from(self._map, offset)
+            if _SEQ.unpack_from(self._map, offset)[0] != seq or fields[0] != seq:
+                self._retries += 1
+                continue
+            if fields[1] != key or time.time() - fields[2] > max_age:
+                return None
+            return HotRecord(*fields[3:11])
+        return None
+
+    def write(self, user_id: str, record: HotRecord, loaded_at: float) -> None:
+        """Store a record; call while holding locked(user_id)"""
+        key = self.key(user_id)
+        offset = self._offset(key)
+        seq = _SEQ.unpack_from(self._map, offset)[0]
+        if seq & 1:
+            # A writer died mid-update; the lock is ours now, so recover
+            seq += 1
+        _SEQ.pack_into(self._map, offset, seq + 1)
+        _RECORD.pack_into(
+            self._map, offset, seq + 1, key, loaded_at,
+            record.total_points, record.completed_tasks, record.total_tasks, record.streak,
+            record.day, record.completed_today, record.completed_yesterday, record.created_today, 0
+        )
+        _SEQ.pack_into(self._map, offset, seq + 2)
+
+    def loaded_at(self, user_id: str) -> float:
+        key = self.key(user_id)
+        return _RECORD.unpack_from(self._map, self._offset(key))[2]
+
+
+class HotStatsRepository:
+    """
+    Repository wrapper that answers the hot per-user reads (user_stats and
+    today's/yesterday's task counts) from a HotStatsSegment.
+
+    A missing or expired record is loaded from the database under the slot
+    lock. Writes go to the database first and then patch the record under
+    the same lock, so workers on the host see them at once. Records expire
+    after max_age seconds to pick up writes made on other hosts. Daily
+    counters count completed tasks by the task's own day, as count_tasks
+    does. Everything else goes straight to the wrapped repository.
+
+    Days are the user's local day numbers, which only the caller knows, so
+    the daily counters are loaded by the first count for a day and reloaded
+    when a count asks for a later one.
+    """
+
+    def __init__(self, repository, segment: HotStatsSegment, max_age: float = 60):
+        self._repository = repository
+        self._segment = segment
+        self._max_age = max_age
+        # fcntl locks are per process, so threads also take a local lock,
+        # striped by slot so users colliding in a slot share one
+        self._write_locks = [threading.Lock() for _ in range(64)]
+        self._hits = 0
+        self._misses = 0
+        metrics.register('hot_stats', self.stats)
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    @contextmanager
+    def _locked(self, user_id: str):
+        write_lock = self._write_locks[self._segment.slot(user_id) % len(self._write_locks)]
+        with write_lock, self._segment.locked(user_id):
+            yield
+
+    def _load(self, user_id: str, user_stats: Dict) -> HotRecord:
+        """Build a record from the database; call while holding the slot lock"""
+        record = HotRecord(
+            user_stats.get('total_points', 0),
+            user_stats.get('completed_tasks', 0),
+            user_stats.get('total_tasks', 0),
+            user_stats.get('streak', 0),
+            0, 0, 0, 0
+        )
+        self._segment.write(user_id, record, time.time())
+        return record
+
+    def _load_day(self, user_id: str, day: int) -> Optional[HotRecord]:
+        """Load the daily counters for a day into the user's record"""
+        with self._locked(user_id):
+            record = self._segment.read(user_id, self._max_age)
+            if record is None or record.day == day:
+                return record
+            record.day = day
+            record.completed_today = self._repository.count_tasks(user_id, day=day, status='completed')
+            record.completed_yesterday = self._repository.count_tasks(user_id, day=day - 1, status='completed')
+            record.created_today = self._repository.count_tasks(user_id, day=day)
+            self._segment.write(user_id, record, self._segment.loaded_at(user_id))
+            return record
+
+    def _record(self, user_id: str, create: bool = False) -> Optional[HotRecord]:
+        record = self._segment.read(user_id, self._max_age)
+        if record is not None:
+            self._hits += 1
+            return record
+        self._misses += 1
+
+        with self._locked(user_id):
+            # Another worker may have loaded it while we waited
+            record = self._segment.read(user_id, self._max_age)
+            if record is not None:
+                return record
+            if create:
+                user_stats = self._repository.ensure_stats(user_id)
+            else:
+                user_stats = self._repository.find_stats(user_id)
+                if user_stats is None:
+                    return None
+            return self._load(user_id, user_stats)
+
+    def _update(self, user_id: str, write, apply) -> None:
+        with self._locked(user_id):
+            write()
+            record = self._segment.read(user_id, self._max_age)
+            if record is not None:
+                apply(record)
+                # Keep the original load time so the record still expires
+                self._segment.write(user_id, record, self._segment.loaded_at(user_id))
+
+    @staticmethod
+    def _stats_doc(user_id: str, record: HotRecord) -> Dict:
+        return {
+            'user_id': user_id,
+            'total_points': record.total_points,
+            'streak': record.streak,
+            'total_tasks': record.total_tasks,
+            'completed_tasks': record.completed_tasks
+        }
+
+    def find_stats(self, user_id):
+        record = self._record(user_id)
+        return self._stats_doc(user_id, record) if record is not None else None
+
+    def ensure_stats(self, user_id):
+        return self._stats_doc(user_id, self._record(user_id, create=True))
+
+    def record_completion(self, user_id, points, day, task_day=None):
+        def apply(record):
+            record.total_points += points
+            record.completed_tasks += 1
+            # Counted by the task's day, like the count_tasks query the counters answer
+            if task_day is None:
+                record.day = 0
+            elif task_day == record.day:
+                record.completed_today += 1
+            elif task_day == record.day - 1:
+                record.completed_yesterday += 1
+            elif task_day > record.day:
+                # A new day's counters aren't known until counted
+                record.day = 0
+
+        self._update(user_id, lambda: self._repository.record_completion(user_id, points, day, task_day), apply)
+
+    def increment_streak(self, user_id):
+        def apply(record):
+            record.streak += 1
+
+        self._update(user_id, lambda: self._repository.increment_streak(user_id), apply)
+
+    def set_streak(self, user_id, streak):
+        def apply(record):
+            record.streak = streak
+
+        self._update(user_id, lambda: self._repository.set_streak(user_id, streak), apply)
+
+    def insert_task(self, task):
+        def apply(record):
+            if task['day'] == record.day:
+                record.created_today += 1
+            elif task['day'] > record.day:
+                record.day = 0
+
+        self._update(task['user_id'], lambda: self._repository.insert_task(task), apply)
+
+    def insert_tasks(self, tasks):
+        def apply(record):
+            # Recount the daily counters on the next read
+            record.day = 0
+
+        inserted = self._repository.insert_tasks(tasks)
+        for user_id in {task['user_id'] for task in tasks}:
+            self._update(user_id, lambda: None, apply)
+        return inserted
+
+    def restore_stats(self, user_id, stats, words):
+        def apply(record):
+            record.total_points = stats.get('total_points', 0)
+            record.completed_tasks = stats.get('completed_tasks', 0)
+            record.total_tasks = stats.get('total_tasks', 0)
+            record.streak = stats.get('streak', 0)
+
+        self._update(user_id, lambda: self._repository.restore_stats(user_id, stats, words), apply)
+
+    def count_tasks(self, user_id, day=None, status=None, since_day=None):
+        if day is not None and status in (None, 'completed'):
+            record = self._record(user_id)
+            if record is not None and day > record.day:
+                record = self._load_day(user_id, day)
+            if record is not None:
+                if status is None and day == record.day:
+                    return record.created_today
+                if status == 'completed' and day == record.day:
+                    return record.completed_today
+                if status == 'completed' and day == record.day - 1:
+                    return record.completed_yesterday
+        return self._repository.count_tasks(user_id, day=day, status=status, since_day=since_day)
+
+    def stats(self) -> Dict:
+        lookups = self._hits + self._misses
+        return {
+            'hits': self._hits,
+            'misses': self._misses,
+            'seqlock_retries': self._segment._retries,
+            'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+        }
@@ -0,0 +1,40 @@
+import orjson
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+
+# Stored timestamps come from utcnow(), so naive datetimes are emitted as UTC
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC
+
+
+def _default(value):
+    """Types orjson does not handle natively (datetime and UUID it does)"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (set, frozenset)):
+        return list(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps_bytes(obj) -> bytes:
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class FastJSONProvider(JSONProvider):
+    """
+    orjson-backed JSON provider for jsonify and request.get_json.
+
+    ObjectId, datetime and UUID values are encoded in the same pass as the
+    rest of the document, so routes can return Mongo documents as they are
+    instead of copying them to stringify `_id` first.
+    """
+
+    def dumps(self, obj, **kwargs) -> str:
+        return dumps_bytes(obj).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype='application/json')
+
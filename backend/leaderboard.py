@@ -0,0 +1,184 @@
+import math
+import random
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+# Leaderboard name -> user_stats field it ranks on
+BOARDS = {
+    'points': 'total_points',
+    'streak': 'streak'
+}
+
+
+class _Node:
+    __slots__ = ('key', 'next', 'width')
+
+    def __init__(self, key, levels: int):
+        self.key = key
+        self.next = [None] * levels
+        self.width = [1] * levels
+
+
+class RankedSet:
+    """
+    Sorted set of unique keys backed by an indexable skip list.
+
+    Every link stores how many level-0 positions it skips, so insert, remove
+    and rank lookups are O(log n) and reading the first k keys is O(log n + k).
+    """
+
+    def __init__(self, expected_size: int = 1_000_000):
+        self.levels = max(1, int(math.log2(expected_size)) + 1)
+        self.tail = _Node(None, 0)
+        self.head = _Node(None, self.levels)
+        self.head.next = [self.tail] * self.levels
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _path(self, key):
+        """Last node before key on every level, plus its level-0 position"""
+        chain = [None] * self.levels
+        steps = [0] * self.levels
+        node = self.head
+        for level in reversed(range(self.levels)):
+            nxt = node.next[level]
+            while nxt is not self.tail and nxt.key < key:
+                steps[level] += node.width[level]
+                node = nxt
+                nxt = node.next[level]
+            chain[level] = node
+        return chain, steps
+
+    def insert(self, key) -> None:
+        chain, steps = self._path(key)
+        height = min(self.levels, 1 - int(math.log(1.0 - random.random(), 2.0)))
+        node = _Node(key, height)
+
+        offset = 0
+        for level in range(height):
+            prev = chain[level]
+            node.next[level] = prev.next[level]
+            prev.next[level] = node
+            node.width[level] = prev.width[level] - offset
+            prev.width[level] = offset + 1
+            offset += steps[level]
+        for level in range(height, self.levels):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key) -> None:
+        chain, _ = self._path(key)
+        node = chain[0].next[0]
+        if node is self.tail or node.key != key:
+            raise KeyError(key)
+
+        for level in range(len(node.next)):
+            prev = chain[level]
+            prev.width[level] += node.width[level] - 1
+            prev.next[level] = node.next[level]
+        for level in range(len(node.next), self.levels):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def count_less(self, key) -> int:
+        """Number of keys strictly smaller than key"""
+        _, steps = self._path(key)
+        return sum(steps)
+
+    def first(self, count: int) -> List:
+        keys = []
+        node = self.head.next[0]
+        while node is not self.tail and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+
+class Leaderboard:
+    """
+    In-memory points and streak rankings.
+
+    Keys are (-score, user_id) so the best score sorts first. The sets are
+    fed with absolute values from user_stats after each update and rebuilt
+    wholesale from Mongo, which also picks up writes made by other workers.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sets = {board: RankedSet() for board in BOARDS}
+        self._scores = {board: {} for board in BOARDS}
+        self.loaded_at = None
+
+    def rebuild(self, user_stats: Iterable[Dict]) -> None:
+        """Replace the rankings with a fresh snapshot of user_stats documents"""
+        sets = {board: RankedSet() for board in BOARDS}
+        scores = {board: {} for board in BOARDS}
+        for doc in user_stats:
+            for board, field in BOARDS.items():
+                score = doc.get(field, 0) or 0
+                scores[board][doc['user_id']] = score
+                sets[board].insert((-score, doc['user_id']))
+
+        with self._lock:
+            self._sets = sets
+            self._scores = scores
+            self.loaded_at = time.time()
+
+    def update(self, user_stats: Dict) -> None:
+        """Move a user to the position given by their current user_stats"""
+        user_id = user_stats['user_id']
+        with self._lock:
+            for board, field in BOARDS.items():
+                score = user_stats.get(field, 0) or 0
+                previous = self._scores[board].get(user_id)
+                if previous == score:
+                    continue
+                if previous is not None:
+                    self._sets[board].remove((-previous, user_id))
+                self._sets[board].insert((-score, user_id))
+                self._scores[board][user_id] = score
+
+    def top(self, board: str, limit: int = 100) -> List[Dict]:
+        with self._lock:
+            keys = self._sets[board].first(limit)
+            entries = []
+            for position, (negated, user_id) in enumerate(keys):
+                # Users with equal scores share a rank
+                if entries and entries[-1]['score'] == -negated:
+                    rank = entries[-1]['rank']
+                else:
+                    rank = position + 1
+                entries.append({'rank': rank, 'user_id': user_id, 'score': -negated})
+            return entries
+
+    def rank(self, board: str, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            score = self._scores[board].get(user_id)
+            if score is None:
+                return None
+            # '' sorts before every user_id, so this counts strictly better scores
+            better = self._sets[board].count_less((-score, ''))
+            return {'rank': better + 1, 'user_id': user_id, 'score': score}
+
+    def size(self, board: str) -> int:
+        with self._lock:
+            return len(self._sets[board])
+
+    def start_refresh(self, load_user_stats, interval: int) -> threading.Thread:
+        """Build once now and then every `interval` seconds on a daemon thread"""
+        def refresh_loop():
+            while True:
+                try:
+                    self.rebuild(load_user_stats())
+                except Exception as e:
+                    print(f"Leaderboard refresh failed: {e}")
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+
+        thread = threading.Thread(target=refresh_loop, name='leaderboard-refresh', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from gevent_compat import thread_local
+from metrics import metrics
+
+# Temperatures within one bucket share cached responses
+TEMPERATURE_BUCKET = 0.2
+
+# Hits refresh an entry's LRU position at most this often, to keep reads cheap
+TOUCH_INTERVAL_SECONDS = 60
+
+
+def cache_key(model: str, messages: List[Dict], max_tokens: int, temperature: float) -> bytes:
+    bucket = round(temperature / TEMPERATURE_BUCKET)
+    payload = json.dumps([model, messages, max_tokens, bucket], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).digest()
+
+
+class LLMCache:
+    """
+    Persistent completion cache shared by every worker on the host.
+
+    Entries live in a SQLite file in WAL mode, so they survive worker
+    recycling and deploys and each prompt is paid for once per host rather
+    than once per process. Readers never block the writer. The file is
+    kept under max_bytes of response text by evicting least recently used
+    entries, and entries older than ttl_seconds are ignored so creative
+    prompts don't repeat themselves forever.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key BLOB PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_used REAL NOT NULL
+        ) WITHOUT ROWID;
+        CREATE INDEX IF NOT EXISTS idx_llm_cache_last_used ON llm_cache (last_used);
+    """
+
+    def __init__(self, path: str, max_bytes: int = 64 * 1024 * 1024, ttl_seconds: float = 86400,
+                 evict_every: int = 100):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.evict_every = evict_every
+        self._local = thread_local()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._stores = 0
+        self._evictions = 0
+        metrics.register('llm_cache', self.stats)
+
+    def _conn(self) -> sqlite3.Connection:
+        # Opened lazily and per process: the app is imported before gunicorn
+        # forks, and a SQLite handle must not cross a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(self.SCHEMA)
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, keys: List[bytes]) -> Optional[str]:
+        """Response for the first of keys that is cached and fresh"""
+        now = time.time()
+        placeholders = ','.join('?' * len(keys))
+        rows = dict(
+            (key, (response, last_used)) for key, response, last_used in self._conn().execute(
+                f'SELECT key, response, last_used FROM llm_cache WHERE key IN ({placeholders}) AND created_at > ?',
+                (*keys, now - self.ttl_seconds)
+            )
+        )
+        for key in keys:
+            if key in rows:
+                response, last_used = rows[key]
+                if now - last_used > TOUCH_INTERVAL_SECONDS:
+                    self._conn().execute('UPDATE llm_cache SET last_used = ? WHERE key = ?', (now, key))
+                with self._lock:
+                    self._hits += 1
+                return response
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def put(self, key: bytes, response: str) -> None:
+        now = time.time()
+        self._conn().execute(
+            'INSERT OR REPLACE INTO llm_cache (key, response, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)',
+            (key, response, len(response.encode()), now, now)
+        )
+        with self._lock:
+            self._stores += 1
+            evict = self._stores % self.evict_every == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> int:
+        """Drop expired entries, then the least recently used until under max_bytes"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            removed = conn.execute('DELETE FROM llm_cache WHERE created_at <= ?',
+                                   (time.time() - self.ttl_seconds,)).rowcount
+            excess = conn.execute('SELECT COALESCE(SUM(size), 0) FROM llm_cache').fetchone()[0] - self.max_bytes
+            if excess > 0:
+                # Free a tenth extra so eviction doesn't run on every insert
+                target = excess + self.max_bytes // 10
+                freed = 0
+                keys = []
+                for key, size in conn.execute('SELECT key, size FROM llm_cache ORDER BY last_used'):
+                    keys.append((key,))
+                    freed += size
+                    if freed >= target:
+                        break
+                conn.executemany('DELETE FROM llm_cache WHERE key = ?', keys)
+                removed += len(keys)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        with self._lock:
+            self._evictions += removed
+        return removed
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'stores': self._stores,
+                'evictions': self._evictions,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,29 @@
+import httpx
+import openai
+from cassette import Cassette, CassetteClient
+from config import Config
+
+
+def create_llm_client() -> openai.OpenAI:
+    """
+    OpenAI client on a pooled keep-alive HTTP session.
+
+    One client is shared by every AI call in the process so TLS connections
+    to the API are reused instead of re-negotiated per request. With
+    LLM_CASSETTE_MODE set it is wrapped to record or replay completions.
+    """
+    http_client = httpx.Client(
+        limits=httpx.Limits(
+            max_connections=Config.LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=Config.LLM_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=Config.LLM_KEEPALIVE_EXPIRY
+        ),
+        timeout=Config.LLM_TIMEOUT
+    )
+    client = openai.OpenAI(api_key=Config.OPENAI_API_KEY, http_client=http_client)
+    
+    if Config.LLM_CASSETTE_MODE != 'off':
+        # Record every completion to, or replay them from, a cassette file
+        cassette = Cassette(Config.LLM_CASSETTE_PATH, Config.LLM_CASSETTE_MODE, Config.LLM_CASSETTE_LATENCY_SCALE)
+        return CassetteClient(client, cassette)
+    return client
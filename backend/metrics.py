@@ -0,0 +1,45 @@
+import threading
+from collections import defaultdict
+from typing import Callable, Dict
+
+
+class Metrics:
+    """
+    Process-local counters and gauges served by /api/metrics.
+
+    Components either bump counters directly or register a collector that
+    returns a dict of their current state when a snapshot is taken.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._gauges = {}
+        self._collectors = {}
+
+    def inc(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._counters[name] += value
+
+    def set_gauge(self, name: str, value) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def register(self, name: str, collector: Callable[[], Dict]) -> None:
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            data = {
+                'counters': dict(self._counters),
+                'gauges': dict(self._gauges)
+            }
+        for name, collector in self._collectors.items():
+            try:
+                data[name] = collector()
+            except Exception as e:
+                data[name] = {'error': str(e)}
+        return data
+
+
+metrics = Metrics()
@@ -0,0 +1,33 @@
+import hashlib
+import re
+import unicodedata
+from typing import List
+
+# Words that don't change what a task is ("Write a report" == "write report")
+FILLER_WORDS = frozenset(['a', 'an', 'the', 'my', 'some', 'to', 'please'])
+
+_NON_WORD = re.compile(r'[^\w\s]+')
+_NUMBERING = re.compile(r'^\s*(?:[-*•]|\d+[.)]|step\s+\d+[:.)]?)\s*', re.IGNORECASE)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, drop punctuation and filler words, collapse whitespace"""
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    words = _NON_WORD.sub(' ', text).split()
+    return ' '.join(word for word in words if word not in FILLER_WORDS)
+
+
+def micro_steps_key(title: str, description: str = '') -> str:
+    """Content address of a task for the shared micro-step cache"""
+    normalized = normalize_text(title) + '\n' + normalize_text(description)
+    return hashlib.sha256(normalized.encode()).hexdigest()[:32]
+
+
+def parse_steps(text: str, max_steps: int = 7) -> List[str]:
+    """Split a model's numbered or bulleted list into step strings"""
+    steps = []
+    for line in text.splitlines():
+        step = _NUMBERING.sub('', line).strip()
+        if step:
+            steps.append(step)
+    return steps[:max_steps]
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import defaultdict, deque
+from statistics import median
+from typing import Dict, List, Tuple
+
+
+class RouteHealth:
+    """Rolling latency and error window for one model on one task type"""
+
+    def __init__(self, window: int):
+        self.latencies = deque(maxlen=window)
+        self.outcomes = deque(maxlen=window)
+        self.requests = 0
+        self.errors = 0
+        self.open_until = 0.0
+
+    def latency(self):
+        return median(self.latencies) if self.latencies else None
+
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+
+class ModelRouter:
+    """
+    Chooses which model serves each AI task type.
+
+    A route lists candidate models, each with its own timeout, and the
+    minimum quality tier the task needs. Healthy candidates that meet the
+    tier are tried fastest first by rolling median latency for that task.
+    Candidates without samples yet keep their configured order, ahead of
+    measured ones, so they get explored. A candidate whose recent error
+    rate crosses the threshold is skipped for a cool-down, then probed
+    again. Lower-tier or unhealthy candidates are only a last resort.
+    """
+
+    def __init__(self, tiers: Dict[str, int], routes: Dict[str, Dict], window: int = 50,
+                 error_threshold: float = 0.5, min_samples: int = 5, cooldown_seconds: float = 30):
+        self.tiers = tiers
+        self.routes = routes
+        self.error_threshold = error_threshold
+        self.min_samples = min_samples
+        self.cooldown_seconds = cooldown_seconds
+        self._health = {
+            (task, candidate['model']): RouteHealth(window)
+            for task, route in routes.items()
+            for candidate in route['models']
+        }
+        self._decisions = defaultdict(lambda: defaultdict(int))
+        self._fallbacks = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def tier(self, model: str) -> int:
+        return self.tiers.get(model, 1)
+
+    def candidates(self, task: str) -> List[Tuple[str, float]]:
+        """(model, timeout) pairs to try for a task, in order"""
+        route = self.routes[task]
+        now = time.monotonic()
+        with self._lock:
+            preferred, last_resort = [], []
+            for position, candidate in enumerate(route['models']):
+                model = candidate['model']
+                health = self._health[(task, model)]
+                if self.tier(model) >= route.get('min_tier', 1) and health.open_until <= now:
+                    latency = health.latency()
+                    # Unmeasured models sort first, in configured order
+                    preferred.append(((latency is not None, latency or 0.0, position), candidate))
+                else:
+                    last_resort.append(candidate)
+
+            ordered = [candidate for _, candidate in sorted(preferred, key=lambda item: item[0])] + last_resort
+            self._decisions[task][ordered[0]['model']] += 1
+            return [(candidate['model'], candidate['timeout']) for candidate in ordered]
+
+    def record(self, task: str, model: str, latency: float, ok: bool, fallback: bool = False) -> None:
+        """Feed back the outcome of one call"""
+        with self._lock:
+            health = self._health[(task, model)]
+            health.requests += 1
+            health.outcomes.append(ok)
+            if ok:
+                health.latencies.append(latency)
+                if fallback:
+                    self._fallbacks[task] += 1
+            else:
+                health.errors += 1
+                if (len(health.outcomes) >= self.min_samples
+                        and health.error_rate() >= self.error_threshold):
+                    health.open_until = time.monotonic() + self.cooldown_seconds
+                    # Judge the probe after the cool-down on fresh outcomes
+                    health.outcomes.clear()
+
+    def stats(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            routes = {}
+            for (task, model), health in self._health.items():
+                latency = health.latency()
+                routes.setdefault(task, {})[model] = {
+                    'tier': self.tier(model),
+                    'requests': health.requests,
+                    'errors': health.errors,
+                    'error_rate': round(health.error_rate(), 4),
+                    'median_latency_ms': round(latency * 1000, 1) if latency is not None else None,
+                    'healthy': health.open_until <= now
+                }
+            return {
+                'routes': routes,
+                'decisions': {task: dict(models) for task, models in self._decisions.items()},
+                'fallbacks': dict(self._fallbacks)
+            }
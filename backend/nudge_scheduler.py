@@ -0,0 +1,190 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+from metrics import metrics
+
+
+def _epoch(value: datetime) -> float:
+    """Seconds since the epoch for a naive UTC datetime"""
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class NudgeSink:
+    """Destination for scheduled nudges"""
+
+    def deliver(self, timer: Dict, nudge: str) -> None:
+        raise NotImplementedError
+
+
+class EventSink(NudgeSink):
+    """Push scheduled nudges to the user's open /api/events streams"""
+
+    def __init__(self, broker):
+        self.broker = broker
+
+    def deliver(self, timer, nudge):
+        self.broker.publish(timer['user_id'], 'nudge', {
+            'nudge': nudge,
+            'scheduled': True,
+            'reason': timer['kind']
+        })
+
+
+class NudgeScheduler:
+    """
+    Server-initiated nudges on per-user timers.
+
+    Timers live in the repository, which is the source of truth and lets
+    them survive restarts. In memory each worker keeps only a min-heap of
+    (due time, key) and a key -> due time map, so millions of pending
+    timers cost a few hundred bytes each. Rescheduling or cancelling leaves
+    the old heap entry behind; it is skipped when popped and the heap is
+    compacted once stale entries dominate.
+
+    Every worker loads the timers, and due ones are claimed atomically
+    through the repository, so each fires exactly once. Claimed timers are
+    generated in batches on a small thread pool and handed to the sink.
+    Timers written by other workers are picked up by a periodic resync.
+    """
+
+    def __init__(self, repository, generate: Callable[[Dict], Optional[str]], sink: NudgeSink,
+                 batch_size: int = 100, concurrency: int = 4, resync_seconds: float = 300):
+        self._repository = repository
+        self._generate = generate
+        self._sink = sink
+        self.batch_size = batch_size
+        self.resync_seconds = resync_seconds
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='nudge-scheduler')
+        self._heap = []
+        self._due = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._fired = 0
+        self._lost_claims = 0
+        self._delivered = 0
+        self._batches = 0
+        self._last_batch_ms = None
+        metrics.register('nudge_scheduler', self.stats)
+
+    def schedule(self, key: str, user_id: str, kind: str, due_at: datetime, data: Optional[Dict] = None) -> None:
+        """Create or move the timer with this key; due_at is naive UTC"""
+        self._repository.save_timer({
+            'key': key,
+            'user_id': user_id,
+            'kind': kind,
+            'due_at': due_at,
+            'data': data or {}
+        })
+        self._push(key, _epoch(due_at))
+
+    def cancel(self, key: str) -> None:
+        self._repository.delete_timer(key)
+        with self._cond:
+            # The heap entry is skipped when it comes up
+            self._due.pop(key, None)
+
+    def _push(self, key: str, due: float) -> None:
+        with self._cond:
+            self._due[key] = due
+            heapq.heappush(self._heap, (due, key))
+            if len(self._heap) > 2 * len(self._due) + 1000:
+                self._heap = [(due, key) for key, due in self._due.items()]
+                heapq.heapify(self._heap)
+            if self._heap[0][1] == key:
+                # New earliest timer: wake the loop to shorten its sleep
+                self._cond.notify()
+
+    def load(self, due_before: Optional[datetime] = None) -> int:
+        """Merge stored timers into the heap; returns how many were read"""
+        count = 0
+        for timer in self._repository.load_timers(due_before):
+            self._push(timer['key'], _epoch(timer['due_at']))
+            count += 1
+        return count
+
+    def start(self) -> None:
+        """Recover stored timers and start firing them"""
+        if self._thread is not None:
+            return
+        print(f"Nudge scheduler loaded {self.load()} timers")
+        self._thread = threading.Thread(target=self._run, name='nudge-scheduler', daemon=True)
+        self._thread.start()
+
+    def _pop_due(self, now: float) -> List[str]:
+        keys = []
+        while self._heap and self._heap[0][0] <= now and len(keys) < self.batch_size:
+            due, key = heapq.heappop(self._heap)
+            if self._due.get(key) == due:
+                del self._due[key]
+                keys.append(key)
+        return keys
+
+    def _wait_for_due(self, deadline: float) -> List[str]:
+        with self._cond:
+            while True:
+                now = time.time()
+                keys = self._pop_due(now)
+                if keys or now >= deadline:
+                    return keys
+                wake = min(self._heap[0][0], deadline) if self._heap else deadline
+                self._cond.wait(wake - now)
+
+    def _run(self) -> None:
+        next_resync = time.time() + self.resync_seconds
+        while True:
+            try:
+                if time.time() >= next_resync:
+                    next_resync = time.time() + self.resync_seconds
+                    self.load(datetime.utcnow() + timedelta(seconds=self.resync_seconds))
+                keys = self._wait_for_due(next_resync)
+                if keys:
+                    self._fire(keys)
+            except Exception as e:
+                print(f"Nudge scheduler error: {e}")
+                time.sleep(1)
+
+    def _fire(self, keys: List[str]) -> None:
+        started = time.monotonic()
+        # Another worker may have fired or moved some of these already
+        timers = self._repository.claim_timers(keys, datetime.utcnow())
+        self._lost_claims += len(keys) - len(timers)
+        if not timers:
+            return
+
+        delivered = 0
+        for timer, nudge in zip(timers, self._pool.map(self._generate_safely, timers)):
+            if nudge:
+                try:
+                    self._sink.deliver(timer, nudge)
+                    delivered += 1
+                except Exception as e:
+                    print(f"Nudge delivery failed for {timer['key']}: {e}")
+
+        with self._cond:
+            self._fired += len(timers)
+            self._delivered += delivered
+            self._batches += 1
+            self._last_batch_ms = round((time.monotonic() - started) * 1000, 1)
+
+    def _generate_safely(self, timer: Dict) -> Optional[str]:
+        try:
+            return self._generate(timer)
+        except Exception as e:
+            print(f"Nudge generation failed for {timer['key']}: {e}")
+            return None
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                'pending': len(self._due),
+                'heap_entries': len(self._heap),
+                'fired': self._fired,
+                'delivered': self._delivered,
+                'lost_claims': self._lost_claims,
+                'batches': self._batches,
+                'last_batch_ms': self._last_batch_ms
+            }
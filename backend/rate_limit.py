@@ -0,0 +1,196 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from gevent_compat import lock_exclusive
+
+# tokens, last refill (wall clock, comparable across processes)
+_SHARED_STATE = struct.Struct('<dd')
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second up to `capacity`"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class SharedTokenBucket:
+    """
+    Token bucket in a small memory-mapped file, so every worker process on
+    the host draws from the same tokens. Refill and take happen together
+    under an exclusive lockf on the file, which is held for a few
+    arithmetic operations.
+    """
+
+    def __init__(self, path: str, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        # lockf locks are per process, so threads also take a local lock
+        self._thread_lock = threading.Lock()
+        with self._locked():
+            if os.fstat(self._fd).st_size < _SHARED_STATE.size:
+                os.ftruncate(self._fd, _SHARED_STATE.size)
+                os.pwrite(self._fd, _SHARED_STATE.pack(capacity, time.time()), 0)
+        self._map = mmap.mmap(self._fd, _SHARED_STATE.size)
+
+    @contextmanager
+    def _locked(self):
+        with self._thread_lock:
+            lock_exclusive(self._fd)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN)
+
+    def _refilled(self, now: float) -> float:
+        tokens, updated = _SHARED_STATE.unpack_from(self._map)
+        # Clocks may step backwards; that never removes tokens
+        return min(self.capacity, tokens + max(0.0, now - updated) * self.rate)
+
+    def take(self, reserve: float = 0) -> bool:
+        """Take a token if one is available with `reserve` more left over"""
+        with self._locked():
+            now = time.time()
+            tokens = self._refilled(now)
+            if tokens < 1 + reserve:
+                return False
+            _SHARED_STATE.pack_into(self._map, 0, tokens - 1, now)
+            return True
+
+    def tokens(self) -> float:
+        with self._locked():
+            return self._refilled(time.time())
+
+
+class AIRateLimiter:
+    """
+    Per-user and global token buckets in front of paid LLM calls.
+
+    A call goes through only when both the user's bucket and the global
+    bucket have a token, and then takes one from each. User buckets are
+    per process. The global bucket stands for the provider-wide quota, so
+    with global_path it lives in a file shared by every worker on the
+    host; without one it is per process. Idle user buckets are evicted
+    least-recently-used first; a refilled bucket is the same as a new one,
+    so eviction never grants extra calls.
+
+    Background calls (work nobody is waiting on, e.g. precomputing) have
+    their own per-user buckets, so they never spend a user's interactive
+    burst, and take a global token only while background_reserve tokens
+    would still be left for interactive calls.
+    """
+
+    def __init__(self, user_rate_per_minute: float, user_burst: int,
+                 global_rate_per_minute: float, global_burst: int,
+                 max_tracked_users: int = 10000, global_path: Optional[str] = None,
+                 background_rate_per_minute: float = 0, background_burst: int = 0,
+                 background_reserve: float = 0):
+        self.user_rate = user_rate_per_minute / 60.0
+        self.user_burst = user_burst
+        self.background_rate = background_rate_per_minute / 60.0
+        self.background_burst = background_burst
+        self.background_reserve = background_reserve
+        self.max_tracked_users = max_tracked_users
+        self.global_rate = global_rate_per_minute / 60.0
+        self.global_burst = global_burst
+        if global_path:
+            self._global = SharedTokenBucket(global_path, self.global_rate, global_burst)
+        else:
+            self._global = TokenBucket(self.global_rate, global_burst)
+        self._users = OrderedDict()
+        self._background = OrderedDict()
+        self._lock = threading.Lock()
+        self._allowed = 0
+        self._throttled_user = 0
+        self._throttled_global = 0
+        self._allowed_background = 0
+        self._throttled_background = 0
+
+    def _bucket(self, buckets: OrderedDict, user_id: str, rate: float, burst: int) -> TokenBucket:
+        bucket = buckets.get(user_id)
+        if bucket is None:
+            bucket = TokenBucket(rate, burst)
+            buckets[user_id] = bucket
+            if len(buckets) > self.max_tracked_users:
+                buckets.popitem(last=False)
+        else:
+            buckets.move_to_end(user_id)
+        return bucket
+
+    def allow(self, user_id: str, background: bool = False) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if background:
+                bucket = self._bucket(self._background, user_id, self.background_rate, self.background_burst)
+                bucket.refill(now)
+                if bucket.tokens < 1 or not self._take_global(now, self.background_reserve):
+                    self._throttled_background += 1
+                    return False
+                bucket.tokens -= 1
+                self._allowed_background += 1
+                return True
+
+            bucket = self._bucket(self._users, user_id, self.user_rate, self.user_burst)
+            bucket.refill(now)
+            if bucket.tokens < 1:
+                self._throttled_user += 1
+                return False
+            if not self._take_global(now):
+                self._throttled_global += 1
+                return False
+
+            bucket.tokens -= 1
+            self._allowed += 1
+            return True
+
+    def _take_global(self, now: float, reserve: float = 0) -> bool:
+        if isinstance(self._global, SharedTokenBucket):
+            return self._global.take(reserve)
+        self._global.refill(now)
+        if self._global.tokens < 1 + reserve:
+            return False
+        self._global.tokens -= 1
+        return True
+
+    def _global_tokens(self) -> float:
+        if isinstance(self._global, SharedTokenBucket):
+            return self._global.tokens()
+        self._global.refill(time.monotonic())
+        return self._global.tokens
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'allowed': self._allowed,
+                'throttled_user': self._throttled_user,
+                'throttled_global': self._throttled_global,
+                'allowed_background': self._allowed_background,
+                'throttled_background': self._throttled_background,
+                'tracked_users': len(self._users),
+                'global_tokens': round(self._global_tokens(), 2),
+                'global_scope': 'host' if isinstance(self._global, SharedTokenBucket) else 'process',
+                'user_rate_per_minute': self.user_rate * 60,
+                'user_burst': self.user_burst,
+                'global_rate_per_minute': self.global_rate * 60,
+                'global_burst': self.global_burst,
+                'background_rate_per_minute': self.background_rate * 60,
+                'background_burst': self.background_burst,
+                'background_reserve': self.background_reserve
+            }
@@ -0,0 +1,69 @@
+from datetime import date
+from typing import Dict, Optional
+
+from activity_calendar import day_from_number, day_number
+
+# Subset of RFC 5545 RRULE: FREQ=DAILY|WEEKLY|MONTHLY with INTERVAL, BYDAY
+# (MO..SU), BYMONTHDAY (1..31) and UNTIL (YYYYMMDD), e.g.
+#   FREQ=DAILY                       every day
+#   FREQ=WEEKLY;BYDAY=MO,WE,FR       three times a week
+#   FREQ=MONTHLY;BYMONTHDAY=1,15     twice a month
+WEEKDAYS = ('MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU')
+FREQUENCIES = ('DAILY', 'WEEKLY', 'MONTHLY')
+
+
+def parse_rule(text: str) -> Dict:
+    """Parsed rule; ValueError for anything outside the supported subset"""
+    parts = {}
+    for part in (text or '').strip().upper().split(';'):
+        name, sep, value = part.partition('=')
+        if not sep or not value:
+            raise ValueError(f"Invalid recurrence rule part: {part!r}")
+        parts[name.strip()] = value.strip()
+
+    rule = {'freq': parts.pop('FREQ', None), 'interval': 1, 'by_day': [], 'by_month_day': [], 'until': None}
+    if rule['freq'] not in FREQUENCIES:
+        raise ValueError(f"FREQ must be one of {', '.join(FREQUENCIES)}")
+    try:
+        if 'INTERVAL' in parts:
+            rule['interval'] = int(parts.pop('INTERVAL'))
+        if 'BYDAY' in parts:
+            rule['by_day'] = sorted(WEEKDAYS.index(day) for day in parts.pop('BYDAY').split(','))
+        if 'BYMONTHDAY' in parts:
+            rule['by_month_day'] = sorted(int(day) for day in parts.pop('BYMONTHDAY').split(','))
+        if 'UNTIL' in parts:
+            until = parts.pop('UNTIL')[:8]
+            rule['until'] = day_number(date(int(until[:4]), int(until[4:6]), int(until[6:8])))
+    except ValueError:
+        raise ValueError(f"Invalid recurrence rule: {text}")
+    if parts:
+        raise ValueError(f"Unsupported recurrence rule parts: {', '.join(parts)}")
+    if rule['interval'] < 1 or any(not 1 <= day <= 31 for day in rule['by_month_day']):
+        raise ValueError(f"Invalid recurrence rule: {text}")
+    return rule
+
+
+def occurs_on(rule: Dict, start_day: int, day: int) -> bool:
+    """Whether a rule anchored at start_day has an occurrence on day"""
+    if day < start_day or (rule['until'] is not None and day > rule['until']):
+        return False
+    current, start = day_from_number(day), day_from_number(start_day)
+
+    if rule['freq'] == 'DAILY':
+        return (day - start_day) % rule['interval'] == 0 and (
+            not rule['by_day'] or current.weekday() in rule['by_day'])
+    if rule['freq'] == 'WEEKLY':
+        weeks = (day - current.weekday() - (start_day - start.weekday())) // 7
+        return weeks % rule['interval'] == 0 and current.weekday() in (rule['by_day'] or [start.weekday()])
+    months = (current.year - start.year) * 12 + current.month - start.month
+    return months % rule['interval'] == 0 and current.day in (rule['by_month_day'] or [start.day])
+
+
+def next_occurrence(rule: Dict, start_day: int, after: int, horizon: int = 366) -> Optional[int]:
+    """First day after `after` with an occurrence, looking at most horizon days ahead"""
+    for day in range(max(after + 1, start_day), after + 1 + horizon):
+        if rule['until'] is not None and day > rule['until']:
+            return None
+        if occurs_on(rule, start_day, day):
+            return day
+    return None
@@ -0,0 +1,1089 @@
+import json
+import os
+import sqlite3
+import time
+from datetime import date, datetime
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from bson import ObjectId
+from bson.int64 import Int64
+from flask_pymongo import PyMongo
+from pymongo import DeleteOne, ReplaceOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+
+from activity_calendar import ACTIVITY_FIELD, day_word, mark_day_update
+from gevent_compat import thread_local
+from hot_stats import HotStatsRepository, HotStatsSegment
+from stats_cache import CachedStatsRepository, VersionChannel
+from task_schema import (
+    SCHEMA_VERSION, KEYS, decode_task, encode_fields, encode_task, status_code, task_key
+)
+
+
+def default_user_stats(user_id: str) -> Dict:
+    return {
+        'user_id': user_id,
+        'total_points': 0,
+        'streak': 0,
+        'total_tasks': 0,
+        'completed_tasks': 0
+    }
+
+
+class Repository:
+    """
+    Storage interface used by the routes.
+
+    Documents go in and come out as plain dicts shaped like the MongoDB
+    documents, so route code does not depend on the backend.
+    """
+
+    def ping(self) -> None:
+        raise NotImplementedError
+
+    # Tasks are keyed by `day`, the user's local date as days since 1970-01-01
+    def find_tasks(self, user_id: str, day: int, status: Optional[str] = None) -> List[Dict]:
+        raise NotImplementedError
+
+    def find_task(self, user_id: str, task_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def insert_task(self, task: Dict) -> None:
+        raise NotImplementedError
+
+    def update_task(self, task_id: str, fields: Dict) -> None:
+        raise NotImplementedError
+
+    def count_tasks(self, user_id: str, day: Optional[int] = None, status: Optional[str] = None,
+                    since_day: Optional[int] = None) -> int:
+        """Count tasks on one day, or from since_day (inclusive) on"""
+        raise NotImplementedError
+
+    def clear_expired_speculations(self, now: datetime) -> int:
+        """Remove speculative celebrations that expired before now; returns how many"""
+        raise NotImplementedError
+
+    def migrate_day_keys(self) -> int:
+        """Give tasks stored before day keys a `day` from their date string; returns how many"""
+        raise NotImplementedError
+
+    def migrate_task_schema(self, batch_size: int) -> int:
+        """Move the next batch_size tasks to the current schema; returns how many were processed, 0 when done"""
+        raise NotImplementedError
+
+    # Recurring task templates; their daily instances are stored as tasks once acted on
+    def find_templates(self, user_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    def insert_template(self, template: Dict) -> None:
+        raise NotImplementedError
+
+    def delete_template(self, user_id: str, template_id: str) -> bool:
+        raise NotImplementedError
+
+    # Bulk transfer (see transfer.py)
+    def iter_tasks(self, user_id: str, batch_size: int = 1000, since_day: Optional[int] = None) -> Iterator[Dict]:
+        """Every task of a user (or those from since_day on), fetched batch_size at a time"""
+        raise NotImplementedError
+
+    def iter_activities(self, user_id: str, batch_size: int = 1000) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    def insert_tasks(self, tasks: List[Dict]) -> int:
+        """Insert in one batch, skipping task_ids that exist; returns how many were inserted"""
+        raise NotImplementedError
+
+    def insert_activities(self, activities: List[Dict]) -> int:
+        """Insert in one batch, skipping activity_ids that exist; returns how many were inserted"""
+        raise NotImplementedError
+
+    def insert_templates(self, templates: List[Dict]) -> int:
+        """Insert in one batch, skipping template_ids that exist; returns how many were inserted"""
+        raise NotImplementedError
+
+    def restore_stats(self, user_id: str, stats: Dict, words: Dict[int, int]) -> None:
+        """Replace a user's stats and activity calendar words"""
+        raise NotImplementedError
+
+    # Nightly digests (see digests.py)
+    def iter_user_stats(self, batch_size: int = 1000) -> Iterator[Dict]:
+        """user_id, streak and timezone of every user, fetched batch_size at a time"""
+        raise NotImplementedError
+
+    def find_tasks_for_users(self, user_ids: List[str], days: List[int]) -> List[Dict]:
+        """Tasks of any of the users on any of the days, in one query"""
+        raise NotImplementedError
+
+    def find_digest(self, user_id: str) -> Optional[Dict]:
+        """The user's latest stored digest: user_id, day, fingerprint, digest, generated_at"""
+        raise NotImplementedError
+
+    def find_digests(self, user_ids: List[str]) -> Dict[str, Dict]:
+        raise NotImplementedError
+
+    def save_digests(self, digests: List[Dict]) -> None:
+        """Store digests in one batch, replacing each user's previous one"""
+        raise NotImplementedError
+
+    # User stats
+    def find_stats(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def ensure_stats(self, user_id: str) -> Dict:
+        """Return the user's stats, creating the default document if missing"""
+        raise NotImplementedError
+
+    def user_timezone(self, user_id: str) -> Optional[str]:
+        """The user's IANA timezone name, if set"""
+        raise NotImplementedError
+
+    def set_timezone(self, user_id: str, timezone: str) -> None:
+        raise NotImplementedError
+
+    def record_completion(self, user_id: str, points: int, day: date, task_day: Optional[int] = None) -> None:
+        """
+        Add points, count the completed task and mark the day it was completed
+        on as active. task_day is the completed task's own `day`, for caches
+        that keep per-day completion counts.
+        """
+        raise NotImplementedError
+
+    def increment_streak(self, user_id: str) -> None:
+        raise NotImplementedError
+
+    def set_streak(self, user_id: str, streak: int) -> None:
+        raise NotImplementedError
+
+    def all_stats(self) -> Iterable[Dict]:
+        """user_id, total_points and streak for every user"""
+        raise NotImplementedError
+
+    def activity_words(self, user_id: str) -> Dict[int, int]:
+        """Stored activity calendar words, {word index: signed 64-bit value}"""
+        raise NotImplementedError
+
+    # Activities
+    def latest_activity(self, user_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def find_activities(self, user_id: str, since: datetime) -> List[Dict]:
+        raise NotImplementedError
+
+    def insert_activity(self, activity: Dict) -> None:
+        raise NotImplementedError
+
+    # Micro-step cache, shared by all users
+    def find_micro_steps(self, key: str) -> Optional[List[str]]:
+        raise NotImplementedError
+
+    def save_micro_steps(self, key: str, steps: List[str]) -> None:
+        raise NotImplementedError
+
+    # Scheduled nudge timers
+    def save_timer(self, timer: Dict) -> None:
+        """Create or reschedule the timer with this key"""
+        raise NotImplementedError
+
+    def delete_timer(self, key: str) -> None:
+        raise NotImplementedError
+
+    def load_timers(self, due_before: Optional[datetime] = None) -> Iterable[Dict]:
+        """Pending timers, optionally only those due before a time"""
+        raise NotImplementedError
+
+    def claim_timers(self, keys: List[str], now: datetime) -> List[Dict]:
+        """
+        Atomically remove and return the timers among keys that are due.
+        Each timer is claimed by exactly one caller across processes.
+        """
+        raise NotImplementedError
+
+
+# Sorts before every ObjectId, so {'_id': {'$gte': ...}} selects v1 tasks on the _id index
+MIN_OBJECT_ID = ObjectId('0' * 24)
+
+# Task fields routes update; a v1 task is only deleted after migration if these are unchanged
+MUTABLE_TASK_FIELDS = ('status', 'completed_at', 'micro_steps', 'speculative_celebration')
+
+# How often workers re-check whether the task migration has finished
+LEGACY_CHECK_SECONDS = 60
+
+
+class MongoRepository(Repository):
+    """
+    Tasks are written in the compact v2 schema. Until the schema migration
+    has finished, reads also look for v1 documents and updates are applied
+    to both versions, so a task being migrated keeps every write.
+    """
+
+    def __init__(self, mongo: PyMongo):
+        self.mongo = mongo
+        self._legacy_tasks = True
+        self._legacy_checked = 0.0
+        self._indexed = set()
+
+    @property
+    def db(self):
+        return self.mongo.db
+
+    def ping(self) -> None:
+        self.mongo.cx.admin.command('ping')
+
+    def _legacy(self) -> bool:
+        """Whether v1 task documents may still exist"""
+        if self._legacy_tasks and time.monotonic() - self._legacy_checked > LEGACY_CHECK_SECONDS:
+            state = self.db.schema_versions.find_one({'_id': 'tasks'})
+            self._legacy_tasks = not state or state['version'] < SCHEMA_VERSION
+            self._legacy_checked = time.monotonic()
+        return self._legacy_tasks
+
+    @staticmethod
+    def _task_query(user_id, day=None, status=None, since_day=None, legacy=False):
+        names = {'user_id': 'user_id', 'day': 'day', 'status': 'status'} if legacy else KEYS
+        query = {names['user_id']: user_id}
+        if day is not None:
+            query[names['day']] = day
+        elif since_day is not None:
+            query[names['day']] = {'$gte': since_day}
+        if status:
+            query[names['status']] = status if legacy else status_code(status)
+        return query
+
+    def find_tasks(self, user_id, day, status=None):
+        tasks = []
+        if self._legacy():
+            # v1 first: a task migrated in between is then seen at least once
+            tasks = list(self.db.tasks.find(self._task_query(user_id, day, status, legacy=True)))
+        seen = {task['task_id'] for task in tasks}
+        for doc in self.db.tasks.find(self._task_query(user_id, day, status)):
+            task = decode_task(doc)
+            if task['task_id'] not in seen:
+                tasks.append(task)
+        return tasks
+
+    def find_task(self, user_id, task_id):
+        key = task_key(task_id)
+        doc = self.db.tasks.find_one({'_id': key, 'u': user_id}) if key else None
+        if doc is None and self._legacy():
+            return self.db.tasks.find_one({'task_id': task_id, 'user_id': user_id})
+        return decode_task(doc) if doc else None
+
+    def insert_task(self, task):
+        self.db.tasks.insert_one(encode_task(task))
+        task['_id'] = task['task_id']
+
+    def update_task(self, task_id, fields):
+        updates, removals = encode_fields(fields)
+        update = {'$set': updates}
+        if removals:
+            update['$unset'] = removals
+        key = task_key(task_id)
+        if key:
+            self.db.tasks.update_one({'_id': key}, update)
+        if self._legacy():
+            self.db.tasks.update_one({'task_id': task_id}, {'$set': fields})
+
+    def count_tasks(self, user_id, day=None, status=None, since_day=None):
+        count = self.db.tasks.count_documents(self._task_query(user_id, day, status, since_day))
+        if self._legacy():
+            count += self.db.tasks.count_documents(self._task_query(user_id, day, status, since_day, legacy=True))
+        return count
+
+    def clear_expired_speculations(self, now):
+        # Sparse: only the few tasks carrying a speculation are indexed
+        self.db.tasks.create_index('sc.expires_at', sparse=True)
+        cleared = self.db.tasks.update_many({'sc.expires_at': {'$lt': now}}, {'$unset': {'sc': ''}}).modified_count
+        if self._legacy():
+            cleared += self.db.tasks.update_many(
+                {'speculative_celebration.expires_at': {'$lt': now}},
+                {'$set': {'speculative_celebration': None}}
+            ).modified_count
+        return cleared
+
+    def migrate_day_keys(self):
+        # Days since the epoch of the stored 'YYYY-MM-DD' date, computed server side
+        result = self.db.tasks.update_many(
+            {'day': {'$exists': False}},
+            [{'$set': {'day': {'$toInt': {'$divide': [
+                {'$toLong': {'$dateFromString': {'dateString': '$date', 'format': '%Y-%m-%d'}}},
+                86400000
+            ]}}}}]
+        )
+        self.db.tasks.create_index([('user_id', 1), ('day', 1), ('status', 1)])
+        return result.modified_count
+
+    def migrate_task_schema(self, batch_size):
+        self.db.tasks.create_index([('u', 1), ('dy', 1), ('s', 1)])
+        legacy = list(self.db.tasks.find({'_id': {'$gte': MIN_OBJECT_ID}}, sort=[('_id', 1)], limit=batch_size))
+        if not legacy:
+            self.db.schema_versions.update_one(
+                {'_id': 'tasks'}, {'$set': {'version': SCHEMA_VERSION}}, upsert=True
+            )
+            for index in ('user_id_1_day_1_status_1', 'user_id_1_date_1_status_1', 'task_id_1'):
+                try:
+                    self.db.tasks.drop_index(index)
+                except OperationFailure:
+                    pass
+            return 0
+
+        self.db.tasks.bulk_write([
+            ReplaceOne({'_id': task_key(doc['task_id'])}, encode_task(doc), upsert=True) for doc in legacy
+        ], ordered=False)
+        # A v1 task updated since it was read stays behind and is migrated again next batch
+        self.db.tasks.bulk_write([
+            DeleteOne(dict({'_id': doc['_id']}, **{field: doc.get(field) for field in MUTABLE_TASK_FIELDS}))
+            for doc in legacy
+        ], ordered=False)
+        return len(legacy)
+
+    def find_templates(self, user_id):
+        # Runs on every task read, to materialize recurring tasks
+        self._ensure_index('task_templates', 'user_id')
+        return list(self.db.task_templates.find({'user_id': user_id}, {'_id': 0}))
+
+    def insert_template(self, template):
+        self.db.task_templates.insert_one(dict(template, _id=template['template_id']))
+
+    def delete_template(self, user_id, template_id):
+        return self.db.task_templates.delete_one({'_id': template_id, 'user_id': user_id}).deleted_count > 0
+
+    def iter_tasks(self, user_id, batch_size=1000, since_day=None):
+        if self._legacy():
+            yield from self.db.tasks.find(self._task_query(user_id, since_day=since_day, legacy=True),
+                                          batch_size=batch_size)
+        for doc in self.db.tasks.find(self._task_query(user_id, since_day=since_day), batch_size=batch_size):
+            yield decode_task(doc)
+
+    def iter_activities(self, user_id, batch_size=1000):
+        return self.db.activities.find({'user_id': user_id}, batch_size=batch_size)
+
+    @staticmethod
+    def _insert_many(collection, docs) -> int:
+        try:
+            return len(collection.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # Duplicate keys are documents imported before; anything else is a real failure
+            if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                raise
+            return e.details['nInserted']
+
+    def insert_tasks(self, tasks):
+        return self._insert_many(self.db.tasks, [encode_task(task) for task in tasks])
+
+    def _ensure_index(self, collection: str, field: str) -> None:
+        """Index on field, created once per process"""
+        if (collection, field) not in self._indexed:
+            self.db[collection].create_index(field)
+            self._indexed.add((collection, field))
+
+    def _ensure_unique(self, collection: str, field: str) -> None:
+        """
+        Unique index on field, created once per process. Duplicates written
+        before the index existed are dropped first, keeping the oldest.
+        """
+        if (collection, field) in self._indexed:
+            return
+        try:
+            self.db[collection].create_index(field, unique=True)
+        except OperationFailure as e:
+            if e.code != 11000:
+                raise
+            duplicates = self.db[collection].aggregate([
+                {'$group': {'_id': f'${field}', 'ids': {'$push': '$_id'}, 'count': {'$sum': 1}}},
+                {'$match': {'count': {'$gt': 1}}}
+            ], allowDiskUse=True)
+            for duplicate in duplicates:
+                self.db[collection].delete_many({'_id': {'$in': duplicate['ids'][1:]}})
+            self.db[collection].create_index(field, unique=True)
+        self._indexed.add((collection, field))
+
+    def insert_activities(self, activities):
+        # Activities written by the app have ObjectId _ids, so a repeated
+        # import is caught by the unique activity_id index instead
+        self._ensure_unique('activities', 'activity_id')
+        return self._insert_many(self.db.activities, [dict(activity) for activity in activities])
+
+    def insert_templates(self, templates):
+        return self._insert_many(
+            self.db.task_templates, [dict(template, _id=template['template_id']) for template in templates]
+        )
+
+    def restore_stats(self, user_id, stats, words):
+        doc = dict(stats, user_id=user_id)
+        doc[ACTIVITY_FIELD] = {str(word): Int64(bits) for word, bits in words.items()}
+        self.db.user_stats.replace_one({'user_id': user_id}, doc, upsert=True)
+
+    def iter_user_stats(self, batch_size=1000):
+        return self.db.user_stats.find({}, {'_id': 0, 'user_id': 1, 'streak': 1, 'timezone': 1},
+                                       batch_size=batch_size)
+
+    def find_tasks_for_users(self, user_ids, days):
+        tasks = []
+        if self._legacy():
+            tasks = list(self.db.tasks.find({'user_id': {'$in': user_ids}, 'day': {'$in': days}}))
+        seen = {task['task_id'] for task in tasks}
+        for doc in self.db.tasks.find({'u': {'$in': user_ids}, 'dy': {'$in': days}}):
+            task = decode_task(doc)
+            if task['task_id'] not in seen:
+                tasks.append(task)
+        return tasks
+
+    def find_digest(self, user_id):
+        return self.db.daily_digests.find_one({'_id': user_id}, {'_id': 0})
+
+    def find_digests(self, user_ids):
+        return {doc['user_id']: doc for doc in self.db.daily_digests.find({'_id': {'$in': user_ids}}, {'_id': 0})}
+
+    def save_digests(self, digests):
+        if digests:
+            self.db.daily_digests.bulk_write([
+                ReplaceOne({'_id': digest['user_id']}, dict(digest, _id=digest['user_id']), upsert=True)
+                for digest in digests
+            ], ordered=False)
+
+    def find_stats(self, user_id):
+        return self.db.user_stats.find_one({'user_id': user_id}, {ACTIVITY_FIELD: 0})
+
+    def ensure_stats(self, user_id):
+        user_stats = self.find_stats(user_id)
+        if not user_stats:
+            user_stats = default_user_stats(user_id)
+            self.db.user_stats.insert_one(user_stats)
+        return user_stats
+
+    def user_timezone(self, user_id):
+        user_stats = self.db.user_stats.find_one({'user_id': user_id}, {'timezone': 1})
+        return (user_stats or {}).get('timezone')
+
+    def set_timezone(self, user_id, timezone):
+        defaults = {key: value for key, value in default_user_stats(user_id).items() if key != 'user_id'}
+        self.db.user_stats.update_one(
+            {'user_id': user_id},
+            {'$set': {'timezone': timezone}, '$setOnInsert': defaults},
+            upsert=True
+        )
+
+    def record_completion(self, user_id, points, day, task_day=None):
+        self.db.user_stats.update_one(
+            {'user_id': user_id},
+            {
+                '$inc': {
+                    'total_points': points,
+                    'completed_tasks': 1
+                },
+                '$bit': mark_day_update(day)
+            }
+        )
+
+    def increment_streak(self, user_id):
+        self.db.user_stats.update_one({'user_id': user_id}, {'$inc': {'streak': 1}})
+
+    def set_streak(self, user_id, streak):
+        self.db.user_stats.update_one({'user_id': user_id}, {'$set': {'streak': streak}})
+
+    def all_stats(self):
+        return self.db.user_stats.find({}, {'user_id': 1, 'total_points': 1, 'streak': 1})
+
+    def activity_words(self, user_id):
+        user_stats = self.db.user_stats.find_one({'user_id': user_id}, {ACTIVITY_FIELD: 1})
+        return (user_stats or {}).get(ACTIVITY_FIELD) or {}
+
+    def latest_activity(self, user_id):
+        return self.db.activities.find_one({'user_id': user_id}, sort=[('timestamp', -1)])
+
+    def find_activities(self, user_id, since):
+        return list(self.db.activities.find({'user_id': user_id, 'timestamp': {'$gte': since}}))
+
+    def insert_activity(self, activity):
+        self.db.activities.insert_one(activity)
+
+    def find_micro_steps(self, key):
+        # Unique, so lookups use the index and racing upserts can't both insert
+        self._ensure_unique('micro_step_cache', 'key')
+        entry = self.db.micro_step_cache.find_one_and_update(
+            {'key': key},
+            {'$inc': {'hits': 1}},
+            projection={'steps': 1}
+        )
+        return entry['steps'] if entry else None
+
+    def save_micro_steps(self, key, steps):
+        self._ensure_unique('micro_step_cache', 'key')
+        try:
+            self.db.micro_step_cache.update_one(
+                {'key': key},
+                {'$setOnInsert': {'key': key, 'steps': steps, 'hits': 0, 'created_at': datetime.utcnow()}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # A concurrent upsert stored the same key first
+            pass
+
+    def save_timer(self, timer):
+        self.db.nudge_timers.update_one(
+            {'key': timer['key']},
+            {'$set': dict(timer, claimed_by=None)},
+            upsert=True
+        )
+
+    def delete_timer(self, key):
+        self.db.nudge_timers.delete_one({'key': key})
+
+    def load_timers(self, due_before=None):
+        self.db.nudge_timers.create_index('key', unique=True)
+        self.db.nudge_timers.create_index('due_at')
+        query = {'claimed_by': None}
+        if due_before:
+            query['due_at'] = {'$lt': due_before}
+        return self.db.nudge_timers.find(query, {'_id': 0, 'claimed_by': 0}, batch_size=10000)
+
+    def claim_timers(self, keys, now):
+        token = ObjectId()
+        self.db.nudge_timers.update_many(
+            {'key': {'$in': keys}, 'due_at': {'$lte': now}, 'claimed_by': None},
+            {'$set': {'claimed_by': token}}
+        )
+        claimed = list(self.db.nudge_timers.find({'claimed_by': token}, {'_id': 0, 'claimed_by': 0}))
+        self.db.nudge_timers.delete_many({'claimed_by': token})
+        return claimed
+
+
+def _encode(value):
+    """JSON default hook: datetimes are kept as {"$date": iso} like extended JSON"""
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat(timespec='microseconds')}
+    return str(value)
+
+
+def _decode(obj):
+    if len(obj) == 1 and '$date' in obj:
+        return datetime.fromisoformat(obj['$date'])
+    return obj
+
+
+def _timestamp(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat(timespec='microseconds') if value else None
+
+
+class SQLiteRepository(Repository):
+    """
+    Embedded single-node backend.
+
+    The database runs in WAL mode so readers never block the writer. Each
+    thread keeps its own connection, whose statement cache reuses the
+    prepared form of the fixed SQL below. Tasks keep their queried fields in
+    indexed columns and the rest of the document as compact v2 JSON.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            task_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            day INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT,
+            doc TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_tasks_user_created ON tasks (user_id, created_at);
+
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id TEXT PRIMARY KEY,
+            total_points INTEGER NOT NULL DEFAULT 0,
+            streak INTEGER NOT NULL DEFAULT 0,
+            total_tasks INTEGER NOT NULL DEFAULT 0,
+            completed_tasks INTEGER NOT NULL DEFAULT 0,
+            timezone TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS activity_words (
+            user_id TEXT NOT NULL,
+            word INTEGER NOT NULL,
+            bits INTEGER NOT NULL,
+            PRIMARY KEY (user_id, word)
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS activities (
+            activity_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            activity TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_activities_user_timestamp ON activities (user_id, timestamp);
+
+        CREATE TABLE IF NOT EXISTS micro_step_cache (
+            key TEXT PRIMARY KEY,
+            steps TEXT NOT NULL,
+            hits INTEGER NOT NULL DEFAULT 0,
+            created_at TEXT NOT NULL
+        ) WITHOUT ROWID;
+
+        CREATE TABLE IF NOT EXISTS nudge_timers (
+            key TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            due_at TEXT NOT NULL,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_nudge_timers_due ON nudge_timers (due_at);
+
+        CREATE TABLE IF NOT EXISTS task_templates (
+            template_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            doc TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_task_templates_user ON task_templates (user_id);
+
+        CREATE TABLE IF NOT EXISTS daily_digests (
+            user_id TEXT PRIMARY KEY,
+            day INTEGER NOT NULL,
+            fingerprint TEXT NOT NULL,
+            digest TEXT NOT NULL,
+            generated_at TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = thread_local()
+        self._conn().executescript(self.SCHEMA)
+        self.migrate_day_keys()
+        self._migrated_rowid = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        # The repository is built before gunicorn forks; a SQLite handle must
+        # not cross a fork, so each process opens its own
+        if conn is None or self._local.pid != os.getpid():
+            # Autocommit mode; multi-statement writes open their own transaction
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None,
+                                   check_same_thread=False, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA temp_store=MEMORY')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def _write(self, statements) -> None:
+        """Run several (sql, params) pairs in one immediate transaction"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def ping(self):
+        self._conn().execute('SELECT 1').fetchone()
+
+    @staticmethod
+    def _task(row) -> Dict:
+        doc = json.loads(row['doc'], object_hook=_decode)
+        if doc.get('v') != SCHEMA_VERSION:
+            doc['_id'] = doc['task_id']
+            return doc
+        doc.update(u=row['user_id'], dy=row['day'], s=row['status'])
+        return decode_task(doc, row['task_id'])
+
+    @staticmethod
+    def _task_doc(task: Dict) -> str:
+        """v2 JSON for the fields that have no column of their own"""
+        doc = encode_task(task)
+        for key in ('_id', 'u', 'dy', 's'):
+            doc.pop(key, None)
+        return json.dumps(doc, default=_encode)
+
+    def find_tasks(self, user_id, day, status=None):
+        if status:
+            rows = self._conn().execute(
+                'SELECT * FROM tasks WHERE user_id = ? AND day = ? AND status = ? ORDER BY created_at',
+                (user_id, day, status)
+            )
+        else:
+            rows = self._conn().execute(
+                'SELECT * FROM tasks WHERE user_id = ? AND day = ? ORDER BY created_at',
+                (user_id, day)
+            )
+        return [self._task(row) for row in rows]
+
+    def find_task(self, user_id, task_id):
+        row = self._conn().execute(
+            'SELECT * FROM tasks WHERE task_id = ? AND user_id = ?',
+            (task_id, user_id)
+        ).fetchone()
+        return self._task(row) if row else None
+
+    def insert_task(self, task):
+        self._conn().execute(
+            'INSERT INTO tasks (task_id, user_id, day, status, created_at, doc) VALUES (?, ?, ?, ?, ?, ?)',
+            (task['task_id'], task['user_id'], task['day'], task['status'],
+             _timestamp(task.get('created_at')), self._task_doc(task))
+        )
+        task['_id'] = task['task_id']
+
+    def update_task(self, task_id, fields):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT * FROM tasks WHERE task_id = ?', (task_id,)).fetchone()
+            if row:
+                # Rewriting the document also moves a v1 task to v2
+                task = self._task(row)
+                task.update(fields)
+                conn.execute(
+                    'UPDATE tasks SET day = ?, status = ?, doc = ? WHERE task_id = ?',
+                    (task['day'], task['status'], self._task_doc(task), task_id)
+                )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def count_tasks(self, user_id, day=None, status=None, since_day=None):
+        sql = 'SELECT COUNT(*) FROM tasks WHERE user_id = ?'
+        params = [user_id]
+        if day is not None:
+            sql += ' AND day = ?'
+            params.append(day)
+        elif since_day is not None:
+            sql += ' AND day >= ?'
+            params.append(since_day)
+        if status:
+            sql += ' AND status = ?'
+            params.append(status)
+        return self._conn().execute(sql, params).fetchone()[0]
+
+    def clear_expired_speculations(self, now):
+        # Updated tasks are always rewritten as v2, so speculations are only under 'sc'
+        return self._conn().execute(
+            """UPDATE tasks SET doc = json_remove(doc, '$.sc')
+               WHERE json_extract(doc, '$.sc.expires_at."$date"') < ?""",
+            (_timestamp(now),)
+        ).rowcount
+
+    def migrate_day_keys(self):
+        """Move a database from date-string task keys to integer days, in place"""
+        conn = self._conn()
+        migrated = 0
+        task_columns = {row['name'] for row in conn.execute('PRAGMA table_info(tasks)')}
+        if 'day' not in task_columns:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('ALTER TABLE tasks ADD COLUMN day INTEGER')
+                migrated = conn.execute(
+                    "UPDATE tasks SET day = CAST(julianday(date) - julianday('1970-01-01') AS INTEGER), "
+                    "doc = json_set(doc, '$.day', CAST(julianday(date) - julianday('1970-01-01') AS INTEGER))"
+                ).rowcount
+                conn.execute('DROP INDEX IF EXISTS idx_tasks_user_date_status')
+                conn.execute('ALTER TABLE tasks DROP COLUMN date')
+                conn.execute('COMMIT')
+            except Exception:
+                conn.execute('ROLLBACK')
+                raise
+        stats_columns = {row['name'] for row in conn.execute('PRAGMA table_info(user_stats)')}
+        if 'timezone' not in stats_columns:
+            conn.execute('ALTER TABLE user_stats ADD COLUMN timezone TEXT')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_tasks_user_day_status ON tasks (user_id, day, status)')
+        return migrated
+
+    def migrate_task_schema(self, batch_size):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                'SELECT rowid, * FROM tasks WHERE rowid > ? ORDER BY rowid LIMIT ?',
+                (self._migrated_rowid, batch_size)
+            ).fetchall()
+            legacy = [row for row in rows if json.loads(row['doc']).get('v') != SCHEMA_VERSION]
+            conn.executemany(
+                'UPDATE tasks SET doc = ? WHERE rowid = ?',
+                [(self._task_doc(self._task(row)), row['rowid']) for row in legacy]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        if rows:
+            self._migrated_rowid = rows[-1]['rowid']
+        return len(rows)
+
+    def find_templates(self, user_id):
+        rows = self._conn().execute('SELECT doc FROM task_templates WHERE user_id = ?', (user_id,))
+        return [json.loads(row['doc'], object_hook=_decode) for row in rows]
+
+    def insert_template(self, template):
+        self._conn().execute(
+            'INSERT INTO task_templates (template_id, user_id, doc) VALUES (?, ?, ?)',
+            (template['template_id'], template['user_id'], json.dumps(template, default=_encode))
+        )
+
+    def delete_template(self, user_id, template_id):
+        return self._conn().execute(
+            'DELETE FROM task_templates WHERE template_id = ? AND user_id = ?', (template_id, user_id)
+        ).rowcount > 0
+
+    def _fetch_batches(self, sql, params, batch_size, convert) -> Iterator[Dict]:
+        cursor = self._conn().execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            for row in rows:
+                yield convert(row)
+
+    def iter_tasks(self, user_id, batch_size=1000, since_day=None):
+        if since_day is not None:
+            return self._fetch_batches(
+                'SELECT * FROM tasks WHERE user_id = ? AND day >= ?', (user_id, since_day), batch_size, self._task
+            )
+        return self._fetch_batches(
+            'SELECT * FROM tasks WHERE user_id = ? ORDER BY created_at', (user_id,), batch_size, self._task
+        )
+
+    def iter_activities(self, user_id, batch_size=1000):
+        return self._fetch_batches(
+            'SELECT * FROM activities WHERE user_id = ? ORDER BY timestamp', (user_id,), batch_size, self._activity
+        )
+
+    def _insert_many(self, sql, rows) -> int:
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            before = conn.total_changes
+            conn.executemany(sql, rows)
+            inserted = conn.total_changes - before
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return inserted
+
+    def insert_tasks(self, tasks):
+        return self._insert_many(
+            'INSERT OR IGNORE INTO tasks (task_id, user_id, day, status, created_at, doc) VALUES (?, ?, ?, ?, ?, ?)',
+            [(task['task_id'], task['user_id'], task['day'], task['status'],
+              _timestamp(task.get('created_at')), self._task_doc(task)) for task in tasks]
+        )
+
+    def insert_activities(self, activities):
+        return self._insert_many(
+            'INSERT OR IGNORE INTO activities (activity_id, user_id, activity, timestamp, data) VALUES (?, ?, ?, ?, ?)',
+            [(activity['activity_id'], activity['user_id'], activity['activity'],
+              _timestamp(activity['timestamp']), json.dumps(activity.get('data', {}), default=_encode))
+             for activity in activities]
+        )
+
+    def insert_templates(self, templates):
+        return self._insert_many(
+            'INSERT OR IGNORE INTO task_templates (template_id, user_id, doc) VALUES (?, ?, ?)',
+            [(template['template_id'], template['user_id'], json.dumps(template, default=_encode))
+             for template in templates]
+        )
+
+    def restore_stats(self, user_id, stats, words):
+        self._write([
+            ('INSERT OR REPLACE INTO user_stats (user_id, total_points, streak, total_tasks, completed_tasks, timezone) '
+             'VALUES (?, ?, ?, ?, ?, ?)',
+             (user_id, stats.get('total_points', 0), stats.get('streak', 0), stats.get('total_tasks', 0),
+              stats.get('completed_tasks', 0), stats.get('timezone'))),
+            ('DELETE FROM activity_words WHERE user_id = ?', (user_id,))
+        ] + [
+            ('INSERT INTO activity_words (user_id, word, bits) VALUES (?, ?, ?)', (user_id, word, bits))
+            for word, bits in words.items()
+        ])
+
+    def iter_user_stats(self, batch_size=1000):
+        return self._fetch_batches('SELECT user_id, streak, timezone FROM user_stats', (), batch_size, dict)
+
+    def find_tasks_for_users(self, user_ids, days):
+        rows = self._conn().execute(
+            f"SELECT * FROM tasks WHERE user_id IN ({','.join('?' * len(user_ids))}) "
+            f"AND day IN ({','.join('?' * len(days))}) ORDER BY created_at",
+            (*user_ids, *days)
+        )
+        return [self._task(row) for row in rows]
+
+    @staticmethod
+    def _digest(row) -> Dict:
+        digest = dict(row)
+        digest['generated_at'] = datetime.fromisoformat(digest['generated_at'])
+        return digest
+
+    def find_digest(self, user_id):
+        row = self._conn().execute('SELECT * FROM daily_digests WHERE user_id = ?', (user_id,)).fetchone()
+        return self._digest(row) if row else None
+
+    def find_digests(self, user_ids):
+        rows = self._conn().execute(
+            f"SELECT * FROM daily_digests WHERE user_id IN ({','.join('?' * len(user_ids))})", user_ids
+        )
+        return {row['user_id']: self._digest(row) for row in rows}
+
+    def save_digests(self, digests):
+        self._write([
+            ('INSERT OR REPLACE INTO daily_digests (user_id, day, fingerprint, digest, generated_at) '
+             'VALUES (?, ?, ?, ?, ?)',
+             (digest['user_id'], digest['day'], digest['fingerprint'], digest['digest'],
+              _timestamp(digest['generated_at'])))
+            for digest in digests
+        ])
+
+    def find_stats(self, user_id):
+        row = self._conn().execute('SELECT * FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
+        return dict(row) if row else None
+
+    def ensure_stats(self, user_id):
+        self._conn().execute('INSERT OR IGNORE INTO user_stats (user_id) VALUES (?)', (user_id,))
+        return self.find_stats(user_id)
+
+    def user_timezone(self, user_id):
+        row = self._conn().execute('SELECT timezone FROM user_stats WHERE user_id = ?', (user_id,)).fetchone()
+        return row['timezone'] if row else None
+
+    def set_timezone(self, user_id, timezone):
+        self._conn().execute(
+            'INSERT INTO user_stats (user_id, timezone) VALUES (?, ?) '
+            'ON CONFLICT (user_id) DO UPDATE SET timezone = excluded.timezone',
+            (user_id, timezone)
+        )
+
+    def record_completion(self, user_id, points, day, task_day=None):
+        word, mask = day_word(day)
+        self._write([
+            ('UPDATE user_stats SET total_points = total_points + ?, completed_tasks = completed_tasks + 1 '
+             'WHERE user_id = ?', (points, user_id)),
+            ('INSERT INTO activity_words (user_id, word, bits) VALUES (?, ?, ?) '
+             'ON CONFLICT (user_id, word) DO UPDATE SET bits = bits | excluded.bits', (user_id, word, mask))
+        ])
+
+    def increment_streak(self, user_id):
+        self._conn().execute('UPDATE user_stats SET streak = streak + 1 WHERE user_id = ?', (user_id,))
+
+    def set_streak(self, user_id, streak):
+        self._conn().execute('UPDATE user_stats SET streak = ? WHERE user_id = ?', (streak, user_id))
+
+    def all_stats(self):
+        rows = self._conn().execute('SELECT user_id, total_points, streak FROM user_stats')
+        return [dict(row) for row in rows]
+
+    def activity_words(self, user_id):
+        rows = self._conn().execute('SELECT word, bits FROM activity_words WHERE user_id = ?', (user_id,))
+        return {row['word']: row['bits'] for row in rows}
+
+    @staticmethod
+    def _activity(row) -> Dict:
+        activity = dict(row)
+        activity['timestamp'] = datetime.fromisoformat(activity['timestamp'])
+        activity['data'] = json.loads(activity['data'], object_hook=_decode) if activity['data'] else {}
+        activity['_id'] = activity['activity_id']
+        return activity
+
+    def latest_activity(self, user_id):
+        row = self._conn().execute(
+            'SELECT * FROM activities WHERE user_id = ? ORDER BY timestamp DESC LIMIT 1',
+            (user_id,)
+        ).fetchone()
+        return self._activity(row) if row else None
+
+    def find_activities(self, user_id, since):
+        rows = self._conn().execute(
+            'SELECT * FROM activities WHERE user_id = ? AND timestamp >= ? ORDER BY timestamp',
+            (user_id, _timestamp(since))
+        )
+        return [self._activity(row) for row in rows]
+
+    def insert_activity(self, activity):
+        self._conn().execute(
+            'INSERT INTO activities (activity_id, user_id, activity, timestamp, data) VALUES (?, ?, ?, ?, ?)',
+            (activity['activity_id'], activity['user_id'], activity['activity'],
+             _timestamp(activity['timestamp']), json.dumps(activity.get('data', {}), default=_encode))
+        )
+        activity['_id'] = activity['activity_id']
+
+    def find_micro_steps(self, key):
+        # Fetch all so the write statement finishes and releases its lock
+        rows = self._conn().execute(
+            'UPDATE micro_step_cache SET hits = hits + 1 WHERE key = ? RETURNING steps', (key,)
+        ).fetchall()
+        return json.loads(rows[0]['steps']) if rows else None
+
+    def save_micro_steps(self, key, steps):
+        self._conn().execute(
+            'INSERT OR IGNORE INTO micro_step_cache (key, steps, created_at) VALUES (?, ?, ?)',
+            (key, json.dumps(steps), _timestamp(datetime.utcnow()))
+        )
+
+    @staticmethod
+    def _timer(row) -> Dict:
+        timer = dict(row)
+        timer['due_at'] = datetime.fromisoformat(timer['due_at'])
+        timer['data'] = json.loads(timer['data'], object_hook=_decode) if timer['data'] else {}
+        return timer
+
+    def save_timer(self, timer):
+        self._conn().execute(
+            'INSERT OR REPLACE INTO nudge_timers (key, user_id, kind, due_at, data) VALUES (?, ?, ?, ?, ?)',
+            (timer['key'], timer['user_id'], timer['kind'], _timestamp(timer['due_at']),
+             json.dumps(timer.get('data', {}), default=_encode))
+        )
+
+    def delete_timer(self, key):
+        self._conn().execute('DELETE FROM nudge_timers WHERE key = ?', (key,))
+
+    def load_timers(self, due_before=None):
+        if due_before:
+            rows = self._conn().execute('SELECT * FROM nudge_timers WHERE due_at < ?', (_timestamp(due_before),))
+        else:
+            rows = self._conn().execute('SELECT * FROM nudge_timers')
+        return [self._timer(row) for row in rows]
+
+    def claim_timers(self, keys, now):
+        conn = self._conn()
+        placeholders = ','.join('?' * len(keys))
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(
+                f'SELECT * FROM nudge_timers WHERE key IN ({placeholders}) AND due_at <= ?',
+                (*keys, _timestamp(now))
+            ).fetchall()
+            conn.executemany('DELETE FROM nudge_timers WHERE key = ?', [(row['key'],) for row in rows])
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return [self._timer(row) for row in rows]
+
+
+def create_repository(app, config) -> Repository:
+    """
+    Pick the storage backend named by Config.STORAGE_BACKEND, optionally
+    behind the shared hot stats segment or the write-through user_stats cache
+    """
+    if config.STORAGE_BACKEND == 'sqlite':
+        repository = SQLiteRepository(config.SQLITE_PATH)
+    elif config.STORAGE_BACKEND == 'mongo':
+        # connect=False: the client is created before gunicorn forks and
+        # must only open sockets (and its monitor threads) in the workers
+        mongo = PyMongo(
+            app,
+            connect=False,
+            minPoolSize=config.MONGO_MIN_POOL_SIZE,
+            maxPoolSize=config.MONGO_MAX_POOL_SIZE
+        )
+        repository = MongoRepository(mongo)
+    else:
+        raise ValueError(f"Unknown STORAGE_BACKEND: {config.STORAGE_BACKEND}")
+
+    if config.HOT_STATS_ENABLED:
+        # Supersedes the per-process cache: one shared copy per host
+        segment = HotStatsSegment(config.HOT_STATS_PATH, config.HOT_STATS_SLOTS)
+        repository = HotStatsRepository(repository, segment, config.HOT_STATS_MAX_AGE_SECONDS)
+    elif config.STATS_CACHE_ENABLED:
+        channel = VersionChannel(config.STATS_CACHE_CHANNEL_PATH)
+        repository = CachedStatsRepository(repository, channel, config.STATS_CACHE_MAX_ENTRIES)
+    return repository
@@ -0,0 +1,261 @@
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional
+
+from activity_calendar import day_from_number
+from metrics import metrics
+from micro_steps import FILLER_WORDS
+
+_TOKEN = re.compile(r'\w+')
+
+# BM25 parameters; title words count TITLE_BOOST times a description word
+K1 = 1.2
+B = 0.75
+TITLE_BOOST = 2.0
+
+# The last query word also matches words it is a prefix of, at a discount
+MIN_PREFIX = 2
+PREFIX_DISCOUNT = 0.8
+
+
+def tokenize(text: str) -> List[str]:
+    text = unicodedata.normalize('NFKC', text or '').casefold()
+    return [token for token in _TOKEN.findall(text) if token not in FILLER_WORDS]
+
+
+class UserIndex:
+    """
+    Inverted index over one user's task titles and descriptions.
+
+    Tasks get dense slot numbers; each term maps to {slot: weighted term
+    frequency}. A sorted copy of the vocabulary answers prefix lookups with
+    a binary search.
+    """
+
+    def __init__(self):
+        self.task_ids: List[str] = []
+        self.titles: List[str] = []
+        self.days: List[int] = []
+        self.lengths: List[float] = []
+        self.total_length = 0.0
+        self._norms: List[float] = []
+        self.slots: Dict[str, int] = {}
+        self.postings: Dict[str, Dict[int, float]] = {}
+        self.terms: List[str] = []
+        self.sorted = False
+        self.max_day = 0
+        self.checked_at = 0.0
+        self.lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self.task_ids)
+
+    def add(self, task: Dict) -> bool:
+        """Index a task unless it already is; returns whether it was added"""
+        if task['task_id'] in self.slots:
+            return False
+        slot = len(self.task_ids)
+        self.slots[task['task_id']] = slot
+        self.task_ids.append(task['task_id'])
+        self.titles.append(task.get('title', ''))
+        self.days.append(task.get('day', 0))
+        self.max_day = max(self.max_day, task.get('day', 0))
+
+        weights = Counter()
+        for term in tokenize(task.get('title')):
+            weights[term] += TITLE_BOOST
+        for term in tokenize(task.get('description')):
+            weights[term] += 1
+        for term, weight in weights.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                if self.sorted:
+                    insort(self.terms, term)
+            postings[slot] = weight
+
+        length = sum(weights.values())
+        self.lengths.append(length)
+        self.total_length += length
+        self._norms = []
+        return True
+
+    def _length_norms(self) -> List[float]:
+        """BM25's per-task length normalization, recomputed after tasks are added"""
+        if len(self._norms) != len(self.lengths):
+            average_length = self.total_length / len(self.lengths) or 1.0
+            self._norms = [K1 * (1 - B + B * length / average_length) for length in self.lengths]
+        return self._norms
+
+    def _expand(self, token: str, prefix: bool) -> List[str]:
+        if not prefix:
+            return [token] if token in self.postings else []
+        if not self.sorted:
+            self.terms = sorted(self.postings)
+            self.sorted = True
+        terms = []
+        i = bisect_left(self.terms, token)
+        while i < len(self.terms) and self.terms[i].startswith(token):
+            terms.append(self.terms[i])
+            i += 1
+        return terms
+
+    def search(self, query: str, limit: int = 20) -> List[Dict]:
+        """
+        Tasks containing every query word (the last one as a prefix),
+        ranked by BM25 score and then by recency
+        """
+        tokens = tokenize(query)
+        if not tokens or not self.task_ids:
+            return []
+
+        count = len(self.task_ids)
+        norms = self._length_norms()
+
+        # (expansions, number of postings) per query word, rarest word first
+        words = []
+        for i, token in enumerate(tokens):
+            prefix = i == len(tokens) - 1 and len(token) >= MIN_PREFIX
+            terms = self._expand(token, prefix)
+            if not terms:
+                return []
+            words.append((token, terms, sum(len(self.postings[term]) for term in terms)))
+        words.sort(key=lambda word: word[2])
+
+        scores: Optional[Dict[int, float]] = None
+        for token, terms, size in words:
+            matches: Dict[int, float] = {}
+            for term in terms:
+                postings = self.postings[term]
+                weight = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5)) * (K1 + 1)
+                if term != token:
+                    weight *= PREFIX_DISCOUNT
+                # Once candidates are fewer than postings, probe instead of scanning
+                candidates = postings.items() if scores is None else (
+                    (slot, postings[slot]) for slot in scores if slot in postings)
+                for slot, tf in candidates:
+                    score = weight * tf / (tf + norms[slot])
+                    if score > matches.get(slot, 0.0):
+                        matches[slot] = score
+            if scores is not None:
+                matches = {slot: scores[slot] + score for slot, score in matches.items()}
+            scores = matches
+            if not scores:
+                return []
+
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], self.days[item[0]]))
+        return [{
+            'task_id': self.task_ids[slot],
+            'title': self.titles[slot],
+            'date': day_from_number(self.days[slot]).isoformat(),
+            'score': round(score, 3)
+        } for slot, score in best]
+
+
+class SearchIndex:
+    """
+    Per-user task search indexes held in this worker's memory.
+
+    A user's index is built from the repository on their first search and
+    kept up to date by add() for tasks this worker creates. Tasks written
+    by other workers are picked up by comparing the stored task count at
+    most every refresh_seconds: recent days are re-read, and the index is
+    rebuilt if that doesn't account for the difference. The least recently
+    searched users are dropped beyond max_users.
+    """
+
+    def __init__(self, repository, max_users: int = 1000, refresh_seconds: float = 5, batch_size: int = 1000):
+        self.repository = repository
+        self.max_users = max_users
+        self.refresh_seconds = refresh_seconds
+        self.batch_size = batch_size
+        self._indexes: 'OrderedDict[str, UserIndex]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._build_locks = [threading.Lock() for _ in range(64)]
+        self._builds = 0
+        self._refreshes = 0
+        self._queries = 0
+        metrics.register('search_index', self.stats)
+
+    def _build(self, user_id: str) -> UserIndex:
+        index = UserIndex()
+        for task in self.repository.iter_tasks(user_id, self.batch_size):
+            index.add(task)
+        index.checked_at = time.monotonic()
+        self._builds += 1
+        return index
+
+    def _refresh(self, user_id: str, index: UserIndex) -> UserIndex:
+        with index.lock:
+            if time.monotonic() - index.checked_at < self.refresh_seconds:
+                return index
+            stored = self.repository.count_tasks(user_id)
+            if stored != len(index):
+                self._refreshes += 1
+                # Catch up on recent days (a day back for timezone differences)
+                for task in self.repository.iter_tasks(user_id, self.batch_size, since_day=index.max_day - 1):
+                    index.add(task)
+            index.checked_at = time.monotonic()
+        if stored != len(index):
+            return self.rebuild(user_id)
+        return index
+
+    def _index(self, user_id: str) -> UserIndex:
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+        if index is not None:
+            return self._refresh(user_id, index)
+
+        with self._build_locks[hash(user_id) % len(self._build_locks)]:
+            with self._lock:
+                index = self._indexes.get(user_id)
+            if index is None:
+                index = self._store(user_id, self._build(user_id))
+        return index
+
+    def _store(self, user_id: str, index: UserIndex) -> UserIndex:
+        with self._lock:
+            self._indexes[user_id] = index
+            self._indexes.move_to_end(user_id)
+            while len(self._indexes) > self.max_users:
+                self._indexes.popitem(last=False)
+        return index
+
+    def search(self, user_id: str, query: str, limit: int = 20) -> List[Dict]:
+        index = self._index(user_id)
+        self._queries += 1
+        with index.lock:
+            return index.search(query, limit)
+
+    def add(self, task: Dict) -> None:
+        """Index a new task if its user's index is loaded; otherwise the next build reads it"""
+        with self._lock:
+            index = self._indexes.get(task['user_id'])
+        if index is not None:
+            with index.lock:
+                index.add(task)
+
+    def rebuild(self, user_id: str) -> UserIndex:
+        return self._store(user_id, self._build(user_id))
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._indexes.pop(user_id, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'users': len(self._indexes),
+                'tasks': sum(len(index) for index in self._indexes.values()),
+                'builds': self._builds,
+                'refreshes': self._refreshes,
+                'queries': self._queries
+            }
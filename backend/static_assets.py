@@ -0,0 +1,94 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict
+
+from flask import Response, jsonify, request
+
+from compression import brotli, choose_encoding
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+IMMUTABLE_CACHE = 'public, max-age=31536000, immutable'
+
+
+class Asset:
+    __slots__ = ('data', 'mimetype', 'etag', 'variants')
+
+    def __init__(self, data: bytes, mimetype: str):
+        self.data = data
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(data).hexdigest()[:20]
+        self.variants = {}
+
+
+def load_assets(build_dir: str, min_bytes: int = 512) -> Dict[str, Asset]:
+    """
+    Read the React build into memory, with gzip and (when installed) brotli
+    variants of every compressible file precomputed at maximum level.
+    """
+    assets = {}
+    for root, _, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            key = os.path.relpath(path, build_dir).replace(os.sep, '/')
+            mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+            with open(path, 'rb') as f:
+                asset = Asset(f.read(), mimetype)
+
+            if len(asset.data) >= min_bytes and mimetype.startswith(COMPRESSIBLE_TYPES):
+                asset.variants['gzip'] = gzip.compress(asset.data, compresslevel=9)
+                if brotli is not None:
+                    asset.variants['br'] = brotli.compress(asset.data, quality=11)
+            assets[key] = asset
+    return assets
+
+
+def init_static_assets(app, build_dir: str) -> None:
+    """
+    Serve the frontend build from this app so the UI and API share an
+    origin. Files under static/ have content hashes in their names and are
+    cached as immutable; index.html is revalidated with its ETag.
+    """
+    if not os.path.isdir(build_dir):
+        print(f"Frontend build directory {build_dir} not found; run the frontend build to serve the UI")
+    assets = load_assets(build_dir)
+    print(f"Serving {len(assets)} frontend assets from {build_dir}")
+    if assets and 'index.html' not in assets:
+        print(f"Frontend build in {build_dir} has no index.html")
+
+    def serve(key: str) -> Response:
+        asset = assets[key]
+        if key.startswith('static/'):
+            cache_control = IMMUTABLE_CACHE
+        else:
+            cache_control = 'no-cache'
+
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        body = asset.variants.get(encoding) if encoding else None
+        # Each encoded representation gets its own ETag
+        etag = f'{asset.etag}-{encoding}' if body else asset.etag
+
+        if request.if_none_match.contains(etag):
+            response = Response(status=304)
+        else:
+            response = Response(body or asset.data, mimetype=asset.mimetype)
+            if body:
+                response.headers['Content-Encoding'] = encoding
+
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        if asset.variants:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    @app.route('/', defaults={'path': ''})
+    @app.route('/<path:path>')
+    def frontend(path):
+        if path in assets:
+            return serve(path)
+        if path.startswith(('api/', 'static/')) or 'index.html' not in assets:
+            # Also when there is no build to render the app shell from
+            return jsonify({'message': 'Not found!'}), 404
+        # Client-side routes all render the app shell
+        return serve('index.html')
@@ -0,0 +1,184 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from gevent_compat import lock_exclusive
+from metrics import metrics
+
+_SLOT = struct.Struct('Q')
+
+
+class VersionChannel:
+    """
+    Cross-process invalidation channel for per-user cache entries.
+
+    A memory-mapped file holds one 64-bit version counter per hash slot.
+    Every gunicorn worker on the host maps the same file. Writers bump the
+    user's slot while holding a byte-range lock on it. Readers compare the
+    slot with the version their cached copy was taken at, which costs no
+    system call. Hash collisions only cause extra invalidations.
+    """
+
+    def __init__(self, path: str, slots: int = 65536):
+        self.slots = slots
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = slots * _SLOT.size
+        if os.fstat(self._fd).st_size < size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+
+    def _offset(self, key: str) -> int:
+        return (zlib.crc32(key.encode()) % self.slots) * _SLOT.size
+
+    def version(self, key: str) -> int:
+        return _SLOT.unpack_from(self._map, self._offset(key))[0]
+
+    @contextmanager
+    def locked(self, key: str):
+        """Exclusive, cross-process lock on a key's slot"""
+        offset = self._offset(key)
+        lock_exclusive(self._fd, _SLOT.size, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, _SLOT.size, offset)
+
+    def bump(self, key: str) -> int:
+        """Advance a key's version; call while holding locked(key)"""
+        offset = self._offset(key)
+        version = _SLOT.unpack_from(self._map, offset)[0] + 1
+        _SLOT.pack_into(self._map, offset, version)
+        return version
+
+
+class _Entry:
+    __slots__ = ('doc', 'version')
+
+    def __init__(self, doc: Dict, version: int):
+        self.doc = doc
+        self.version = version
+
+
+class CachedStatsRepository:
+    """
+    Write-through cache of user_stats documents in front of a Repository.
+
+    Stat writes are serialized per user across workers by the channel lock.
+    Under that lock a worker writes to the database and then applies the
+    same change to its cached copy, if that copy is still current. It then
+    bumps the version, so other workers drop their copies and re-read.
+    Everything except the stats methods goes straight to the wrapped
+    repository.
+    """
+
+    def __init__(self, repository, channel: VersionChannel, max_entries: int = 10000):
+        self._repository = repository
+        self._channel = channel
+        self._max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # fcntl locks are per process, so writer threads also take a striped local lock
+        self._write_locks = [threading.Lock() for _ in range(64)]
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        metrics.register('stats_cache', self.stats)
+
+    def __getattr__(self, name):
+        return getattr(self._repository, name)
+
+    def _cached(self, user_id: str) -> Optional[_Entry]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return None
+        if entry.version != self._channel.version(user_id):
+            del self._entries[user_id]
+            self._invalidations += 1
+            return None
+        self._entries.move_to_end(user_id)
+        return entry
+
+    def _store(self, user_id: str, doc: Dict, version: int) -> None:
+        self._entries[user_id] = _Entry(doc, version)
+        self._entries.move_to_end(user_id)
+        if len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+
+    def _load(self, user_id: str, loader) -> Optional[Dict]:
+        with self._lock:
+            entry = self._cached(user_id)
+            if entry is not None:
+                self._hits += 1
+                return dict(entry.doc)
+            self._misses += 1
+
+        # Read the version first: a write landing in between leaves the copy
+        # tagged with an older version, so it is dropped on the next read
+        version = self._channel.version(user_id)
+        doc = loader(user_id)
+        if doc is not None:
+            with self._lock:
+                self._store(user_id, dict(doc), version)
+        return doc
+
+    def _write(self, user_id: str, write, apply) -> None:
+        write_lock = self._write_locks[zlib.crc32(user_id.encode()) % len(self._write_locks)]
+        with write_lock, self._channel.locked(user_id):
+            with self._lock:
+                entry = self._cached(user_id)
+            write()
+            version = self._channel.bump(user_id)
+            with self._lock:
+                # Only patch the copy we validated; a copy re-read meanwhile
+                # carries an older version and gets dropped on the next read
+                if entry is not None and self._entries.get(user_id) is entry:
+                    apply(entry.doc)
+                    entry.version = version
+
+    def find_stats(self, user_id):
+        return self._load(user_id, self._repository.find_stats)
+
+    def ensure_stats(self, user_id):
+        return self._load(user_id, self._repository.ensure_stats)
+
+    def record_completion(self, user_id, points, day, task_day=None):
+        def apply(doc):
+            doc['total_points'] = doc.get('total_points', 0) + points
+            doc['completed_tasks'] = doc.get('completed_tasks', 0) + 1
+
+        self._write(user_id, lambda: self._repository.record_completion(user_id, points, day, task_day), apply)
+
+    def increment_streak(self, user_id):
+        def apply(doc):
+            doc['streak'] = doc.get('streak', 0) + 1
+
+        self._write(user_id, lambda: self._repository.increment_streak(user_id), apply)
+
+    def set_streak(self, user_id, streak):
+        def apply(doc):
+            doc['streak'] = streak
+
+        self._write(user_id, lambda: self._repository.set_streak(user_id, streak), apply)
+
+    def restore_stats(self, user_id, stats, words):
+        def apply(doc):
+            doc.update((key, value) for key, value in stats.items() if key in doc)
+
+        self._write(user_id, lambda: self._repository.restore_stats(user_id, stats, words), apply)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'hits': self._hits,
+                'misses': self._misses,
+                'invalidations': self._invalidations,
+                'hit_rate': round(self._hits / lookups, 4) if lookups else 0.0
+            }
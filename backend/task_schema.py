@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from datetime import date
+from typing import Dict, Optional, Tuple
+
+from bson import Binary
+
+from activity_calendar import day_from_number, day_number
+from metrics import metrics
+
+# Task documents are stored in one of two shapes:
+#   v1 (no 'v' field): the API dict as is, with an ObjectId _id next to a
+#       36-char string task_id, string enums and a redundant date string.
+#   v2 ('v': 2): _id is the task_id as a 16-byte binary UUID, fields use the
+#       short keys below, priority and status are small integers, and empty
+#       description, micro_steps and speculative_celebration are left out.
+# Routes only ever see the v1/API shape; decode_task reads either version.
+SCHEMA_VERSION = 2
+
+KEYS = {
+    'user_id': 'u',
+    'title': 't',
+    'description': 'd',
+    'priority': 'p',
+    'estimated_duration': 'e',
+    'status': 's',
+    'created_at': 'c',
+    'completed_at': 'ca',
+    'day': 'dy',
+    'micro_steps': 'm',
+    'points_value': 'pv',
+    'speculative_celebration': 'sc'
+}
+NAMES = {key: name for name, key in KEYS.items()}
+
+PRIORITIES = ('low', 'medium', 'high')
+STATUSES = ('pending', 'completed')
+ENUMS = {'priority': PRIORITIES, 'status': STATUSES}
+
+# Fields left out of v2 documents when empty, and what they read back as
+OMITTED_WHEN_EMPTY = {'description': '', 'micro_steps': []}
+
+
+def task_key(task_id: str) -> Optional[Binary]:
+    """The v2 _id for a task_id, or None if it isn't a UUID"""
+    try:
+        return Binary.from_uuid(uuid.UUID(task_id))
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def status_code(status: str) -> int:
+    return STATUSES.index(status)
+
+
+def encode_value(name: str, value):
+    if name in ENUMS and value in ENUMS[name]:
+        return ENUMS[name].index(value)
+    return value
+
+
+def decode_value(name: str, value):
+    if name in ENUMS and isinstance(value, int):
+        return ENUMS[name][value]
+    return value
+
+
+def encode_fields(fields: Dict) -> Tuple[Dict, Dict]:
+    """Stored ($set, $unset) for an update given in API field names"""
+    updates, removals = {}, {}
+    for name, value in fields.items():
+        key = KEYS.get(name, name)
+        if value is None or (name in OMITTED_WHEN_EMPTY and value == OMITTED_WHEN_EMPTY[name]):
+            removals[key] = ''
+        else:
+            updates[key] = encode_value(name, value)
+    return updates, removals
+
+
+def encode_task(task: Dict) -> Dict:
+    """v2 document for a task in API (or v1) shape"""
+    doc = {'_id': task_key(task['task_id']), 'v': SCHEMA_VERSION}
+    for name, value in task.items():
+        if name in ('_id', 'task_id', 'date', 'v'):
+            continue
+        if value is None or (name in OMITTED_WHEN_EMPTY and value == OMITTED_WHEN_EMPTY[name]):
+            continue
+        doc[KEYS.get(name, name)] = encode_value(name, value)
+    if 'dy' not in doc:
+        # v1 tasks saved before day keys only have the date string
+        doc['dy'] = day_number(date.fromisoformat(task['date']))
+    return doc
+
+
+def decode_task(doc: Dict, task_id: Optional[str] = None) -> Dict:
+    """API-shaped task from a stored document of either version"""
+    if doc.get('v') != SCHEMA_VERSION:
+        return doc
+
+    if task_id is None:
+        key = doc['_id']
+        task_id = str(key.as_uuid() if isinstance(key, Binary) else key)
+    task = {'_id': task_id, 'task_id': task_id}
+    task.update((name, list(value) if isinstance(value, list) else value)
+                for name, value in OMITTED_WHEN_EMPTY.items())
+    for key, value in doc.items():
+        if key in ('_id', 'v'):
+            continue
+        name = NAMES.get(key, key)
+        task[name] = decode_value(name, value)
+    task['date'] = day_from_number(task['day']).isoformat()
+    return task
+
+
+class SchemaMigrator:
+    """
+    Rewrites stored v1 tasks as v2 a batch at a time, sleeping between
+    batches so the migration never competes with request traffic. Reads
+    handle both versions meanwhile, so it can run in the background of a
+    live worker, be stopped and resume later.
+    """
+
+    def __init__(self, repository, batch_size: int = 500, pause_seconds: float = 0.5):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.pause_seconds = pause_seconds
+        self._processed = 0
+        self._batches = 0
+        self._done = False
+        self._thread = None
+        metrics.register('task_schema_migration', self.stats)
+
+    def run(self) -> int:
+        """Migrate until no v1 tasks remain; returns how many tasks were processed"""
+        while True:
+            processed = self.repository.migrate_task_schema(self.batch_size)
+            if not processed:
+                self._done = True
+                return self._processed
+            self._processed += processed
+            self._batches += 1
+            time.sleep(self.pause_seconds)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        def run_logged():
+            try:
+                processed = self.run()
+                if processed:
+                    print(f"Task schema migration processed {processed} tasks")
+            except Exception as e:
+                print(f"Task schema migration failed: {e}")
+
+        self._thread = threading.Thread(target=run_logged, name='task-schema-migration', daemon=True)
+        self._thread.start()
+
+    def stats(self) -> Dict:
+        return {
+            'processed': self._processed,
+            'batches': self._batches,
+            'done': self._done
+        }
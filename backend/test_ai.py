@@ -1,15 +1,15 @@
-import openai
 from config import Config
+from llm_client import create_llm_client
 
 # Set up OpenAI
-openai.api_key = Config.OPENAI_API_KEY
+client = create_llm_client()
 
 def test_ai():
     try:
         print("Testing AI integration with your API key...")
         print(f"API Key: {Config.OPENAI_API_KEY[:20]}...")
         
-        response = openai.ChatCompletion.create(
+        response = client.chat.completions.create(
             model="gpt-3.5-turbo",
             messages=[
                 {"role": "system", "content": "You are a supportive AI coach."},
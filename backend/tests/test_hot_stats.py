@@ -0,0 +1,104 @@
+"""
+HotStatsSegment records: the seqlock, slot takeover and recovery from a
+writer that died mid-update
+"""
+import time
+
+import pytest
+
+from hot_stats import _RECORD, _SEQ, HotRecord, HotStatsSegment
+
+
+@pytest.fixture
+def segment(tmp_path):
+    return HotStatsSegment(str(tmp_path / 'hot_stats'), slots=8)
+
+
+def record(points=10, streak=1):
+    return HotRecord(points, 1, 2, streak, 19800, 1, 0, 2)
+
+
+def fields(hot_record):
+    return [getattr(hot_record, name) for name in HotRecord.__slots__]
+
+
+def sequence(segment, user_id):
+    return _SEQ.unpack_from(segment._map, segment.slot(user_id) * _RECORD.size)[0]
+
+
+def colliding_users(segment):
+    """Two user ids that map to the same slot"""
+    slots = {}
+    for i in range(1000):
+        user_id = f'user_{i}'
+        slot = segment.slot(user_id)
+        if slot in slots:
+            return slots[slot], user_id
+        slots[slot] = user_id
+    raise AssertionError('no collision found')
+
+
+def test_read_after_write(segment):
+    assert segment.read('user_1', max_age=60) is None
+
+    with segment.locked('user_1'):
+        segment.write('user_1', record(), time.time())
+    assert fields(segment.read('user_1', max_age=60)) == fields(record())
+    assert sequence(segment, 'user_1') % 2 == 0
+
+    with segment.locked('user_1'):
+        segment.write('user_1', record(points=25, streak=4), segment.loaded_at('user_1'))
+    assert fields(segment.read('user_1', max_age=60)) == fields(record(points=25, streak=4))
+
+
+def test_record_expires_after_max_age(segment):
+    with segment.locked('user_1'):
+        segment.write('user_1', record(), time.time() - 120)
+    assert segment.read('user_1', max_age=60) is None
+    assert segment.read('user_1', max_age=300) is not None
+
+
+def test_colliding_user_takes_the_slot_over(segment):
+    first, second = colliding_users(segment)
+    with segment.locked(first):
+        segment.write(first, record(points=10), time.time())
+    assert segment.read(second, max_age=60) is None
+
+    with segment.locked(second):
+        segment.write(second, record(points=99), time.time())
+    assert segment.read(first, max_age=60) is None
+    assert segment.read(second, max_age=60).total_points == 99
+
+
+def test_read_during_write_gives_up(segment):
+    with segment.locked('user_1'):
+        segment.write('user_1', record(), time.time())
+    offset = segment.slot('user_1') * _RECORD.size
+    # Odd sequence: a write is in progress
+    _SEQ.pack_into(segment._map, offset, sequence(segment, 'user_1') + 1)
+    retries = segment._retries
+    assert segment.read('user_1', max_age=60) is None
+    assert segment._retries > retries
+
+
+def test_write_recovers_from_a_writer_that_died_mid_update(segment):
+    with segment.locked('user_1'):
+        segment.write('user_1', record(), time.time())
+    offset = segment.slot('user_1') * _RECORD.size
+    before = sequence(segment, 'user_1')
+    # A writer bumped the sequence to odd and died before finishing
+    _SEQ.pack_into(segment._map, offset, before + 1)
+    assert segment.read('user_1', max_age=60) is None
+
+    with segment.locked('user_1'):
+        segment.write('user_1', record(points=42), time.time())
+    after = sequence(segment, 'user_1')
+    assert after % 2 == 0 and after > before + 1
+    assert segment.read('user_1', max_age=60).total_points == 42
+
+
+def test_segments_on_the_same_file_share_records(tmp_path, segment):
+    other = HotStatsSegment(str(tmp_path / 'hot_stats'), slots=8)
+    with segment.locked('user_1'):
+        segment.write('user_1', record(points=7), time.time())
+    assert other.read('user_1', max_age=60).total_points == 7
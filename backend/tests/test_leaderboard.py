@@ -0,0 +1,81 @@
+"""
+RankedSet against a sorted list, and the ranks Leaderboard derives from it
+"""
+import bisect
+import random
+
+import pytest
+
+from leaderboard import Leaderboard, RankedSet
+
+
+def check(ranked, reference):
+    assert len(ranked) == len(reference)
+    assert ranked.first(len(reference) + 1) == reference
+    for key in reference[:50]:
+        assert ranked.count_less(key) == bisect.bisect_left(reference, key)
+
+
+def test_ranked_set_matches_sorted_list():
+    rng = random.Random(7)
+    # Small expected size keeps the skip list short, so links span many nodes
+    ranked = RankedSet(expected_size=64)
+    reference = []
+    for _ in range(3000):
+        key = (rng.randrange(-200, 0), f'user_{rng.randrange(500)}')
+        position = bisect.bisect_left(reference, key)
+        if position < len(reference) and reference[position] == key:
+            ranked.remove(key)
+            del reference[position]
+        else:
+            ranked.insert(key)
+            reference.insert(position, key)
+        # Keys that are absent rank where they would be inserted
+        probe = (rng.randrange(-200, 0), f'user_{rng.randrange(500)}')
+        assert ranked.count_less(probe) == bisect.bisect_left(reference, probe)
+    check(ranked, reference)
+
+    for key in list(reference):
+        ranked.remove(key)
+        reference.remove(key)
+        if len(reference) % 97 == 0:
+            check(ranked, reference)
+    assert len(ranked) == 0
+    assert ranked.first(10) == []
+
+
+def test_first_returns_a_prefix():
+    ranked = RankedSet(expected_size=16)
+    for key in (5, 1, 4, 2, 3):
+        ranked.insert(key)
+    assert ranked.first(0) == []
+    assert ranked.first(3) == [1, 2, 3]
+    assert ranked.first(10) == [1, 2, 3, 4, 5]
+    assert ranked.count_less(0) == 0
+    assert ranked.count_less(6) == 5
+
+
+def test_remove_missing_key_raises():
+    ranked = RankedSet(expected_size=16)
+    ranked.insert(1)
+    with pytest.raises(KeyError):
+        ranked.remove(2)
+    assert ranked.first(10) == [1]
+
+
+def test_leaderboard_ranks_ties_together():
+    leaderboard = Leaderboard()
+    leaderboard.rebuild([
+        {'user_id': 'a', 'total_points': 30, 'streak': 1},
+        {'user_id': 'b', 'total_points': 50, 'streak': 2},
+        {'user_id': 'c', 'total_points': 30, 'streak': 3}
+    ])
+    assert [(entry['rank'], entry['user_id']) for entry in leaderboard.top('points')] == [(1, 'b'), (2, 'a'), (2, 'c')]
+    assert leaderboard.rank('points', 'c') == {'rank': 2, 'user_id': 'c', 'score': 30}
+
+    leaderboard.update({'user_id': 'c', 'total_points': 60, 'streak': 3})
+    assert leaderboard.rank('points', 'c')['rank'] == 1
+    assert leaderboard.rank('points', 'b')['rank'] == 2
+    assert leaderboard.rank('streak', 'c')['rank'] == 1
+    assert leaderboard.size('points') == 3
+    assert leaderboard.rank('points', 'missing') is None
@@ -0,0 +1,106 @@
+"""
+The RRULE subset recurring tasks are scheduled with
+"""
+from datetime import date
+
+import pytest
+
+from activity_calendar import day_from_number, day_number
+from recurrence import next_occurrence, occurs_on, parse_rule
+
+
+def dates(rule_text, start, end):
+    """Dates from start to end (inclusive) the rule, anchored at start, selects"""
+    rule = parse_rule(rule_text)
+    first, last = day_number(start), day_number(end)
+    return [day_from_number(day) for day in range(first, last + 1) if occurs_on(rule, first, day)]
+
+
+def test_parse_rule():
+    assert parse_rule(' freq=weekly;interval=2;byday=fr,mo ') == {
+        'freq': 'WEEKLY', 'interval': 2, 'by_day': [0, 4], 'by_month_day': [], 'until': None
+    }
+    assert parse_rule('FREQ=MONTHLY;BYMONTHDAY=15,1;UNTIL=20241231T000000Z')['by_month_day'] == [1, 15]
+    assert parse_rule('FREQ=DAILY;UNTIL=20240110')['until'] == day_number(date(2024, 1, 10))
+
+
+@pytest.mark.parametrize('text', [
+    '',
+    'FREQ=YEARLY',
+    'INTERVAL=2',
+    'FREQ=DAILY;INTERVAL=0',
+    'FREQ=DAILY;INTERVAL=x',
+    'FREQ=WEEKLY;BYDAY=XX',
+    'FREQ=MONTHLY;BYMONTHDAY=32',
+    'FREQ=MONTHLY;BYMONTHDAY=0',
+    'FREQ=DAILY;UNTIL=2024',
+    'FREQ=DAILY;COUNT=5',
+    'FREQ=DAILY;',
+    'FREQ'
+])
+def test_invalid_rules_are_rejected(text):
+    with pytest.raises(ValueError):
+        parse_rule(text)
+
+
+def test_weekly_interval_with_byday():
+    # 2024-01-01 is a Monday; every other week on Monday and Thursday
+    assert dates('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH', date(2024, 1, 1), date(2024, 1, 31)) == [
+        date(2024, 1, 1), date(2024, 1, 4),
+        date(2024, 1, 15), date(2024, 1, 18),
+        date(2024, 1, 29)
+    ]
+
+
+def test_weekly_interval_counts_calendar_weeks_from_start():
+    # Starting on a Wednesday, the Monday of the same week is before the
+    # start and the next Monday is in an off week
+    assert dates('FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,FR', date(2024, 1, 3), date(2024, 1, 22)) == [
+        date(2024, 1, 5), date(2024, 1, 15), date(2024, 1, 19)
+    ]
+
+
+def test_weekly_without_byday_uses_start_weekday():
+    assert dates('FREQ=WEEKLY', date(2024, 1, 3), date(2024, 1, 24)) == [
+        date(2024, 1, 3), date(2024, 1, 10), date(2024, 1, 17), date(2024, 1, 24)
+    ]
+
+
+def test_monthly_day_31_skips_short_months():
+    assert dates('FREQ=MONTHLY;BYMONTHDAY=31', date(2024, 1, 1), date(2024, 12, 31)) == [
+        date(2024, month, 31) for month in (1, 3, 5, 7, 8, 10, 12)
+    ]
+    # Anchored on the 31st without BYMONTHDAY behaves the same
+    assert dates('FREQ=MONTHLY', date(2024, 1, 31), date(2024, 5, 31)) == [
+        date(2024, 1, 31), date(2024, 3, 31), date(2024, 5, 31)
+    ]
+
+
+def test_daily_interval_and_until():
+    assert dates('FREQ=DAILY;INTERVAL=3;UNTIL=20240110', date(2024, 1, 1), date(2024, 1, 31)) == [
+        date(2024, 1, 1), date(2024, 1, 4), date(2024, 1, 7), date(2024, 1, 10)
+    ]
+
+
+def test_nothing_occurs_before_start():
+    rule = parse_rule('FREQ=DAILY')
+    start = day_number(date(2024, 1, 10))
+    assert not occurs_on(rule, start, start - 1)
+    assert occurs_on(rule, start, start)
+
+
+def test_next_occurrence():
+    rule = parse_rule('FREQ=MONTHLY;BYMONTHDAY=31')
+    start = day_number(date(2024, 1, 1))
+    assert day_from_number(next_occurrence(rule, start, day_number(date(2024, 1, 31)))) == date(2024, 3, 31)
+    # Before the start, the first occurrence on or after it
+    assert day_from_number(next_occurrence(parse_rule('FREQ=DAILY'), start, start - 10)) == date(2024, 1, 1)
+
+
+def test_next_occurrence_stops_at_until_and_horizon():
+    start = day_number(date(2024, 1, 1))
+    assert next_occurrence(parse_rule('FREQ=DAILY;UNTIL=20240105'), start, day_number(date(2024, 1, 5))) is None
+    rule = parse_rule('FREQ=MONTHLY;BYMONTHDAY=31')
+    after = day_number(date(2024, 1, 31))
+    assert next_occurrence(rule, start, after, horizon=30) is None
+    assert next_occurrence(rule, start, after, horizon=60) == after + (date(2024, 3, 31) - date(2024, 1, 31)).days
@@ -0,0 +1,96 @@
+"""
+Consistency of the write-through user_stats cache under concurrent
+completions from several worker processes and threads, on SQLite:
+
+    cd backend && python -m pytest tests
+"""
+import multiprocessing
+import threading
+from datetime import date
+
+import pytest
+
+from activity_calendar import day_number
+from repository import SQLiteRepository
+from stats_cache import CachedStatsRepository, VersionChannel
+
+USER_ID = 'user_1'
+PROCESSES = 4
+THREADS = 4
+COMPLETIONS = 25
+POINTS = 10
+
+
+def cached_repository(db_path, channel_path):
+    return CachedStatsRepository(SQLiteRepository(db_path), VersionChannel(channel_path))
+
+
+def complete_tasks(repository, count):
+    """What complete_task does to stats, with cached reads in between like the routes make"""
+    today = date.today()
+    for _ in range(count):
+        repository.ensure_stats(USER_ID)
+        repository.record_completion(USER_ID, POINTS, today, day_number(today))
+        repository.increment_streak(USER_ID)
+        repository.find_stats(USER_ID)
+
+
+def worker(db_path, channel_path, done, results):
+    repository = cached_repository(db_path, channel_path)
+    threads = [threading.Thread(target=complete_tasks, args=(repository, COMPLETIONS)) for _ in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Read back only once every process has finished writing
+    done.wait()
+    results.put(repository.find_stats(USER_ID))
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return str(tmp_path / 'stats.db'), str(tmp_path / 'stats.version')
+
+
+def test_concurrent_completions_keep_cache_consistent(paths):
+    db_path, channel_path = paths
+    parent = cached_repository(*paths)
+    # Warm the parent's copy so it has to be invalidated by the workers
+    assert parent.ensure_stats(USER_ID)['completed_tasks'] == 0
+
+    context = multiprocessing.get_context('fork')
+    done = context.Barrier(PROCESSES)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(db_path, channel_path, done, results))
+                 for _ in range(PROCESSES)]
+    for process in processes:
+        process.start()
+    cached = [results.get(timeout=120) for _ in processes]
+    for process in processes:
+        process.join(timeout=30)
+        assert process.exitcode == 0
+
+    completions = PROCESSES * THREADS * COMPLETIONS
+    stored = SQLiteRepository(db_path).find_stats(USER_ID)
+    assert stored['completed_tasks'] == completions
+    assert stored['total_points'] == completions * POINTS
+    assert stored['streak'] == completions
+
+    fields = ('completed_tasks', 'total_points', 'streak')
+    for stats in cached + [parent.find_stats(USER_ID)]:
+        assert {field: stats[field] for field in fields} == {field: stored[field] for field in fields}
+
+
+def test_write_in_another_process_invalidates_cached_copy(paths):
+    reader = cached_repository(*paths)
+    writer = cached_repository(*paths)
+    reader.ensure_stats(USER_ID)
+    reader.find_stats(USER_ID)
+
+    context = multiprocessing.get_context('fork')
+    process = context.Process(target=writer.set_streak, args=(USER_ID, 7))
+    process.start()
+    process.join(timeout=30)
+
+    assert reader.find_stats(USER_ID)['streak'] == 7
+    assert reader.stats()['invalidations'] == 1
@@ -0,0 +1,137 @@
+"""
+Round trips through the compact v2 task documents, and reading v1 ones
+"""
+import uuid
+from datetime import date, datetime
+
+from bson import Binary, ObjectId
+
+from activity_calendar import day_number
+from task_schema import SCHEMA_VERSION, decode_task, encode_fields, encode_task, task_key
+
+DAY = day_number(date(2024, 3, 5))
+
+
+def api_task(**fields):
+    task_id = str(uuid.uuid4())
+    task = {
+        '_id': task_id,
+        'task_id': task_id,
+        'user_id': 'user_1',
+        'title': 'Write report',
+        'description': '',
+        'priority': 'high',
+        'estimated_duration': 45,
+        'status': 'pending',
+        'created_at': datetime(2024, 3, 5, 9, 30),
+        'day': DAY,
+        'date': '2024-03-05',
+        'micro_steps': [],
+        'points_value': 10
+    }
+    task.update(fields)
+    return task
+
+
+def test_round_trip_with_empty_optional_fields():
+    task = api_task()
+    doc = encode_task(task)
+
+    assert doc['_id'] == task_key(task['task_id'])
+    assert isinstance(doc['_id'], Binary)
+    assert doc['v'] == SCHEMA_VERSION
+    assert doc['p'] == 2 and doc['s'] == 0
+    # Empty description and micro_steps, and the derived date, are not stored
+    assert 'd' not in doc and 'm' not in doc and 'date' not in doc
+
+    assert decode_task(doc) == task
+
+
+def test_round_trip_with_optional_fields_set():
+    task = api_task(
+        description='Quarterly numbers',
+        micro_steps=['Open the spreadsheet', 'Write the summary'],
+        status='completed',
+        completed_at=datetime(2024, 3, 5, 11, 0),
+        speculative_celebration={'celebration': 'Nice!', 'streak': 3, 'expires_at': datetime(2024, 3, 6)}
+    )
+    doc = encode_task(task)
+
+    assert doc['d'] == 'Quarterly numbers'
+    assert doc['m'] == task['micro_steps']
+    assert doc['s'] == 1
+    assert doc['ca'] == task['completed_at']
+    assert doc['sc'] == task['speculative_celebration']
+    assert decode_task(doc) == task
+
+
+def test_round_trip_of_recurring_instance():
+    template_id = str(uuid.uuid4())
+    task = api_task(template_id=template_id, micro_steps=['Stretch'])
+    doc = encode_task(task)
+
+    # Fields without a short key are stored under their own name
+    assert doc['template_id'] == template_id
+    assert decode_task(doc) == task
+
+
+def test_decoded_lists_are_not_shared():
+    first = decode_task(encode_task(api_task()))
+    first['micro_steps'].append('Changed')
+    assert decode_task(encode_task(api_task()))['micro_steps'] == []
+
+
+def test_decode_with_task_id_from_a_column():
+    task = api_task()
+    doc = encode_task(task)
+    del doc['_id']
+    assert decode_task(doc, task['task_id']) == task
+
+
+def test_v1_document_is_read_as_is_and_encodes_to_v2():
+    task_id = str(uuid.uuid4())
+    v1 = {
+        '_id': ObjectId(),
+        'task_id': task_id,
+        'user_id': 'user_1',
+        'title': 'Old task',
+        'description': 'From before v2',
+        'priority': 'low',
+        'estimated_duration': 30,
+        'status': 'completed',
+        'created_at': datetime(2023, 1, 2, 8, 0),
+        'date': '2023-01-02',
+        'micro_steps': [],
+        'points_value': 5
+    }
+    assert decode_task(v1) is v1
+
+    # Saved before day keys: the day comes from the date string
+    doc = encode_task(v1)
+    assert doc['_id'] == task_key(task_id)
+    assert doc['dy'] == day_number(date(2023, 1, 2))
+    assert doc['p'] == 0 and doc['s'] == 1
+
+    migrated = decode_task(doc)
+    assert migrated['task_id'] == task_id
+    assert migrated['day'] == day_number(date(2023, 1, 2))
+    assert migrated['date'] == '2023-01-02'
+    assert {name: migrated[name] for name in ('title', 'description', 'priority', 'status', 'points_value')} == {
+        'title': 'Old task', 'description': 'From before v2', 'priority': 'low', 'status': 'completed', 'points_value': 5
+    }
+
+
+def test_non_uuid_task_id_has_no_key():
+    assert task_key('not-a-uuid') is None
+    assert task_key(None) is None
+
+
+def test_encode_fields_unsets_empty_values():
+    updates, removals = encode_fields({
+        'status': 'completed',
+        'micro_steps': [],
+        'speculative_celebration': None,
+        'completed_at': datetime(2024, 3, 5, 12, 0)
+    })
+    assert updates == {'s': 1, 'ca': datetime(2024, 3, 5, 12, 0)}
+    assert removals == {'m': '', 'sc': ''}
@@ -0,0 +1,55 @@
+import threading
+import time
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+
+def resolve_timezone(name: str) -> ZoneInfo:
+    """ZoneInfo for an IANA name like 'America/New_York'; ValueError if unknown"""
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def local_today(zone: ZoneInfo) -> date:
+    return datetime.now(zone).date()
+
+
+def local_midnight_utc(day: date, zone: ZoneInfo) -> datetime:
+    """Start of a local day as a naive UTC datetime, for comparing with stored timestamps"""
+    midnight = datetime(day.year, day.month, day.day, tzinfo=zone)
+    return midnight.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class TimezoneCache:
+    """
+    Per-user ZoneInfo, read from storage at most once per ttl seconds per
+    worker. A changed timezone reaches other workers within the ttl.
+    """
+
+    def __init__(self, default: str, ttl: float = 60):
+        self.default = resolve_timezone(default)
+        self.ttl = ttl
+        self._zones: Dict[str, Tuple[ZoneInfo, float]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: str, loader: Callable[[str], Optional[str]]) -> ZoneInfo:
+        with self._lock:
+            cached = self._zones.get(user_id)
+        if cached and time.monotonic() - cached[1] < self.ttl:
+            return cached[0]
+
+        name = loader(user_id)
+        try:
+            zone = resolve_timezone(name) if name else self.default
+        except ValueError:
+            zone = self.default
+        with self._lock:
+            self._zones[user_id] = (zone, time.monotonic())
+        return zone
+
+    def forget(self, user_id: str) -> None:
+        with self._lock:
+            self._zones.pop(user_id, None)
@@ -0,0 +1,174 @@
+import gzip
+import uuid
+import zlib
+from datetime import datetime
+from typing import Dict, IO, Iterable, Iterator, List, Optional
+
+import orjson
+
+# One JSON object per line:
+#   {"type": "header", "format": 1, "user_id": ..., "exported_at": ...}
+#   {"type": "stats", "doc": {...user_stats, "activity_words": {word: bits}}}
+#   {"type": "template", "doc": {...}}    one per recurring task template
+#   {"type": "task", "doc": {...}}        one per task
+#   {"type": "activity", "doc": {...}}    one per activity
+# Datetimes are written as {"$date": iso}, as in the SQLite documents.
+FORMAT_VERSION = 1
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Documents imported as another user get ids derived from this, the target
+# user and their original id
+IMPORT_NAMESPACE = uuid.UUID('0cdfd55d-159d-426f-9ca1-94b29905ebe6')
+
+ID_FIELDS = {'template': ('template_id',), 'task': ('task_id', 'template_id'), 'activity': ('activity_id',)}
+
+
+def _default(value):
+    if isinstance(value, datetime):
+        return {'$date': value.isoformat(timespec='microseconds')}
+    return str(value)
+
+
+def _line(kind: str, doc: Dict) -> bytes:
+    return orjson.dumps({'type': kind, 'doc': doc}, default=_default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_APPEND_NEWLINE)
+
+
+def _revive(value):
+    """Turn {"$date": iso} back into datetimes, in place"""
+    if isinstance(value, dict):
+        if len(value) == 1 and '$date' in value:
+            return datetime.fromisoformat(value['$date'])
+        for key, item in value.items():
+            if isinstance(item, (dict, list)):
+                value[key] = _revive(item)
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            if isinstance(item, (dict, list)):
+                value[index] = _revive(item)
+    return value
+
+
+def _strip(doc: Dict) -> Dict:
+    doc.pop('_id', None)
+    return doc
+
+
+def export_user(repository, user_id: str, batch_size: int = 1000) -> Iterator[bytes]:
+    """
+    A user's stats, recurring task templates, tasks and activities as NDJSON, in chunks of up to
+    batch_size lines. Documents come from database cursors batch by batch,
+    so memory use does not grow with the user's history.
+    """
+    yield orjson.dumps({
+        'type': 'header',
+        'format': FORMAT_VERSION,
+        'user_id': user_id,
+        'exported_at': datetime.utcnow().isoformat()
+    }, option=orjson.OPT_APPEND_NEWLINE)
+
+    stats = repository.find_stats(user_id)
+    if stats is not None:
+        stats = _strip(dict(stats))
+        stats['timezone'] = repository.user_timezone(user_id)
+        stats['activity_words'] = {str(word): int(bits) for word, bits in repository.activity_words(user_id).items()}
+        yield _line('stats', stats)
+
+    for kind, documents in (('template', repository.find_templates(user_id)),
+                            ('task', repository.iter_tasks(user_id, batch_size)),
+                            ('activity', repository.iter_activities(user_id, batch_size))):
+        chunk = []
+        for doc in documents:
+            chunk.append(_line(kind, _strip(doc)))
+            if len(chunk) >= batch_size:
+                yield b''.join(chunk)
+                chunk = []
+        if chunk:
+            yield b''.join(chunk)
+
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a stream of chunks into one gzip member as it goes"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def open_lines(stream: IO[bytes], compressed: Optional[bool] = None) -> IO[bytes]:
+    """
+    Line-iterable view of an NDJSON byte stream, gunzipped on the fly if
+    compressed (sniffed from the gzip magic bytes when not given)
+    """
+    if compressed is None:
+        head = stream.peek(2)[:2] if hasattr(stream, 'peek') else b''
+        compressed = head == GZIP_MAGIC
+    return gzip.GzipFile(fileobj=stream, mode='rb') if compressed else stream
+
+
+def import_user(repository, lines: Iterable[bytes], batch_size: int = 1000,
+                user_id: Optional[str] = None) -> Dict[str, int]:
+    """
+    Load an export into the repository with batched inserts, optionally
+    under another user_id. Templates, tasks and activities that already
+    exist are skipped, so an interrupted import can simply be run again.
+    Stats replace the user's current stats.
+
+    Imported as another user, templates, tasks and activities get new ids
+    (the same ones on every run), so a copy can live next to the original.
+    """
+    counts = {'templates': 0, 'tasks': 0, 'activities': 0, 'skipped': 0, 'stats': 0}
+    batches: Dict[str, List[Dict]] = {'template': [], 'task': [], 'activity': []}
+    inserters = {
+        'template': repository.insert_templates,
+        'task': repository.insert_tasks,
+        'activity': repository.insert_activities
+    }
+    totals = {'template': 'templates', 'task': 'tasks', 'activity': 'activities'}
+
+    def flush(kind):
+        batch = batches[kind]
+        if batch:
+            inserted = inserters[kind](batch)
+            counts[totals[kind]] += inserted
+            counts['skipped'] += len(batch) - inserted
+            batches[kind] = []
+
+    rekey = False
+    for line in lines:
+        if not line.strip():
+            continue
+        entry = orjson.loads(line)
+        kind = entry['type']
+        if kind == 'header':
+            if entry.get('format') != FORMAT_VERSION:
+                raise ValueError(f"Unsupported export format: {entry.get('format')}")
+            rekey = user_id is not None and user_id != entry['user_id']
+            user_id = user_id or entry['user_id']
+            continue
+        if user_id is None:
+            raise ValueError('Export has no header line')
+
+        doc = _revive(entry['doc'])
+        doc['user_id'] = user_id
+        if kind == 'stats':
+            words = {int(word): bits for word, bits in doc.pop('activity_words', {}).items()}
+            repository.restore_stats(user_id, doc, words)
+            counts['stats'] += 1
+        elif kind in batches:
+            if rekey:
+                for field in ID_FIELDS[kind]:
+                    if doc.get(field):
+                        doc[field] = str(uuid.uuid5(IMPORT_NAMESPACE, f"{user_id}:{doc[field]}"))
+            batches[kind].append(doc)
+            if len(batches[kind]) >= batch_size:
+                flush(kind)
+        else:
+            raise ValueError(f"Unknown record type: {kind}")
+
+    for kind in batches:
+        flush(kind)
+    return counts
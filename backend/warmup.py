@@ -0,0 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict
+
+import openai
+
+
+class WarmupState:
+    """Tracks whether this worker has primed its storage pool and LLM sessions"""
+
+    def __init__(self):
+        self.storage_ready = False
+        self.llm_ready = False
+        self.errors = {}
+        self.duration_ms = None
+
+    @property
+    def ready(self) -> bool:
+        return self.storage_ready and self.llm_ready
+
+    def to_dict(self) -> Dict:
+        return {
+            'status': 'ready' if self.ready else 'warming',
+            'storage_ready': self.storage_ready,
+            'llm_ready': self.llm_ready,
+            'warmup_ms': self.duration_ms,
+            'errors': self.errors
+        }
+
+
+def _run_concurrently(fn, count: int, timeout: float) -> None:
+    """Run fn `count` times in parallel so each call holds its own connection"""
+    with ThreadPoolExecutor(max_workers=count) as pool:
+        futures = [pool.submit(fn) for _ in range(count)]
+        for future in futures:
+            future.result(timeout=timeout)
+
+
+def prime_storage(repository, connections: int, timeout: float) -> None:
+    """
+    Open `connections` pooled connections by pinging from parallel threads
+    (Mongo sockets, or per-thread SQLite handles)
+    """
+    _run_concurrently(repository.ping, max(connections, 1), timeout)
+
+
+def prime_llm(llm_client: openai.OpenAI, connections: int, timeout: float) -> None:
+    """
+    Establish keep-alive TLS connections to the LLM API.
+
+    Listing models costs no tokens. Any HTTP response, including an auth
+    error, means the connection is open and pooled; only transport errors
+    count as a failure.
+    """
+    def touch():
+        try:
+            llm_client.with_options(max_retries=0, timeout=timeout).models.list()
+        except openai.APIStatusError:
+            pass
+
+    if connections > 0:
+        _run_concurrently(touch, connections, timeout)
+
+
+def warm_up(state: WarmupState, repository, llm_client: openai.OpenAI, config) -> WarmupState:
+    """Prime both pools; the worker reports ready once both succeed"""
+    started = time.perf_counter()
+
+    try:
+        prime_storage(repository, config.MONGO_MIN_POOL_SIZE, config.WARMUP_TIMEOUT_SECONDS)
+        state.storage_ready = True
+    except Exception as e:
+        state.errors['storage'] = str(e)
+        print(f"Warm-up: storage not ready: {e}")
+
+    try:
+        prime_llm(llm_client, config.WARMUP_LLM_CONNECTIONS, config.WARMUP_TIMEOUT_SECONDS)
+        state.llm_ready = True
+    except Exception as e:
+        state.errors['llm'] = str(e)
+        print(f"Warm-up: LLM API not reachable: {e}")
+
+    state.duration_ms = round((time.perf_counter() - started) * 1000, 1)
+    return state
@@ -20,17 +20,24 @@ const Dashboard = ({ user }) => {
 
   useEffect(() => {
     loadDashboardData();
+
+    // Apply changes made elsewhere (other tabs, devices) in place
+    return TaskService.subscribeToEvents({
+      stats_updated: (update) => setStats(prev => ({ ...prev, ...update })),
+      task_created: (task) => setTasks(prev => (
+        prev.some(t => t.task_id === task.task_id) ? prev : [...prev, task].slice(0, 3)
+      )),
+      task_completed: ({ task_id }) => setTasks(prev => prev.filter(task => task.task_id !== task_id)),
+      resync: () => loadDashboardData(),
+    });
   }, []);
 
   const loadDashboardData = async () => {
     try {
-      const [statsData, tasksData] = await Promise.all([
-        TaskService.getUserStats(),
-        TaskService.getTasks(),
-      ]);
+      const dashboard = await TaskService.getDashboard(['tasks', 'stats']);
       
-      setStats(statsData);
-      setTasks(tasksData.slice(0, 3)); // Show only first 3 tasks
+      setStats(dashboard.stats);
+      setTasks(dashboard.tasks.slice(0, 3)); // Show only first 3 tasks
     } catch (error) {
       toast.error('Failed to load dashboard data');
     } finally {
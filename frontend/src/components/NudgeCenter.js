@@ -19,7 +19,11 @@ const NudgeCenter = ({ user }) => {
   const getNudge = async (selectedMood = mood) => {
     setLoading(true);
     try {
-      const response = await TaskService.getNudge(selectedMood);
+      // Show text as soon as the first tokens arrive instead of a spinner
+      const response = await TaskService.streamNudge(selectedMood, (text) => {
+        setCurrentNudge(text);
+        setLoading(false);
+      });
       setCurrentNudge(response.nudge);
       
       // Add to history
@@ -18,6 +18,11 @@ const Stats = ({ user }) => {
 
   useEffect(() => {
     loadStats();
+
+    return TaskService.subscribeToEvents({
+      stats_updated: (update) => setStats(prev => ({ ...prev, ...update })),
+      resync: () => loadStats(),
+    });
   }, []);
 
   const loadStats = async () => {
@@ -17,6 +17,19 @@ const TaskManager = ({ user }) => {
 
   useEffect(() => {
     loadTasks();
+
+    return TaskService.subscribeToEvents({
+      task_created: (task) => setTasks(prev => (
+        prev.some(t => t.task_id === task.task_id) ? prev : [task, ...prev]
+      )),
+      task_completed: ({ task_id, completed_at }) => setTasks(prev => prev.map(task =>
+        task.task_id === task_id ? { ...task, status: 'completed', completed_at } : task
+      )),
+      task_updated: ({ task_id, ...fields }) => setTasks(prev => prev.map(task =>
+        task.task_id === task_id ? { ...task, ...fields } : task
+      )),
+      resync: () => loadTasks(),
+    });
   }, []);
 
   const loadTasks = async () => {
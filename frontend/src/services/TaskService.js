@@ -48,6 +48,52 @@ class TaskService {
     }
   }
 
+  // Streams a nudge from /nudge/stream, calling onText with the text so far
+  // as it arrives. Resolves with the final payload ({ nudge, fallback } or
+  // { nudge, throttled }); a fallback nudge replaces any partial text.
+  async streamNudge(mood = 'neutral', onText = () => {}) {
+    if (typeof ReadableStream === 'undefined') {
+      return this.getNudge(mood);
+    }
+
+    const response = await fetch(`${API_BASE_URL}/nudge/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ mood }),
+    });
+    if (!response.ok) {
+      throw new Error('Failed to get nudge');
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let text = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) {
+        break;
+      }
+      buffer += decoder.decode(value, { stream: true });
+
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const block = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const eventName = block.match(/^event: (.*)$/m)?.[1];
+        const data = JSON.parse(block.match(/^data: (.*)$/m)?.[1] || '{}');
+        if (eventName === 'delta') {
+          text += data.text;
+          onText(text);
+        } else if (eventName === 'done') {
+          onText(data.nudge);
+          return data;
+        }
+      }
+    }
+    throw new Error('Nudge stream ended early');
+  }
+
   async getDailyDigest() {
     try {
       const response = await this.api.get('/daily-digest');
@@ -57,6 +103,18 @@ class TaskService {
     }
   }
 
+  // Tasks, stats and nudge in one request; `sections` limits what is returned
+  async getDashboard(sections = ['tasks', 'stats', 'nudge']) {
+    try {
+      const response = await this.api.get('/dashboard', {
+        params: { sections: sections.join(',') },
+      });
+      return response.data;
+    } catch (error) {
+      throw new Error(error.response?.data?.message || 'Failed to load dashboard');
+    }
+  }
+
   async getUserStats() {
     try {
       const response = await this.api.get('/user/stats');
@@ -66,6 +124,22 @@ class TaskService {
     }
   }
 
+  // Server-Sent Events for task and stats changes. `handlers` maps event
+  // names (task_created, task_updated, task_completed, stats_updated,
+  // streak_changed, celebration, resync) to callbacks. Returns an
+  // unsubscribe function.
+  subscribeToEvents(handlers) {
+    if (typeof EventSource === 'undefined') {
+      return () => {};
+    }
+
+    const source = new EventSource(`${API_BASE_URL}/events`);
+    Object.entries(handlers).forEach(([eventName, handler]) => {
+      source.addEventListener(eventName, (event) => handler(JSON.parse(event.data)));
+    });
+    return () => source.close();
+  }
+
   async healthCheck() {
     try {
       const response = await this.api.get('/health');